@@ -1,23 +1,76 @@
 import curses
+import threading
+from collections import deque
 import requests
+from offline import OfflineStore, OutboxFlusher
 
 API_URL = "http://localhost:5000"
+PREFETCH_PAGES = 2  # 当前页前后各预取的页数
 
-def get_order_details(order_id):
-    response = requests.get(f"{API_URL}/order/{order_id}")
+def get_order_details(order_id, session=requests):
+    response = session.get(f"{API_URL}/order/{order_id}", timeout=10)
     if response.status_code == 200:
         return response.json()
     else:
         return {"name": f"Order {order_id}", "completed": False}
 
+class OrderPager:
+    """按页懒加载订单详情: 后台线程优先拉取当前页,再拉取前后预取窗口内的订单"""
+    def __init__(self, path, items_per_page, store):
+        self.path = path
+        self.store = store
+        self.items_per_page = items_per_page
+        self.details = {}
+        self.wanted = deque()
+        self.changed = threading.Event()  # 有新数据到达,界面需要重绘
+        self._cond = threading.Condition()
+        self._session = requests.Session()
+        threading.Thread(target=self._worker, daemon=True).start()
 
-def view_tasks_curses(stdscr, tasks):
+    @property
+    def page_count(self):
+        return max(len(self.path) - 1, 0) // self.items_per_page + 1  # 路线为空时仍显示一页
+
+    def page_ids(self, page):
+        start = page * self.items_per_page
+        return self.path[start:start + self.items_per_page]
+
+    def request_page(self, page):
+        """把当前页放到队首,预取窗口依次排在后面"""
+        pages = [page] + [p for offset in range(1, PREFETCH_PAGES + 1) for p in (page + offset, page - offset)]
+        ids = [order_id for p in pages if 0 <= p < self.page_count for order_id in self.page_ids(p)
+               if order_id not in self.details]
+        with self._cond:
+            self.wanted = deque(ids)
+            self._cond.notify()
+
+    def get(self, order_id):
+        return self.details.get(order_id)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self.wanted:
+                    self._cond.wait()
+                order_id = self.wanted.popleft()
+            if order_id in self.details:
+                continue
+            try:
+                details = get_order_details(order_id, self._session)
+                if 'history' in details:
+                    self.store.put('order', order_id, details)
+            except requests.RequestException:
+                # 离线时使用本地缓存
+                details = self.store.get('order', order_id) or {"order_id": order_id, "status": "加载失败"}
+            details.setdefault("order_id", order_id)
+            details['status'] = self.store.pending_status('order', order_id) or details.get('status')
+            self.details[order_id] = details
+            self.changed.set()
+
+def view_tasks_curses(stdscr, tasks, store=None):
     # 关闭光标显示
     curses.curs_set(0)
     path = tasks['path']
-    
-    # 获取订单详细信息
-    orders = [get_order_details(order_id) for order_id in path]
 
     # 初始化颜色对
     curses.start_color()
@@ -28,33 +81,50 @@ def view_tasks_curses(stdscr, tasks):
     current_page = 0
     items_per_page = 10
 
+    # 状态修改写入本地队列,由后台线程提交,按键不等待网络
+    store = store or OfflineStore()
+    flusher = OutboxFlusher(store, API_URL).start()
+
+    # 订单详情按页在后台加载,先画出页面框架
+    pager = OrderPager(path, items_per_page, store)
+    pager.request_page(current_page)
+    stdscr.timeout(100)  # getch 最多等待 100ms,以便显示后台加载完成的订单
+
     # 设置窗口大小
     height, width = stdscr.getmaxyx()
     window_height = min(height, 50)  # 设置窗口高度为50，或终端高度
     window_width = min(width, 100)  # 设置窗口宽度为100，或终端宽度
+    drawn = {}  # 行号 -> 已绘制的 (文本, 属性),只重绘发生变化的行
+
+    def draw_line(stdscr, y, text, attr=0):
+        if drawn.get(y) == (text, attr):
+            return
+        stdscr.move(y, 0)
+        stdscr.clrtoeol()
+        stdscr.addstr(y, 0, text[:window_width - 1], attr)
+        drawn[y] = (text, attr)
+
     def draw_menu(stdscr, current_row, current_page):
-        stdscr.clear()
-        start_idx = current_page * items_per_page
-        end_idx = start_idx + items_per_page
-        max_name_length = max(len(str(item["order_id"])) for item in orders) + 10  # 预留空间
-        for idx, item in enumerate(orders[start_idx:end_idx]):
-            x = 0
+        for idx in range(items_per_page):
             y = idx + 4  # 向下移动四行
-            display_text = f"订单ID: {item['order_id']}"
-            if item["status"] == "completed":
+            ids = pager.page_ids(current_page)
+            if idx >= len(ids):
+                draw_line(stdscr, y, "")
+                continue
+            item = pager.get(ids[idx])
+            display_text = f"订单ID: {ids[idx]}"
+            if item is None:
+                display_text += " (加载中...)"
+            elif item.get("status") == "completed":
                 display_text = "(已完成) " + display_text
-            if idx == current_row:
-                stdscr.attron(curses.color_pair(1))
-                stdscr.addstr(y, x, display_text)
-                stdscr.attroff(curses.color_pair(1))
-            else:
-                stdscr.addstr(y, x, display_text)
+            draw_line(stdscr, y, display_text, curses.color_pair(1) if idx == current_row else 0)
         # 显示页号
-        stdscr.addstr(items_per_page + 5, 0, f"页号: {current_page + 1}/{(len(orders) - 1) // items_per_page + 1}")
+        draw_line(stdscr, items_per_page + 5, f"页号: {current_page + 1}/{pager.page_count}  (按 'q' 退出)")
         stdscr.refresh()
 
     def draw_item_detail(stdscr, item):
         stdscr.clear()
+        drawn.clear()
         stdscr.addstr(2, 0, f"订单ID: {item['order_id']}")
         stdscr.addstr(3, 0, f"包裹ID: {item['package_id']}")
         stdscr.addstr(4, 0, f"优先级: {item['priority']}")
@@ -64,35 +134,59 @@ def view_tasks_curses(stdscr, tasks):
         stdscr.addstr(8, 0, f"收件地址: {item['receiver_address']}")
         stdscr.addstr(9, 0, f"状态: {item['status']}")
         stdscr.addstr(10, 0, "历史记录:")
+        idx = 10
         for idx, history in enumerate(item['history'], start=11):
             stdscr.addstr(idx, 0, f"  - {history[0]}: {history[1]}")
         stdscr.addstr(idx + 1, 0, "按 'c' 标记为已完成")
         stdscr.addstr(idx + 2, 0, "按 'b' 返回")
         stdscr.refresh()
 
-    while True:
-        draw_menu(stdscr, current_row, current_page)
-        key = stdscr.getch()
-
-        if key == curses.KEY_UP and current_row > 0:
-            current_row -= 1
-        elif key == curses.KEY_DOWN and current_row < items_per_page - 1 and current_row < len(orders) - 1:
-            current_row += 1
-        elif key == curses.KEY_LEFT and current_page > 0:
-            current_page -= 1
-            current_row = 0
-        elif key == curses.KEY_RIGHT and (current_page + 1) * items_per_page < len(orders):
-            current_page += 1
-            current_row = 0
-        elif key == curses.KEY_ENTER or key in [10, 13]:
-            while True:
-                draw_item_detail(stdscr, orders[current_page * items_per_page + current_row])
-                key = stdscr.getch()
-                if key == ord('c'):
-                    orders[current_page * items_per_page + current_row]["status"] = "completed"
-                    draw_item_detail(stdscr, orders[current_page * items_per_page + current_row])  # 重新绘制详细信息页面
-                    # 更新订单状态
-                    response = requests.put(f"{API_URL}/order/{orders[current_page * items_per_page + current_row]["order_id"]}", json={"status": "completed"})
-                elif key == ord('b'):
-                    break
-            draw_menu(stdscr, current_row, current_page)  # 返回主菜单时重新绘制
\ No newline at end of file
+    stdscr.clear()
+    try:
+        while True:
+            pager.changed.clear()
+            draw_menu(stdscr, current_row, current_page)
+            key = stdscr.getch()
+            while key == -1 and not pager.changed.is_set():
+                key = stdscr.getch()  # 超时且后台没有新数据时不重绘
+            if key == -1:
+                continue
+
+            page_size = len(pager.page_ids(current_page))
+            if key == curses.KEY_UP and current_row > 0:
+                current_row -= 1
+            elif key == curses.KEY_DOWN and current_row < page_size - 1:
+                current_row += 1
+            elif key == curses.KEY_LEFT and current_page > 0:
+                current_page -= 1
+                current_row = 0
+                pager.request_page(current_page)
+            elif key == curses.KEY_RIGHT and current_page + 1 < pager.page_count:
+                current_page += 1
+                current_row = 0
+                pager.request_page(current_page)
+            elif key == ord('q'):
+                break
+            elif key == curses.KEY_ENTER or key in [10, 13]:
+                if current_row >= page_size:
+                    continue  # 路线为空,没有可选的订单
+                order_id = pager.page_ids(current_page)[current_row]
+                item = pager.get(order_id)
+                if item is None or 'history' not in item:
+                    continue  # 详情尚未加载完成
+                stdscr.timeout(-1)
+                while True:
+                    draw_item_detail(stdscr, item)
+                    key = stdscr.getch()
+                    if key == ord('c'):
+                        item["status"] = "completed"
+                        draw_item_detail(stdscr, item)  # 重新绘制详细信息页面
+                        # 更新订单状态: 写入本地队列后立即返回,由后台线程提交
+                        store.enqueue('order', order_id, "completed")
+                        flusher.poke()
+                    elif key == ord('b'):
+                        break
+                stdscr.timeout(100)
+                stdscr.clear()  # 返回主菜单时重新绘制
+    finally:
+        flusher.stop()
@@ -0,0 +1,188 @@
+# 配送效率的时间分桶分析: 每追加一条 history 就增量更新对应的小时/天桶,查询只读桶
+import threading
+import itertools
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from stats import status_value, to_datetime
+
+# 延迟直方图边界(秒): 1分钟起按2倍递增,约覆盖到半年,超出的落入最后一个溢出桶
+LATENCY_BOUNDS = [60 * 2 ** i for i in range(18)]
+TERMINAL_DELIVERY_STATES = ('delivered', 'received')
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BOUNDS) + 1)
+        self.total = 0
+
+    def add(self, seconds):
+        self.counts[bisect_left(LATENCY_BOUNDS, seconds)] += 1
+        self.total += 1
+
+    def percentile(self, p):
+        """返回第 p 百分位所在区间的上界(秒),精度为一个直方图区间"""
+        if not self.total:
+            return None
+        rank = p / 100 * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BOUNDS[i] if i < len(LATENCY_BOUNDS) else None
+        return None
+
+class Bucket:
+    def __init__(self, start):
+        self.start = start
+        self.transitions = Counter()        # (类型, 状态) -> 次数
+        self.delivered_by_courier = Counter()
+        self.latency = LatencyHistogram()   # 派送(创建配送任务)到送达的耗时
+        self.backlog_last = None            # 桶内最后一次变化后的未完成配送任务数
+        self.backlog_max = None
+
+    def to_dict(self):
+        return {
+            'start': self.start.isoformat(),
+            'transitions': {f'{kind}:{status}': count for (kind, status), count in self.transitions.items()},
+            'delivered': self.latency.total,
+            'delivered_by_courier': dict(self.delivered_by_courier),
+            'latency_seconds': {
+                'p50': self.latency.percentile(50),
+                'p90': self.latency.percentile(90),
+                'p99': self.latency.percentile(99)
+            },
+            'backlog': self.backlog_last,
+            'backlog_max': self.backlog_max
+        }
+
+class AnalyticsEngine:
+    # 粒度 -> (桶宽度, 保留桶数)
+    GRANULARITIES = {
+        'hour': (timedelta(hours=1), 48),
+        'day': (timedelta(days=1), 90)
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = {granularity: OrderedDict() for granularity in self.GRANULARITIES}
+        self.backlog = 0
+
+    @staticmethod
+    def _floor(at, granularity):
+        if granularity == 'hour':
+            return at.replace(minute=0, second=0, microsecond=0)
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _buckets_for(self, at):
+        for granularity, (width, keep) in self.GRANULARITIES.items():
+            buckets = self.buckets[granularity]
+            start = self._floor(at, granularity)
+            bucket = buckets.get(start)
+            if bucket is None:
+                if start < datetime.now() - width * keep:
+                    continue  # 超出保留期
+                bucket = buckets[start] = Bucket(start)
+                if len(buckets) > 1 and next(reversed(buckets)) != start:
+                    # 乱序到达(重建时)的桶需要重新排序
+                    self.buckets[granularity] = buckets = OrderedDict(sorted(buckets.items()))
+                while len(buckets) > keep:
+                    buckets.popitem(last=False)
+            yield bucket
+
+    def record(self, kind, record, old_status, new_status, at):
+        """kind 为 'order' 或 'delivery';old_status 为 None 表示新建"""
+        old_status, new_status, at = status_value(old_status), status_value(new_status), to_datetime(at)
+        with self._lock:
+            latency = None
+            if kind == 'delivery':
+                was_open = old_status is not None and old_status not in TERMINAL_DELIVERY_STATES
+                is_open = new_status not in TERMINAL_DELIVERY_STATES
+                self.backlog += int(is_open) - int(was_open)
+                if new_status == 'delivered' and old_status != 'delivered' and record.get('history'):
+                    latency = (at - to_datetime(record['history'][0][1])).total_seconds()
+            for bucket in self._buckets_for(at):
+                bucket.transitions[(kind, new_status)] += 1
+                if latency is not None:
+                    bucket.latency.add(latency)
+                    bucket.delivered_by_courier[record.get('courier_name')] += 1
+                if kind == 'delivery':
+                    bucket.backlog_last = self.backlog
+                    bucket.backlog_max = max(bucket.backlog_max or 0, self.backlog)
+
+    def export_state(self, kind):
+        """随 kind 对应集合的快照保存的分桶(调用方持有该集合读锁),只含该类记录的状态变化;
+        配送任务另外保存送达延迟直方图、各快递员送达数和未完成数"""
+        with self._lock:
+            state = {'buckets': {granularity: [self._export_bucket(bucket, kind) for bucket in buckets.values()]
+                                 for granularity, buckets in self.buckets.items()}}
+            if kind == 'delivery':
+                state['backlog'] = self.backlog
+            return state
+
+    @staticmethod
+    def _export_bucket(bucket, kind):
+        exported = {'start': bucket.start.isoformat(),
+                    'transitions': [[status, count] for (k, status), count in bucket.transitions.items() if k == kind]}
+        if kind == 'delivery':
+            exported.update({
+                'latency': bucket.latency.counts,
+                'delivered_by_courier': [[courier, count] for courier, count in bucket.delivered_by_courier.items()],
+                'backlog_last': bucket.backlog_last,
+                'backlog_max': bucket.backlog_max
+            })
+        return exported
+
+    def _restore(self, kind, state):
+        """把 export_state 保存的分桶合并进来(调用方持有 self._lock)"""
+        for granularity, exported in state['buckets'].items():
+            width, keep = self.GRANULARITIES[granularity]
+            buckets = self.buckets[granularity]
+            for entry in exported:
+                start = datetime.fromisoformat(entry['start'])
+                if start < datetime.now() - width * keep:
+                    continue
+                bucket = buckets.get(start)
+                if bucket is None:
+                    bucket = buckets[start] = Bucket(start)
+                bucket.transitions.update({(kind, status): count for status, count in entry['transitions']})
+                if kind == 'delivery':
+                    bucket.latency.counts = list(entry['latency'])
+                    bucket.latency.total = sum(entry['latency'])
+                    bucket.delivered_by_courier.update(dict(map(tuple, entry['delivered_by_courier'])))
+                    bucket.backlog_last, bucket.backlog_max = entry['backlog_last'], entry['backlog_max']
+            self.buckets[granularity] = OrderedDict(sorted(buckets.items())[-keep:])
+        if kind == 'delivery':
+            self.backlog = state['backlog']
+
+    def rebuild(self, orders, deliveries, saved=None, archived=None):
+        """启动时重建一次,之后只做增量更新:saved 中有某类记录快照保存的分桶({'order'/'delivery': 状态})时直接恢复,
+        其余类型按时间顺序回放已有 history;archived({'order'/'delivery': 记录})为已归档的记录,
+        天粒度的桶比归档期限保留得更久,需要一并回放"""
+        saved, archived = saved or {}, archived or {}
+        with self._lock:
+            self.buckets = {granularity: OrderedDict() for granularity in self.GRANULARITIES}
+            self.backlog = 0
+            for kind, state in saved.items():
+                if state is not None:
+                    self._restore(kind, state)
+        events = []
+        for kind, collection in (('order', orders), ('delivery', deliveries)):
+            if saved.get(kind) is not None:
+                continue
+            for record in itertools.chain(collection.values(), archived.get(kind, ())):
+                previous = None
+                for status, at in record.get('history', []):
+                    events.append((to_datetime(at), kind, record, previous, status))
+                    previous = status
+        events.sort(key=lambda event: event[0])
+        for at, kind, record, previous, status in events:
+            self.record(kind, record, previous, status, at)
+
+    def query(self, granularity='hour', since=None, until=None):
+        """since / until 带时区时换算为本地时间(桶的起点是本地的无时区时间)"""
+        if granularity not in self.GRANULARITIES:
+            raise ValueError(f'未知的粒度: {granularity}')
+        since, until = (at.astimezone().replace(tzinfo=None) if at is not None and at.tzinfo else at for at in (since, until))
+        with self._lock:
+            return [bucket.to_dict() for start, bucket in self.buckets[granularity].items()
+                    if (since is None or start >= self._floor(since, granularity)) and (until is None or start <= until)]
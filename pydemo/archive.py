@@ -0,0 +1,80 @@
+# 冷数据归档: 只追加写入的归档文件,每行 "<JSON 编码的ID>\t<记录 JSON>"
+# 打开时只切分每行的 ID 建立偏移索引,不解析记录本身
+import os
+import json
+import threading
+from checkpoint import json_default
+try:
+    import fcntl
+except ImportError:  # Windows: 只有单进程部署(多进程模式依赖 gunicorn),进程内的 _lock 已足够
+    fcntl = None
+
+class Archive:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._index = {}  # ID -> (偏移, 长度),同一ID多次归档时以最后一次为准
+        self._indexed_size = 0
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def _refresh(self):
+        """增量索引文件中新增的行(多进程部署时其他进程也会追加)"""
+        if not os.path.exists(self.file_path) or os.path.getsize(self.file_path) <= self._indexed_size:
+            return
+        with self._lock:
+            offset = self._indexed_size
+            with open(self.file_path, 'rb') as file:
+                file.seek(offset)
+                for line in file:
+                    if not line.endswith(b'\n'):  # 末尾不完整的行(正在写入或写入时崩溃)留到下次
+                        break
+                    key, _, _ = line.partition(b'\t')
+                    self._index[json.loads(key)] = (offset, len(line))
+                    offset += len(line)
+            self._indexed_size = offset
+
+    def append(self, records):
+        """records: [(ID, 记录)],写入并 fsync 后才更新索引,调用方此后才能从内存中删除记录"""
+        lines = [(record_id, (json.dumps(record_id) + '\t' + json.dumps(record, ensure_ascii=False, default=json_default) + '\n').encode('utf-8'))
+                 for record_id, record in records]
+        with self._lock:
+            with open(self.file_path, 'ab') as file:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_EX)  # 多个进程同时归档时整批写入,行不会交错
+                file.write(b''.join(line for _, line in lines))
+                file.flush()
+                os.fsync(file.fileno())
+        self._refresh()
+        return len(lines)
+
+    def get(self, record_id):
+        if record_id not in self._index:
+            self._refresh()
+        location = self._index.get(record_id)
+        if location is None:
+            return None
+        offset, length = location
+        with open(self.file_path, 'rb') as file:
+            file.seek(offset)
+            line = file.read(length)
+        return json.loads(line.partition(b'\t')[2])
+
+    def __contains__(self, record_id):
+        if record_id not in self._index:
+            self._refresh()
+        return record_id in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def values(self):
+        """按归档顺序产出每个ID最后一次归档的记录"""
+        if not os.path.exists(self.file_path):
+            return
+        offset = 0
+        with open(self.file_path, 'rb') as file:
+            for line in file:
+                key, _, record = line.partition(b'\t')
+                if line.endswith(b'\n') and self._index.get(json.loads(key), (None,))[0] == offset:
+                    yield json.loads(record)
+                offset += len(line)
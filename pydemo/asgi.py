@@ -0,0 +1,273 @@
+# asyncio 部署入口: uvicorn asgi:app
+#
+# 与 main.py 提供相同的路由。热点路由在事件循环中原生处理:
+#   - 读写锁以非阻塞方式轮询获取,等待锁时不占用线程
+#   - 路线计算(GET_task_path)放到进程池执行,不阻塞事件循环也不受 GIL 限制
+#   - SSE 订阅与 NDJSON 流式返回直接以协程推送,空闲连接只占一个协程
+# 其余路由通过线程池调用 Flask 的 WSGI 应用,行为与 main.py 完全一致。
+import os
+import io
+import sys
+import json
+import asyncio
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import parse_qs
+# 并行度由 ROUTING_PROCESSES 个求解进程提供,求解进程内不再创建叶子进程池(两级进程池会超额占用 CPU)
+os.environ['LEAF_WORKERS'] = '1'
+import main
+from events import sse_stream_async
+from profiling import timed_solve
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 5
+ROUTING_PROCESSES = int(os.environ.get('ROUTING_PROCESSES', os.cpu_count() or 1))
+WSGI_THREADS = int(os.environ.get('WSGI_THREADS', 32))
+
+thread_pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+process_pool = None
+
+def get_process_pool():
+    global process_pool
+    if process_pool is None:
+        process_pool = ProcessPoolExecutor(max_workers=ROUTING_PROCESSES)
+    return process_pool
+
+def solve_route(coordinates, options, profile=False):
+    """在路线计算进程中执行,重量级依赖只在子进程里导入一次(距离矩阵缓存也按进程保存);
+    返回 (结果, 分阶段耗时, 折叠栈或 None),采样也在子进程中进行"""
+    from test2 import GET_task_path
+    return timed_solve(GET_task_path, coordinates, options, profile)
+
+async def acquire_async(lock, timeout=LOCK_TIMEOUT):
+    """以非阻塞方式轮询获取锁,等待期间让出事件循环"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = 0.001
+    while not lock.acquire(blocking=False):
+        if loop.time() >= deadline:
+            return False
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.05)
+    return True
+
+# 响应工具
+async def send_json(send, body, status=200):
+    payload = json.dumps(body, ensure_ascii=False, default=str).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]})
+    await send({'type': 'http.response.body', 'body': payload})
+
+async def send_stream(send, chunks, content_type, extra_headers=()):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', content_type), *extra_headers]})
+    async for chunk in chunks:
+        await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+def query_params(scope):
+    return {key: values[-1] for key, values in parse_qs(scope['query_string'].decode()).items()}
+
+def header(scope, name):
+    name = name.lower().encode()
+    return next((value.decode() for key, value in scope['headers'] if key == name), None)
+
+# 原生异步路由
+async def assign_delivery(scope, receive, send, username):
+    today = datetime.now().date()
+    cached = main.cached_assignment(username, today)
+    if cached:
+        return await send_json(send, cached, 201)
+    profile = query_params(scope).get('profile', '').lower() in ('1', 'true', 'yes')
+    # 与 main.assign_delivery 共用 route_flight,同一快递员的并发请求共享一次计算
+    (body, code), shared = await main.route_flight.do_async((username, today.isoformat()),
+                                                            lambda: plan_route(username, today, profile))
+    await send_json(send, {**body, 'coalesced': True} if shared else body, code)
+
+async def plan_route(username, today, profile):
+    """main.plan_route 的协程版本: 路线计算在进程池中执行"""
+    cached = main.cached_assignment(username, today)
+    if cached:
+        return cached, 201
+    lock = main.orders_lock.gen_rlock()
+    if not await acquire_async(lock):
+        return {'success': False, 'message': '获取读锁超时'}, 500
+    try:
+        today_orders = main.assignable_orders()
+    finally:
+        lock.release()
+    coordinates = [order['receiver_address'] for order in today_orders]
+    options = main.route_options(today_orders, datetime.now())
+    loop = asyncio.get_running_loop()
+    result, timings, folded = await loop.run_in_executor(get_process_pool(), solve_route, coordinates, options, profile)
+    # 求解期间订单可能被取消或分配,在线程池中获取 orders_lock 写锁重新校验后再创建配送任务
+    body, code = await loop.run_in_executor(thread_pool, main.commit_revalidated_assignment, username, today, today_orders, result)
+    if code != 201:
+        return body, code
+    report = await loop.run_in_executor(thread_pool, main.route_report, username, len(coordinates), timings, folded)
+    return {**body, **report}, 201
+
+async def orders_by_receiver(scope, receive, send, receiver_name):
+    params = query_params(scope)
+    try:
+        cursor = int(params.get('cursor', 0))
+        limit = int(params.get('limit', main.ORDERS_PAGE_SIZE))
+    except ValueError:
+        return await send_json(send, {'success': False, 'message': '无效的分页参数'}, 400)
+    if limit <= 0:
+        return await send_json(send, {'success': False, 'message': '无效的分页参数'}, 400)
+    limit = min(limit, main.ORDERS_PAGE_MAX)
+
+    if params.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return await send_stream(send, stream_receiver_orders(receiver_name, cursor, limit), b'application/x-ndjson')
+
+    lock = main.orders_lock.gen_rlock()
+    if not await acquire_async(lock):
+        return await send_json(send, {'success': False, 'message': '获取读锁超时'}, 500)
+    try:
+        receiver_orders, next_cursor = main.page_receiver_orders(receiver_name, cursor, limit)
+    finally:
+        lock.release()
+    if receiver_orders or cursor:
+        return await send_json(send, {'success': True, 'orders': receiver_orders, 'next_cursor': next_cursor})
+    await send_json(send, {'success': False, 'message': '未找到订单'}, 404)
+
+async def stream_receiver_orders(receiver_name, cursor, chunk_size):
+    """main.stream_receiver_orders 的协程版本,每批之间释放读锁"""
+    while True:
+        lock = main.orders_lock.gen_rlock()
+        if not await acquire_async(lock):
+            yield json.dumps({'success': False, 'message': '获取读锁超时', 'next_cursor': cursor}, ensure_ascii=False) + '\n'
+            return
+        try:
+            chunk, next_cursor = main.page_receiver_orders(receiver_name, cursor, chunk_size)
+            chunk = [{**order, 'history': list(order['history'])} for order in chunk]
+        finally:
+            lock.release()
+        yield ''.join(json.dumps(order, ensure_ascii=False, default=str) + '\n' for order in chunk)
+        if next_cursor is None:
+            return
+        cursor = next_cursor
+
+async def stream_events(scope, receive, send, username):
+    if main.STATE_BACKEND == 'sqlite':
+        return await send_json(send, {'success': False, 'message': '多进程部署下不可用,请使用单进程模式'}, 503)
+    last_event_id = header(scope, 'Last-Event-ID')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    events = sse_stream_async(main.event_bus, username, last_event_id)
+    sender = asyncio.ensure_future(send_stream(send, events, b'text/event-stream',
+                                               [(b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]))
+    # 客户端断开时取消推送协程,生成器的 finally 中取消订阅
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    sender.cancel()
+    try:
+        await sender
+    except (asyncio.CancelledError, OSError):
+        pass
+
+ROUTES = [
+    ('POST', '/delivery/assign/', assign_delivery),
+    ('GET', '/orders/receiver/', orders_by_receiver),
+    ('GET', '/events/', stream_events),
+]
+
+def match_route(method, path):
+    for route_method, prefix, handler in ROUTES:
+        if method == route_method and path.startswith(prefix) and '/' not in path[len(prefix):] and path[len(prefix):]:
+            return handler, path[len(prefix):]
+    return None, None
+
+# 其余路由: 在线程池中运行 Flask 的 WSGI 应用
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return bytes(body)
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope['headers']:
+        key = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[key] = value
+        else:
+            environ['HTTP_' + key] = f"{environ['HTTP_' + key]},{value}" if 'HTTP_' + key in environ else value
+    return environ
+
+async def call_wsgi(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    environ = wsgi_environ(scope, await read_body(receive))
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    def next_chunk(iterator):
+        return next(iterator, None)
+
+    result = await loop.run_in_executor(thread_pool, main.app.wsgi_app, environ, start_response)
+    try:
+        iterator = iter(result)
+        # 逐块在线程池中取出响应体,流式响应不会阻塞事件循环
+        chunk = await loop.run_in_executor(thread_pool, next_chunk, iterator)
+        await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+        while chunk is not None:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await loop.run_in_executor(thread_pool, next_chunk, iterator)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(thread_pool, result.close)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            main.init_state()
+            main.start_background_tasks()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if process_pool is not None:
+                process_pool.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    handler, argument = match_route(scope['method'], scope['path'])
+    if handler is None:
+        return await call_wsgi(scope, receive, send)
+    await handler(scope, receive, send, argument)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
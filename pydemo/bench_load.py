@@ -0,0 +1,219 @@
+# 混合负载压测: 多个并发客户端按比例调用 注册/登录/创建订单/修改状态/查询订单/分配任务,
+# 输出各接口的吞吐量、p50/p95/p99 延迟和锁超时比例。
+# 不指定 --url 时在进程内通过 Flask test client 运行(临时目录、不落盘),可用于 CI。
+import os
+import sys
+import json
+import time
+import random
+import atexit
+import tempfile
+import contextlib
+import threading
+from collections import defaultdict
+import click
+
+PYDEMO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = 'register=1,login=2,create_order=3,update_status=2,get_order=6,assign=0.1'
+
+class HttpTarget:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.errors = (requests.RequestException,)
+
+    def request(self, method, path, body=None):
+        response = self.session.request(method, self.base_url + path, json=body, timeout=60)
+        return response.status_code, response.text
+
+class InProcessTarget:
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.errors = ()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_data(as_text=True)
+
+def load_in_process_app():
+    """在临时目录中加载 main,不启动后台任务,退出时不写数据文件"""
+    os.environ.setdefault('ROUTING_WARMUP', '0')
+    workdir = tempfile.mkdtemp(prefix='bench_load_')
+    os.chdir(workdir)
+    sys.path.insert(0, PYDEMO_DIR)
+    import main
+    atexit.unregister(main.save_data)
+    main.init_state()
+    return main.app
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise click.BadParameter(f'未知的操作: {name},可选 {", ".join(OPERATIONS)}')
+        weights[name] = float(weight or 1)
+    return weights
+
+class Client:
+    """一个并发客户端: 维护自己注册的用户和创建的订单,保证请求之间前后一致"""
+    def __init__(self, client_id, target, rng):
+        self.client_id = client_id
+        self.target = target
+        self.rng = rng
+        self.users = []
+        self.orders = []
+        self.counter = 0
+
+    def next_id(self, prefix):
+        self.counter += 1
+        return f'{prefix}_{self.client_id}_{self.counter}'
+
+    def register(self):
+        username = self.next_id('load_user')
+        self.users.append(username)
+        return 'POST /user/register', 'POST', '/user/register', {'username': username, 'password': 'pw', 'address': 'addr', 'contact': '1'}
+
+    def login(self):
+        if not self.users:
+            return self.register()
+        return 'POST /user/login', 'POST', '/user/login', {'username': self.rng.choice(self.users), 'password': 'pw'}
+
+    def create_order(self):
+        order_id = self.next_id('load_order')
+        self.orders.append(order_id)
+        x, y = self.rng.uniform(0, 10000), self.rng.uniform(0, 10000)
+        return 'POST /order', 'POST', '/order', {
+            'order_id': order_id, 'sender_name': f'load_sender_{self.client_id}', 'receiver_name': f'load_receiver_{self.client_id % 50}',
+            'sender_address': [0, 0], 'receiver_address': [x, y], 'package_id': order_id,
+            'priority': 1 if self.rng.random() < 0.1 else 0}
+
+    def update_status(self):
+        if not self.orders:
+            return self.create_order()
+        return 'PUT /order/<id>', 'PUT', f'/order/{self.rng.choice(self.orders)}', {'status': 'received'}
+
+    def get_order(self):
+        if not self.orders:
+            return self.create_order()
+        return 'GET /order/<id>', 'GET', f'/order/{self.rng.choice(self.orders)}', None
+
+    def assign(self):
+        # 每次使用新的快递员,避免命中当天的路线缓存
+        return 'POST /delivery/assign/<username>', 'POST', f'/delivery/assign/{self.next_id("load_courier")}', None
+
+OPERATIONS = {name: getattr(Client, name) for name in ('register', 'login', 'create_order', 'update_status', 'get_order', 'assign')}
+
+def error_message(body):
+    """响应体中的 message(部分接口为 error);jsonify 会把中文转义为 \\uXXXX,需解析后再匹配"""
+    try:
+        payload = json.loads(body)
+        return str(payload.get('message') or payload.get('error') or '')
+    except (ValueError, AttributeError):
+        return ''
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock_timeouts = defaultdict(int)
+
+    def add(self, endpoint, seconds, status_code, body):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if status_code is None or status_code >= 500:
+                self.errors[endpoint] += 1
+            if status_code == 500 and '超时' in error_message(body):
+                self.lock_timeouts[endpoint] += 1
+
+    def report(self, duration):
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000
+        rows = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            rows[endpoint] = {
+                'count': len(values),
+                'throughput': len(values) / duration,
+                'p50_ms': percentile(values, 50),
+                'p95_ms': percentile(values, 95),
+                'p99_ms': percentile(values, 99),
+                'errors': self.errors[endpoint],
+                'lock_timeouts': self.lock_timeouts[endpoint],
+                'lock_timeout_rate': self.lock_timeouts[endpoint] / len(values)
+            }
+        total = sum(row['count'] for row in rows.values())
+        return {
+            'duration': duration,
+            'requests': total,
+            'throughput': total / duration,
+            'errors': sum(self.errors.values()),
+            'lock_timeouts': sum(self.lock_timeouts.values()),
+            'endpoints': rows
+        }
+
+def run_client(client, weights, deadline, max_requests, results):
+    names, cumulative = list(weights), []
+    total = 0
+    for name in names:
+        total += weights[name]
+        cumulative.append(total)
+    done = 0
+    while time.monotonic() < deadline and (max_requests is None or done < max_requests):
+        pick = client.rng.uniform(0, total)
+        name = next(name for name, bound in zip(names, cumulative) if pick <= bound)
+        endpoint, method, path, body = OPERATIONS[name](client)
+        start = time.perf_counter()
+        try:
+            status_code, text = client.target.request(method, path, body)
+        except client.target.errors:
+            status_code, text = None, ''
+        results.add(endpoint, time.perf_counter() - start, status_code, text)
+        done += 1
+
+@click.command()
+@click.option('--url', default=None, help='服务地址,如 http://127.0.0.1:5000;缺省时在进程内运行')
+@click.option('-c', '--clients', default=16, show_default=True, help='并发客户端数')
+@click.option('-d', '--duration', default=10.0, show_default=True, help='压测秒数')
+@click.option('-n', '--requests-per-client', 'max_requests', default=None, type=int, help='每个客户端的请求数上限(CI 中用于固定工作量)')
+@click.option('--mix', default=DEFAULT_MIX, show_default=True, help='操作及权重')
+@click.option('--seed', default=0, show_default=True, help='随机种子')
+@click.option('--json', 'as_json', is_flag=True, help='以 JSON 输出结果')
+@click.option('--max-error-rate', default=None, type=float, help='5xx/异常比例超过该值时以非零状态退出')
+def bench(url, clients, duration, max_requests, mix, seed, as_json, max_error_rate):
+    """混合负载压测"""
+    weights = parse_mix(mix)
+    if url:
+        make_target = lambda: HttpTarget(url)
+    else:
+        app = load_in_process_app()
+        make_target = lambda: InProcessTarget(app)
+    results = Results()
+    workers = [Client(i, make_target(), random.Random(seed * 1000003 + i)) for i in range(clients)]
+    # 服务端的调试输出改写到 stderr,保证 --json 时 stdout 只有结果
+    with contextlib.redirect_stdout(sys.stderr) if as_json else contextlib.nullcontext():
+        start = time.monotonic()
+        deadline = start + duration
+        threads = [threading.Thread(target=run_client, args=(client, weights, deadline, max_requests, results)) for client in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report = results.report(time.monotonic() - start)
+
+    if as_json:
+        click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        click.echo(f"{'接口':<34}{'请求数':>8}{'req/s':>10}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'错误':>6}{'锁超时':>8}")
+        for endpoint, row in report['endpoints'].items():
+            click.echo(f"{endpoint:<34}{row['count']:>8}{row['throughput']:>10.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                       f"{row['p99_ms']:>9.1f}{row['errors']:>6}{row['lock_timeout_rate']:>8.1%}")
+        click.echo(f"合计 {report['requests']} 个请求, {report['throughput']:.1f} req/s, "
+                   f"错误 {report['errors']}, 锁超时 {report['lock_timeouts']}")
+    if max_error_rate is not None and report['requests'] and report['errors'] / report['requests'] > max_error_rate:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    bench()
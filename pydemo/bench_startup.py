@@ -0,0 +1,58 @@
+# 服务启动耗时基准: 在子进程中导入 main 并计时,同时检查重量级依赖没有被提前加载
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+import tempfile
+import click
+
+HEAVY_MODULES = ['matplotlib', 'sklearn', 'networkx', 'ortools']
+PYDEMO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROBE = f'''
+import sys, time, json
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+main.checkpointer.stop()
+import atexit
+atexit.unregister(main.save_data)  # 基准测试不落盘
+print(json.dumps({{"import_seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+'''
+
+def run_once(workdir):
+    env = dict(os.environ, PYTHONPATH=PYDEMO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - start
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_seconds'] = total
+    return result
+
+@click.command()
+@click.option('-n', '--runs', default=5, show_default=True, help='重复次数')
+@click.option('--max-seconds', default=1.5, show_default=True, help='导入 main 的中位耗时上限(秒)')
+def bench(runs, max_seconds):
+    """测量服务启动(导入 main)耗时"""
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [run_once(workdir) for _ in range(runs)]
+    import_times = [r['import_seconds'] for r in results]
+    process_times = [r['process_seconds'] for r in results]
+    loaded = sorted({m for r in results for m in r['loaded']})
+    median = statistics.median(import_times)
+    click.echo(f"import main: 中位 {median:.3f}s, 最小 {min(import_times):.3f}s, 最大 {max(import_times):.3f}s")
+    click.echo(f"进程总耗时: 中位 {statistics.median(process_times):.3f}s")
+    failed = False
+    if loaded:
+        click.echo(f"失败: 启动时加载了重量级依赖 {loaded}")
+        failed = True
+    if median > max_seconds:
+        click.echo(f"失败: 启动耗时超过上限 {max_seconds}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,91 @@
+# 多进程部署的吞吐量测试: 分别以 1/2/4... 个 gunicorn worker 启动服务(共享 SQLite 状态),
+# 用多个客户端进程压测混合读写请求,输出各 worker 数下的每秒请求数
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+import multiprocessing
+import click
+import requests
+
+PYDEMO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(workers, port, workdir):
+    env = dict(os.environ, STATE_BACKEND='sqlite', STATE_DB=os.path.join(workdir, 'state.db'),
+               ROUTING_WARMUP='0', PYTHONPATH=PYDEMO_DIR)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+                               '--log-level', 'warning', 'wsgi:app'], cwd=workdir, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/admin/checkpoint', timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('服务启动超时')
+
+def client(args):
+    base_url, client_id, orders, duration = args
+    session = requests.Session()
+    done = errors = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        order_id = f'bench-{(client_id * 7919 + done) % orders}'
+        kind = done % 10
+        try:
+            if kind < 6:
+                response = session.get(f'{base_url}/order/{order_id}')
+            elif kind < 8:
+                response = session.get(f'{base_url}/orders/receiver/receiver-{client_id % 20}?limit=20')
+            else:
+                response = session.put(f'{base_url}/order/{order_id}', json={'status': 'received'})
+            errors += response.status_code >= 500
+        except requests.RequestException:
+            errors += 1
+        done += 1
+    return done, errors
+
+def run(workers, clients, orders, duration):
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(workers, port, workdir)
+        try:
+            session = requests.Session()
+            for i in range(orders):
+                session.post(f'{base_url}/order', json={
+                    'order_id': f'bench-{i}', 'sender_name': 'bench', 'receiver_name': f'receiver-{i % 20}',
+                    'sender_address': [0, 0], 'receiver_address': [i % 100, i // 100], 'package_id': f'bench-{i}'})
+            with multiprocessing.Pool(clients) as pool:
+                results = pool.map(client, [(base_url, i, orders, duration) for i in range(clients)])
+        finally:
+            server.terminate()
+            server.wait()
+    total = sum(done for done, _ in results)
+    errors = sum(errors for _, errors in results)
+    return total / duration, errors
+
+@click.command()
+@click.option('-w', '--workers', default='1,2,4', show_default=True, help='逗号分隔的 worker 数')
+@click.option('-c', '--clients', default=8, show_default=True, help='客户端进程数')
+@click.option('-n', '--orders', default=500, show_default=True, help='预先创建的订单数')
+@click.option('-d', '--duration', default=10.0, show_default=True, help='每轮压测秒数')
+def bench(workers, clients, orders, duration):
+    """测量吞吐量随 worker 进程数的变化"""
+    click.echo(f"CPU 核数: {os.cpu_count()}")
+    baseline = None
+    for count in (int(w) for w in workers.split(',')):
+        throughput, errors = run(count, clients, orders, duration)
+        baseline = baseline or throughput
+        click.echo(f"workers={count}: {throughput:.1f} req/s, 加速比 {throughput / baseline:.2f}x, 5xx/异常 {errors}")
+
+if __name__ == '__main__':
+    bench()
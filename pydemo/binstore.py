@@ -0,0 +1,298 @@
+# 紧凑二进制快照格式(.snap),可 mmap 打开并按需解码
+#
+# 文件布局(小端):
+#   头部 24 字节: magic(8) | 元数据偏移(8) | 元数据长度(8)
+#   key_offsets  uint64[n+1] + keys      键的 UTF-8 字节
+#   rec_offsets  uint64[n+1] + records   每条记录的紧凑 JSON
+#   <字段>       uint32[n]               字典编码的列(status / receiver_name / courier_name)
+#   元数据 JSON: 记录数、各段偏移、字典表,以及与记录同时拷贝的派生状态(统计计数器等,可选)
+import os
+import json
+import mmap
+import struct
+import hashlib
+import shutil
+import tempfile
+from array import array
+from collections.abc import MutableMapping
+import numpy as np
+from checkpoint import atomic_write, copy_record, json_default
+
+MAGIC = b'DCSNAP01'
+HEADER = struct.Struct('<8sQQ')
+DICT_FIELDS = ('status', 'receiver_name', 'courier_name')
+MISSING = 0xFFFFFFFF
+
+def encode_record(value):
+    """将记录编码为 (JSON 字节, 各字典列取值, 坐标)"""
+    raw = json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8')
+    return raw, record_columns(value)
+
+def record_columns(value):
+    return {field: value.get(field) for field in DICT_FIELDS if field in value}
+
+class SnapshotWriter:
+    """流式写入快照: 键和记录先溢写到临时文件,内存中只保留偏移、字典编码和坐标列,
+    可写入千万级记录;close() 时按与 write_snapshot 相同的布局拼装"""
+    def __init__(self, file_path, derived=None):
+        self.file_path = file_path
+        self.derived = derived
+        self.count = 0
+        self._keys = tempfile.TemporaryFile()
+        self._raws = tempfile.TemporaryFile()
+        self._key_offsets = array('Q', [0])
+        self._rec_offsets = array('Q', [0])
+        self._codes = {field: array('I') for field in DICT_FIELDS}
+        self.tables = {field: [] for field in DICT_FIELDS}
+        self._lookup = {field: {} for field in DICT_FIELDS}
+
+    def add(self, key, value):
+        """value 为字典或 (原始 JSON 字节, 列取值) 元组"""
+        raw, fields = value if isinstance(value, tuple) else encode_record(value)
+        key = str(key).encode('utf-8')
+        self._keys.write(key)
+        self._raws.write(raw)
+        self._key_offsets.append(self._key_offsets[-1] + len(key))
+        self._rec_offsets.append(self._rec_offsets[-1] + len(raw))
+        for field in DICT_FIELDS:
+            if field not in fields:
+                self._codes[field].append(MISSING)
+                continue
+            lookup = self._lookup[field]
+            marker = json.dumps(fields[field], sort_keys=True, default=json_default)
+            if marker not in lookup:
+                lookup[marker] = len(self.tables[field])
+                self.tables[field].append(fields[field])
+            self._codes[field].append(lookup[marker])
+        self.count += 1
+
+    def close(self):
+        def write(file):
+            sections = {}
+            position = HEADER.size
+            file.write(b'\0' * HEADER.size)
+
+            def emit(name, data, length=None):
+                nonlocal position
+                padding = (-position) % 8
+                file.write(b'\0' * padding)
+                position += padding
+                if length is None:
+                    length = len(data)
+                    file.write(data)
+                else:
+                    data.seek(0)
+                    shutil.copyfileobj(data, file)
+                sections[name] = [position, length]
+                position += length
+
+            emit('key_offsets', np.asarray(self._key_offsets, dtype='<u8').tobytes())
+            emit('keys', self._keys, self._key_offsets[-1])
+            emit('rec_offsets', np.asarray(self._rec_offsets, dtype='<u8').tobytes())
+            emit('records', self._raws, self._rec_offsets[-1])
+            for field in DICT_FIELDS:
+                emit(field, np.asarray(self._codes[field], dtype='<u4').tobytes())
+            meta = json.dumps({'version': 1, 'count': self.count, 'sections': sections, 'tables': self.tables,
+                               'derived': self.derived},
+                              ensure_ascii=False, default=json_default).encode('utf-8')
+            file.write(meta)
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, position, len(meta)))
+
+        try:
+            atomic_write(self.file_path, write, mode='wb')
+        finally:
+            self._keys.close()
+            self._raws.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._keys.close()
+            self._raws.close()
+
+def write_snapshot(file_path, entries, derived=None):
+    """entries: [(key, value)],value 为字典或 (原始 JSON 字节, 列取值) 元组"""
+    with SnapshotWriter(file_path, derived) as writer:
+        for key, value in entries:
+            writer.add(key, value)
+
+class SnapshotMap(MutableMapping):
+    """只读 mmap 快照之上的可写字典:记录在首次访问时才解码,修改写入内存覆盖层"""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_offset, meta_length = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{file_path} 不是有效的快照文件')
+        meta = json.loads(self._mm[meta_offset:meta_offset + meta_length])
+        self.count = meta['count']
+        self.tables = meta['tables']
+        self.derived = meta.get('derived') or {}  # 写快照时的派生状态,启动时据此恢复,无需解码全部记录
+        self._sections = meta['sections']
+        self._key_offsets = self._array('key_offsets', '<u8')
+        self._rec_offsets = self._array('rec_offsets', '<u8')
+        self._codes = {field: self._array(field, '<u4') for field in DICT_FIELDS}
+        self._index = None   # 键 -> 行号,首次按键访问时构建
+        self._overlay = {}   # 已解码或新写入的记录
+        self._deleted = set()
+        self._exported = self._version([], self.derived)  # 最近一次写出的版本,初始为打开的文件本身
+
+    def memory_usage(self):
+        """(映射的文件字节数, 内存中的覆盖层和索引),供内存统计使用"""
+        return len(self._mm), (self._overlay, self._index, self._deleted)
+
+    def _array(self, name, dtype):
+        offset, length = self._sections[name]
+        return np.frombuffer(self._mm, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    def _key(self, i):
+        start = self._sections['keys'][0]
+        return self._mm[start + int(self._key_offsets[i]):start + int(self._key_offsets[i + 1])].decode('utf-8')
+
+    def _raw(self, i):
+        start = self._sections['records'][0]
+        return self._mm[start + int(self._rec_offsets[i]):start + int(self._rec_offsets[i + 1])]
+
+    def _row(self, key):
+        if self._index is None:
+            self._index = {self._key(i): i for i in range(self.count)}
+        return self._index.get(key)
+
+    def __getitem__(self, key):
+        if key in self._overlay:
+            return self._overlay[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        i = self._row(key)
+        if i is None:
+            raise KeyError(key)
+        # 返回的字典会被原地修改,必须缓存同一个对象;并发读者以先写入者为准
+        return self._overlay.setdefault(key, json.loads(self._raw(i)))
+
+    def __contains__(self, key):
+        if key in self._overlay:
+            return True
+        return key not in self._deleted and self._row(key) is not None
+
+    def __setitem__(self, key, value):
+        self._overlay[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._overlay.pop(key, None)
+        if self._row(key) is not None:
+            self._deleted.add(key)
+
+    def __iter__(self):
+        base_keys = set()
+        for i in range(self.count):
+            key = self._key(i)
+            base_keys.add(key)
+            if key not in self._deleted:
+                yield key
+        for key in list(self._overlay):
+            if key not in base_keys:
+                yield key
+
+    def __len__(self):
+        base = self.count - len(self._deleted)
+        return base + sum(1 for key in self._overlay if self._row(key) is None)
+
+    def iter_field(self, field):
+        """逐条产出 (键, 字段值);未修改过的记录直接读列,不解码 JSON"""
+        table = self.tables[field]
+        codes = self._codes[field]
+        for i in range(self.count):
+            key = self._key(i)
+            if key in self._overlay or key in self._deleted:
+                continue
+            code = int(codes[i])
+            yield key, (table[code] if code != MISSING else None)
+        for key, value in list(self._overlay.items()):
+            yield key, value.get(field)
+
+    def keys_with(self, field, value):
+        """字段等于 value 的所有键,基础部分用列向量筛选"""
+        table = self.tables[field]
+        result = []
+        if value in table:
+            for i in np.flatnonzero(self._codes[field] == table.index(value)):
+                key = self._key(int(i))
+                if key not in self._overlay and key not in self._deleted:
+                    result.append(key)
+        result.extend(key for key, record in list(self._overlay.items()) if record.get(field) == value)
+        return result
+
+    def export_entries(self, derived=None, force=False):
+        """在读锁内调用,返回 (条目, 版本标记);与最近一次写出的快照(初始为打开的文件)相比没有变化时返回 None。
+        锁内只编码覆盖层中与原始字节不同的记录(耗时与修改量成正比),未修改的记录在锁外逐条从映射中读取:
+        映射的文件只读,快照被原子替换后旧映射仍然有效"""
+        dirty, skip = [], set(self._deleted)
+        for key, value in list(self._overlay.items()):
+            raw, fields = encode_record(value)
+            i = self._row(key)
+            if i is None or raw != self._raw(i):  # 只读取过的记录重新编码后与原始字节相同
+                dirty.append((key, (raw, fields)))
+                skip.add(key)
+        token = self._version(dirty, derived)
+        if token == self._exported and not force:
+            return None
+
+        def entries():
+            for i in range(self.count):
+                key = self._key(i)
+                if key in skip:
+                    continue
+                fields = {}
+                for field in DICT_FIELDS:
+                    code = int(self._codes[field][i])
+                    if code != MISSING:
+                        fields[field] = self.tables[field][code]
+                yield key, (bytes(self._raw(i)), fields)
+            yield from dirty
+        return entries(), token
+
+    def _version(self, dirty, derived):
+        """修改过的记录、删除的键和派生状态的摘要"""
+        digest = hashlib.sha256()
+        for key, (raw, _) in dirty:
+            digest.update(key.encode('utf-8') + b'\0' + raw + b'\0')
+        digest.update(json.dumps([sorted(self._deleted), derived or {}], sort_keys=True, default=json_default).encode('utf-8'))
+        return digest.hexdigest()
+
+    def mark_exported(self, token):
+        """export_entries 的结果已写出,之后没有新修改时不再重写"""
+        self._exported = token
+
+def open_snapshot(file_path):
+    return SnapshotMap(file_path)
+
+def convert_json(path):
+    """将 <path>.json 转换为 <path>.snap"""
+    with open(path + '.json', 'r') as file:
+        data = json.load(file)
+    write_snapshot(path + '.snap', data.items())
+    return len(data)
+
+if __name__ == '__main__':
+    import click
+
+    @click.command()
+    @click.argument('names', nargs=-1)
+    def convert(names):
+        """将 JSON 数据文件转换为二进制快照,默认转换 orders/deliveries/packages/users"""
+        for name in names or ('orders', 'deliveries', 'packages', 'users'):
+            if not os.path.exists(name + '.json'):
+                click.echo(f"跳过 {name}: 文件不存在")
+                continue
+            click.echo(f"{name}.json -> {name}.snap: {convert_json(name)} 条记录")
+
+    convert()
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def json_default(value):
+    """history 中追加的是 datetime 对象,序列化时转换为 ISO 字符串"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'value'):  # Enum
+        return value.value
+    if hasattr(value, 'tolist'):  # numpy 类型
+        return value.tolist()
+    raise TypeError(f'无法序列化的类型: {type(value).__name__}')
+
+def atomic_write(file_path, write, mode='w'):
+    """先写临时文件并 fsync,再原子替换目标文件,崩溃时不会留下写了一半的文件"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(file_path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # 目录项也需要落盘,否则断电后 rename 可能丢失
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def atomic_write_json(file_path, data):
+    atomic_write(file_path, lambda file: json.dump(data, file, indent=4, default=json_default))
+
+def copy_record(record):
+    """在读锁内拷贝一条记录:to_dict 对象直接转换,字典浅拷贝并复制其中的列表(如 history)"""
+    if hasattr(record, 'to_dict'):
+        return record.to_dict()
+    if isinstance(record, dict):
+        return {key: (list(value) if isinstance(value, list) else value) for key, value in record.items()}
+    return record
+
+class Checkpointer:
+    """后台周期快照:短暂持有读锁拷贝集合,锁外序列化并原子写入 <name>.json 或 <name>.snap"""
+    def __init__(self, sources, interval=30, fmt='json', derived=None):
+        # sources: {name: (rwlock, getter)},getter 返回当前的集合对象(集合在启动时会被重新赋值)
+        self.sources = sources
+        # derived: {name: getter},返回依赖该集合的派生状态(只在该集合写锁内更新的计数器),
+        # 与记录在同一次读锁内拷贝,二进制快照中随记录一起保存
+        self.derived = derived or {}
+        self.interval = interval
+        self.fmt = fmt  # 'json' 或 'binary'
+        self.last_snapshot_at = None
+        self.last_snapshot_duration = None
+        self.last_durations = {}
+        self.snapshot_count = 0
+        self.last_error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._snapshot_lock = threading.Lock()  # 防止定时快照与手动/退出快照并发写同一文件
+
+    def snapshot_collection(self, name):
+        lock, getter = self.sources[name]
+        rlock = lock.gen_rlock()
+        if not rlock.acquire(timeout=5):
+            raise TimeoutError(f'获取 {name} 读锁超时')
+        try:
+            collection = getter()
+            derived = self.derived[name]() if self.fmt == 'binary' and name in self.derived else None
+            token = None
+            if self.fmt == 'binary' and hasattr(collection, 'export_entries'):
+                # 映射的正是要写的文件时,没有修改就不必重写
+                same_file = os.path.abspath(collection.file_path) == os.path.abspath(name + '.snap')
+                exported = collection.export_entries(derived, force=not same_file)
+                if exported is None:
+                    self.last_durations[name] = 0.0
+                    logger.info(f"Snapshot {name}.snap unchanged, skipped")
+                    return
+                data, token = exported
+            else:
+                data = {key: copy_record(value) for key, value in collection.items()}
+        finally:
+            rlock.release()
+        start_time = time.time()
+        if self.fmt == 'binary':
+            from binstore import write_snapshot
+            file_path = name + '.snap'
+            write_snapshot(file_path, data.items() if isinstance(data, dict) else data, derived)
+            if token is not None:
+                collection.mark_exported(token)
+        else:
+            file_path = name + '.json'
+            atomic_write_json(file_path, data)
+        self.last_durations[name] = time.time() - start_time
+        logger.info(f"Saved snapshot to {file_path}")
+
+    def snapshot_all(self):
+        with self._snapshot_lock:
+            start_time = time.time()
+            errors = []
+            for name in self.sources:
+                try:
+                    self.snapshot_collection(name)
+                except Exception as e:
+                    errors.append(f'{name}: {e}')
+                    logger.error(f"An error occurred while saving snapshot of {name}: {e}")
+            self.last_snapshot_at = datetime.now()
+            self.last_snapshot_duration = time.time() - start_time
+            self.snapshot_count += 1
+            self.last_error = '; '.join(errors) or None
+            return not errors
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.snapshot_all()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='checkpoint', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+    def status(self):
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'interval': self.interval,
+            'format': self.fmt,
+            'snapshot_count': self.snapshot_count,
+            'last_snapshot_at': self.last_snapshot_at.isoformat() if self.last_snapshot_at else None,
+            'last_snapshot_duration': self.last_snapshot_duration,
+            'last_durations': dict(self.last_durations),
+            'last_error': self.last_error
+        }
@@ -2,11 +2,16 @@ import click
 import requests
 import configparser
 import os
+import json
+import time
 import curses
+import threading
 from Curse import view_tasks_curses
+from offline import OfflineStore
 
 API_URL = "http://localhost:5000"
 CONFIG_FILE = "config.ini"
+HEARTBEAT_INTERVAL = 30  # 服务器默认 120 秒无心跳视为离线
 
 def get_config():
     config = configparser.ConfigParser()
@@ -23,6 +28,45 @@ def cli():
     """配送管理命令行工具"""
     pass
 
+def fetch_tasks(store, username):
+    """获取当天路线并缓存到本地;无法连接服务器时返回缓存的路线"""
+    try:
+        response = requests.post(f"{API_URL}/delivery/assign/{username}", timeout=30)
+    except requests.RequestException:
+        tasks = store.get('route', username)
+        if tasks is None:
+            click.echo("无法连接服务器,且本地没有缓存的路线")
+        else:
+            click.echo("无法连接服务器,使用本地缓存的路线")
+        return tasks
+    if response.status_code == 200 or response.status_code == 201:
+        tasks = response.json()
+        store.put('route', username, tasks)
+        return tasks
+    click.echo(f"任务获取失败: {response.json().get('error', '未知错误')}")
+    return None
+
+def start_heartbeat(username, interval=HEARTBEAT_INTERVAL):
+    """界面运行期间在后台定期发送在线心跳,返回用于停止的 Event;网络中断时静默跳过"""
+    stop = threading.Event()
+
+    def run():
+        session = requests.Session()
+        while True:
+            try:
+                session.post(f"{API_URL}/user/{username}/heartbeat", timeout=5)
+            except requests.RequestException:
+                pass
+            if stop.wait(interval):
+                return
+
+    threading.Thread(target=run, name='heartbeat', daemon=True).start()
+    return stop
+
+def queue_offline(store, kind, record_id, status):
+    store.enqueue(kind, record_id, status)
+    click.echo(f"无法连接服务器,{record_id} 的状态修改已加入待发送队列(共 {store.pending()} 条),联网后执行 sync 提交")
+
 @click.command()
 def view_tasks():
     """查看快递员任务"""
@@ -33,12 +77,14 @@ def view_tasks():
         return
 
     username = config['user']['username']
-    response = requests.post(f"{API_URL}/delivery/assign/{username}")
-    if response.status_code == 200 or response.status_code == 201:
-        tasks = response.json()
-        curses.wrapper(view_tasks_curses, tasks)
-    else:
-        click.echo(f"任务获取失败: {response.json().get('error', '未知错误')}")
+    store = OfflineStore()
+    tasks = fetch_tasks(store, username)
+    if tasks:
+        heartbeat = start_heartbeat(username)
+        try:
+            curses.wrapper(view_tasks_curses, tasks, store)
+        finally:
+            heartbeat.set()
 
 @click.command()
 @click.option('-u', '--username', required=True, help='用户名')
@@ -110,28 +156,126 @@ def GetTasks():
         return
 
     username = config['user']['username']
-    response = requests.post(f"{API_URL}/delivery/assign/{username}")
-    if response.status_code == 200 or response.status_code == 201:
-        tasks = response.json()
+    tasks = fetch_tasks(OfflineStore(), username)
+    if tasks:
         click.echo(f"任务获取成功: {tasks}")
-    else:
-        click.echo(f"任务获取失败: {response.json().get('error', '未知错误')}")
 
 @click.command()
 @click.argument('delivery_id')
 def complete_delivery(delivery_id):
     """完成配送任务"""
-    response = requests.put(f"{API_URL}/delivery/{delivery_id}", json={"status": "completed"})
+    try:
+        response = requests.put(f"{API_URL}/delivery/{delivery_id}", json={"status": "delivered"}, timeout=10)
+    except requests.RequestException:
+        queue_offline(OfflineStore(), 'delivery', delivery_id, "delivered")
+        return
     if response.status_code == 200:
         click.echo("配送任务已完成")
     else:
         click.echo(f"完成配送任务失败: {response.json().get('error', '未知错误')}")
 
+@click.command()
+@click.argument('delivery_ids', nargs=-1)
+@click.option('-f', '--file', 'id_file', type=click.File('r'), help='从文件读取配送任务ID,每行一个(- 表示标准输入)')
+@click.option('-b', '--batch-size', default=200, show_default=True, help='每次请求提交的任务数')
+def complete_deliveries(delivery_ids, id_file, batch_size):
+    """批量完成配送任务"""
+    ids = list(delivery_ids)
+    if id_file:
+        ids += [line.strip() for line in id_file if line.strip()]
+    if not ids:
+        click.echo("请提供配送任务ID")
+        return
+    session = requests.Session()  # 复用连接
+    completed, failed = 0, []
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        try:
+            response = session.put(f"{API_URL}/deliveries/status", json=[{"id": delivery_id, "status": "delivered"} for delivery_id in batch], timeout=30)
+        except requests.RequestException:
+            store = OfflineStore()
+            for delivery_id in ids[start:]:
+                store.enqueue('delivery', delivery_id, "delivered")
+            click.echo(f"无法连接服务器,剩余 {len(ids) - start} 个任务已加入待发送队列,联网后执行 sync 提交")
+            break
+        if response.status_code != 200:
+            click.echo(f"批量完成失败: {response.json().get('message', '未知错误')}")
+            failed += batch
+            continue
+        for result in response.json()['results']:
+            if result['success']:
+                completed += 1
+            else:
+                failed.append(result['id'])
+    click.echo(f"已完成 {completed} 个配送任务")
+    if failed:
+        click.echo(f"未完成: {', '.join(map(str, failed))}")
+
+def iter_sse(response):
+    """解析 text/event-stream,逐个产出 (id, event, data)"""
+    event_id, event_type, data = None, 'message', []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == '':
+            if data:
+                yield event_id, event_type, json.loads('\n'.join(data))
+            event_type, data = 'message', []
+        elif line.startswith(':'):
+            continue  # 保活注释
+        else:
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'id':
+                event_id = value
+            elif field == 'event':
+                event_type = value
+            elif field == 'data':
+                data.append(value)
+
+def format_event(event_type, data):
+    if event_type == 'order':
+        return f"订单 {data['order_id']}: {data.get('previous_status')} -> {data['status']}"
+    if event_type == 'delivery':
+        return f"配送任务 {data['delivery_id']}: {data.get('previous_status')} -> {data['status']}"
+    if event_type == 'route':
+        return f"路线已更新: 共{len(data['path'])}站, 总长度 {data['length']:.2f}"
+    return f"{event_type}: {data}"
+
+@click.command()
+def watch():
+    """实时查看订单/配送任务/路线变化(服务端推送,断线自动重连)"""
+    config = get_config()
+    if 'user' not in config or 'username' not in config['user']:
+        click.echo("请先登录")
+        return
+
+    username = config['user']['username']
+    last_event_id = None
+    click.echo("正在监听状态变化,按 Ctrl+C 退出")
+    start_heartbeat(username)
+    while True:
+        headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+        try:
+            with requests.get(f"{API_URL}/events/{username}", headers=headers, stream=True, timeout=(5, 60)) as response:
+                for event_id, event_type, data in iter_sse(response):
+                    last_event_id = event_id or last_event_id
+                    click.echo(format_event(event_type, data))
+        except KeyboardInterrupt:
+            return
+        except requests.RequestException:
+            click.echo("连接中断,3秒后重连...")
+            time.sleep(3)
+
 @click.command()
 def logout():
     """登出"""
     config = get_config()
     if 'user' in config:
+        try:
+            requests.post(f"{API_URL}/user/{config['user'].get('username')}/logout", timeout=5)
+        except requests.RequestException:
+            pass  # 离线时由服务器按心跳超时清除在线状态
         config.remove_section('user')
         save_config(config)
         click.echo("登出成功")
@@ -163,21 +307,41 @@ def change_password(old_password, new_password):
 @click.argument('order_id')
 def sign_order(order_id):
     """签收订单"""
-    response = requests.put(f"{API_URL}/order/{order_id}", json={"status": "received"})
+    try:
+        response = requests.put(f"{API_URL}/order/{order_id}", json={"status": "received"}, timeout=10)
+    except requests.RequestException:
+        queue_offline(OfflineStore(), 'order', order_id, "received")
+        return
     if response.status_code == 200:
         click.echo("订单已完成")
     else:
         click.echo(f"完成订单失败: {response.json().get('error', '未知错误')}")
 
+@click.command()
+def sync():
+    """提交离线期间排队的状态修改"""
+    store = OfflineStore()
+    pending = store.pending()
+    if not pending:
+        click.echo("没有待提交的状态修改")
+        return
+    sent, rejected = store.flush(API_URL)
+    click.echo(f"已提交 {sent} 条,剩余 {store.pending()} 条")
+    for kind, record_id, message in rejected:
+        click.echo(f"服务器拒绝 {kind} {record_id}: {message}")
+
 cli.add_command(view_tasks)
 cli.add_command(GetTasks)
 cli.add_command(register)
 cli.add_command(login)
 cli.add_command(set_role)
 cli.add_command(complete_delivery)
+cli.add_command(complete_deliveries)
 cli.add_command(logout)
 cli.add_command(change_password)
 cli.add_command(sign_order)
+cli.add_command(watch)
+cli.add_command(sync)
 
 if __name__ == "__main__":
     cli()
\ No newline at end of file
@@ -0,0 +1,299 @@
+# 路线规划使用的距离提供者: GET_task_path 通过 matrix(coordinates) 获取站点之间的距离矩阵
+#
+# 部署时用环境变量选择实现:
+#   DISTANCE_PROVIDER=euclidean(默认)  直线距离
+#   DISTANCE_PROVIDER=road             路网最短路,ROAD_GRAPH 指定路网文件,ROAD_CACHE 指定节点对距离缓存
+#   COORDINATE_SYSTEM=planar(默认)     坐标为平面坐标,直线距离取欧氏距离
+#   COORDINATE_SYSTEM=latlon           坐标为 [纬度, 经度](度),直线距离取大圆距离(米)
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+
+COORDINATE_SYSTEMS = ('planar', 'latlon')
+EARTH_RADIUS = 6371008.8  # 地球平均半径(米)
+BLOCK_SIZE = int(os.environ.get('DISTANCE_BLOCK_SIZE', 1024))  # 每次计算的行数,中间数组约为 BLOCK_SIZE×n
+
+def euclidean_block(rows, points):
+    diff = rows[:, None, :] - points[None, :, :]
+    return np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+
+def haversine(lat1, lon1, lat2, lon2):
+    """弧度制输入,按 numpy 广播规则逐元素计算大圆距离"""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def haversine_block(rows, points):
+    """rows / points 为弧度制的 [纬度, 经度]"""
+    return haversine(rows[:, 0:1], rows[:, 1:2], points[None, :, 0], points[None, :, 1])
+
+def pairwise_distances(coordinates, coordinate_system='planar', block_size=None, targets=None):
+    """按行分块计算直线距离矩阵(targets 缺省时为 coordinates 两两之间),峰值内存与 块行数×列数 成正比"""
+    if coordinate_system not in COORDINATE_SYSTEMS:
+        raise ValueError(f'未知的坐标系: {coordinate_system}')
+    rows = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    points = rows if targets is None else np.asarray(targets, dtype=float).reshape(-1, 2)
+    if coordinate_system == 'latlon':
+        rows, points, block = np.radians(rows), np.radians(points), haversine_block
+    else:
+        block = euclidean_block
+    block_size = block_size or BLOCK_SIZE
+    matrix = np.empty((len(rows), len(points)))
+    for start in range(0, len(rows), block_size):
+        matrix[start:start + block_size] = block(rows[start:start + block_size], points)
+    return matrix
+
+class DistanceProvider:
+    """距离提供者接口: 返回 n×n 的 numpy 矩阵,matrix[i][j] 为第 i 个站点到第 j 个站点的距离"""
+    name = 'base'
+
+    def __init__(self, coordinate_system='planar'):
+        if coordinate_system not in COORDINATE_SYSTEMS:
+            raise ValueError(f'未知的坐标系: {coordinate_system}')
+        self.coordinate_system = coordinate_system
+
+    def matrix(self, coordinates):
+        raise NotImplementedError
+
+    def block(self, sources, targets):
+        """sources 中各站点到 targets 中各站点的 len(sources)×len(targets) 距离矩阵"""
+        sources, targets = np.asarray(sources, dtype=float).reshape(-1, 2), np.asarray(targets, dtype=float).reshape(-1, 2)
+        return self.matrix(np.vstack([sources, targets]))[:len(sources), len(sources):]
+
+    def cached_matrix(self, keys, coordinates):
+        """按订单ID复用上次计算过的距离,只为新增站点计算行列"""
+        if getattr(self, 'matrix_cache', None) is None:
+            self.matrix_cache = DistanceMatrixCache(self)
+        return self.matrix_cache.matrix_for(keys, coordinates)
+
+class EuclideanDistance(DistanceProvider):
+    """直线距离: 平面坐标取欧氏距离,经纬度取大圆距离"""
+    name = 'euclidean'
+
+    def matrix(self, coordinates):
+        return pairwise_distances(coordinates, self.coordinate_system)
+
+    def block(self, sources, targets):
+        return pairwise_distances(sources, self.coordinate_system, targets=targets)
+
+class RoadNetworkDistance(DistanceProvider):
+    """按本地路网计算的最短路距离
+
+    路网文件为 JSON: {"nodes": [[节点ID, x, y], ...], "edges": [[起点ID, 终点ID, 长度, 是否单行(可选)], ...]}
+    站点吸附到最近的路网节点,站点到节点的直线距离计入首尾;需要的节点对按批做多源 Dijkstra,
+    结果写入 SQLite 缓存,下次分配时只计算缺失的节点对。
+    """
+    name = 'road'
+    SOURCE_BATCH = 32          # 每批 Dijkstra 的源点数,限制 批数×节点数 的中间矩阵大小
+    UNREACHABLE_FACTOR = 1.5   # 路网不连通时按直线距离乘以该系数估计
+
+    def __init__(self, graph_path, cache_path=None, coordinate_system='planar'):
+        super().__init__(coordinate_system)
+        from scipy.sparse import csr_matrix
+        from scipy.spatial import cKDTree
+        with open(graph_path, 'r', encoding='utf-8') as f:
+            graph = json.load(f)
+        node_ids = [node[0] for node in graph['nodes']]
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.node_ids = node_ids
+        self.node_coords = np.array([node[1:3] for node in graph['nodes']], dtype=float)
+        rows, cols, weights = [], [], []
+        for edge in graph['edges']:
+            u, v, length = index[edge[0]], index[edge[1]], float(edge[2])
+            rows.append(u); cols.append(v); weights.append(length)
+            if not (len(edge) > 3 and edge[3]):
+                rows.append(v); cols.append(u); weights.append(length)
+        size = len(node_ids)
+        self.graph = csr_matrix((weights, (rows, cols)), shape=(size, size))
+        self.tree = cKDTree(self.node_coords)
+        self.cache_path = cache_path or graph_path + '.cache.db'
+        self._local = threading.local()
+        self._conn().execute('CREATE TABLE IF NOT EXISTS pairs (source INTEGER, target INTEGER, distance REAL, PRIMARY KEY (source, target))')
+        self.computed_pairs = 0
+        self.cached_pairs = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.cache_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def snap(self, coordinates):
+        """返回 (最近节点下标, 站点到节点的直线距离)"""
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        offsets, nodes = self.tree.query(coordinates)
+        nodes = np.atleast_1d(nodes)
+        if self.coordinate_system == 'latlon':
+            # KD 树按度数找最近节点,吸附距离按大圆距离重新计算
+            stops, snapped = np.radians(coordinates), np.radians(self.node_coords[nodes])
+            offsets = haversine(stops[:, 0], stops[:, 1], snapped[:, 0], snapped[:, 1])
+        return nodes, np.atleast_1d(offsets)
+
+    def _load_cached(self, sources, targets):
+        """从缓存读取 sources 到 targets 之间已知的距离"""
+        known = {}
+        target_set = set(targets)
+        conn = self._conn()
+        for start in range(0, len(sources), 500):  # SQLite 参数个数有上限
+            chunk = sources[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            for source, target, distance in conn.execute(
+                    f'SELECT source, target, distance FROM pairs WHERE source IN ({marks})', chunk):
+                if target in target_set:
+                    known[(source, target)] = distance
+        return known
+
+    def node_distances(self, nodes, targets=None):
+        """nodes 到 targets(缺省为 nodes 自身)的路网距离矩阵,按传入顺序排列"""
+        from scipy.sparse.csgraph import dijkstra
+        nodes = [int(node) for node in nodes]
+        targets = nodes if targets is None else [int(node) for node in targets]
+        unique = sorted(set(nodes))
+        unique_targets = sorted(set(targets))
+        known = self._load_cached(unique, unique_targets)
+        missing_sources = [source for source in unique if any((source, target) not in known for target in unique_targets)]
+        self.cached_pairs += len(known)
+        new_pairs = []
+        for start in range(0, len(missing_sources), self.SOURCE_BATCH):
+            sources = missing_sources[start:start + self.SOURCE_BATCH]
+            distances = dijkstra(self.graph, directed=True, indices=sources)
+            for row, source in zip(distances, sources):
+                for target in unique_targets:
+                    if (source, target) not in known:
+                        known[(source, target)] = float(row[target])
+                        new_pairs.append((source, target, float(row[target])))
+        if new_pairs:
+            self.computed_pairs += len(new_pairs)
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('INSERT OR REPLACE INTO pairs VALUES (?, ?, ?)', new_pairs)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return np.array([[known[(source, target)] for target in targets] for source in nodes], dtype=float)
+
+    def block(self, sources, targets):
+        sources, targets = np.asarray(sources, dtype=float).reshape(-1, 2), np.asarray(targets, dtype=float).reshape(-1, 2)
+        source_nodes, source_offsets = self.snap(sources)
+        target_nodes, target_offsets = self.snap(targets)
+        matrix = self.node_distances(source_nodes, target_nodes) + source_offsets[:, None] + target_offsets[None, :]
+        unreachable = ~np.isfinite(matrix)
+        if unreachable.any():
+            straight = pairwise_distances(sources, self.coordinate_system, targets=targets)
+            matrix[unreachable] = straight[unreachable] * self.UNREACHABLE_FACTOR
+        return matrix
+
+    def matrix(self, coordinates):
+        matrix = self.block(coordinates, coordinates)
+        np.fill_diagonal(matrix, 0)
+        return matrix
+
+class DistanceMatrixCache:
+    """按订单ID增量维护的距离矩阵
+
+    每次分配时传入当前待分配订单: 不再出现的订单(已派送/取消)标记为失效,新订单追加行列,
+    只为新增站点计算距离;失效槽位超过一半时整体压缩。矩阵容量按倍数增长以摊薄追加成本。
+    """
+    COMPACT_MIN_DEAD = 64
+
+    def __init__(self, provider):
+        self.provider = provider
+        self._lock = threading.Lock()
+        self.slots = {}                   # 订单ID -> 槽位
+        self.coords = np.empty((0, 2))
+        self.matrix = np.empty((0, 0))
+        self.size = 0                     # 已使用的槽位数(含失效槽位)
+        self.dead = set()
+        self.computed_cells = 0
+        self.reused_cells = 0
+        self.compactions = 0
+
+    def _drop(self, key):
+        self.dead.add(self.slots.pop(key))
+
+    def _compact(self):
+        live = sorted(self.slots.items(), key=lambda item: item[1])
+        order = np.array([slot for _, slot in live], dtype=int)
+        self.matrix = self.matrix[np.ix_(order, order)].copy()
+        self.coords = self.coords[order].copy()
+        self.slots = {key: i for i, (key, _) in enumerate(live)}
+        self.size = len(live)
+        self.dead = set()
+        self.compactions += 1
+
+    def _reserve(self, count):
+        capacity = len(self.matrix)
+        if self.size + count <= capacity:
+            return
+        capacity = max(capacity * 2, self.size + count)
+        matrix = np.zeros((capacity, capacity))
+        matrix[:self.size, :self.size] = self.matrix[:self.size, :self.size]
+        coords = np.zeros((capacity, 2))
+        coords[:self.size] = self.coords[:self.size]
+        self.matrix, self.coords = matrix, coords
+
+    def matrix_for(self, keys, coordinates):
+        keys = [str(key) for key in keys]
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        with self._lock:
+            wanted = dict(zip(keys, coordinates))
+            for key in list(self.slots):
+                if key not in wanted or not np.array_equal(self.coords[self.slots[key]], wanted[key]):
+                    self._drop(key)  # 已派送/取消,或地址已修改
+            if len(self.dead) >= max(self.COMPACT_MIN_DEAD, len(self.slots)):
+                self._compact()
+            new_keys = [key for key in wanted if key not in self.slots]
+            computed = 0
+            if new_keys:
+                self._reserve(len(new_keys))
+                live = np.array(sorted(self.slots.values()), dtype=int)
+                start = self.size
+                new_slots = np.arange(start, start + len(new_keys))
+                new_coords = np.array([wanted[key] for key in new_keys])
+                self.coords[new_slots] = new_coords
+                all_slots = np.concatenate([live, new_slots])
+                self.matrix[np.ix_(new_slots, all_slots)] = self.provider.block(new_coords, self.coords[all_slots])
+                if len(live):
+                    self.matrix[np.ix_(live, new_slots)] = self.provider.block(self.coords[live], new_coords)
+                self.matrix[new_slots, new_slots] = 0
+                computed = len(new_keys) * (2 * len(all_slots) - len(new_keys))
+                self.slots.update(zip(new_keys, new_slots.tolist()))
+                self.size += len(new_keys)
+            index = np.array([self.slots[key] for key in keys], dtype=int)
+            self.computed_cells += computed
+            self.reused_cells += len(keys) ** 2 - computed
+            return self.matrix[np.ix_(index, index)]
+
+    def stats(self):
+        with self._lock:
+            return {'live': len(self.slots), 'dead': len(self.dead), 'capacity': len(self.matrix),
+                    'computed_cells': self.computed_cells, 'reused_cells': self.reused_cells, 'compactions': self.compactions}
+
+_providers = {}  # 坐标系 -> 距离提供者
+_provider_lock = threading.Lock()
+
+def get_distance_provider(coordinate_system=None):
+    """按环境变量创建当前进程使用的距离提供者(每个进程只加载一次路网)"""
+    coordinate_system = coordinate_system or os.environ.get('COORDINATE_SYSTEM', 'planar')
+    with _provider_lock:
+        provider = _providers.get(coordinate_system)
+        if provider is None:
+            kind = os.environ.get('DISTANCE_PROVIDER', 'euclidean')
+            if kind == 'road':
+                provider = RoadNetworkDistance(os.environ['ROAD_GRAPH'], os.environ.get('ROAD_CACHE'), coordinate_system)
+            elif kind == 'euclidean':
+                provider = EuclideanDistance(coordinate_system)
+            else:
+                raise ValueError(f'未知的距离提供者: {kind}')
+            _providers[coordinate_system] = provider
+        return provider
+
+def loaded_providers():
+    """当前进程已创建的距离提供者(内存统计用)"""
+    with _provider_lock:
+        return dict(_providers)
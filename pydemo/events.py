@@ -0,0 +1,119 @@
+# 按用户推送的事件总线: 写路径发布订单/配送状态变化和路线更新,SSE 连接订阅
+import json
+import queue
+import asyncio
+import threading
+import itertools
+from collections import deque
+from checkpoint import json_default
+
+class AsyncSubscriber:
+    """asyncio 订阅者: 发布线程通过 call_soon_threadsafe 把事件交给事件循环,不占用线程"""
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+class EventBus:
+    def __init__(self, queue_size=256, replay_size=100):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._subscribers = {}  # 用户名 -> [queue.Queue]
+        self._recent = {}       # 用户名 -> deque,供断线重连时按 Last-Event-ID 补发
+        self.queue_size = queue_size
+        self.replay_size = replay_size
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, usernames, event_type, data):
+        """非阻塞发布,可在持有集合写锁时调用;订阅者队列满时丢弃其最旧的事件"""
+        usernames = {str(username) for username in usernames if username is not None}
+        with self._lock:
+            event = {'id': next(self._ids), 'event': event_type, 'data': data}
+            self.published += 1
+            for username in usernames:
+                self._recent.setdefault(username, deque(maxlen=self.replay_size)).append(event)
+                for subscriber in self._subscribers.get(username, ()):
+                    if isinstance(subscriber, AsyncSubscriber):
+                        subscriber.offer(event)
+                        continue
+                    while True:
+                        try:
+                            subscriber.put_nowait(event)
+                            break
+                        except queue.Full:
+                            try:
+                                subscriber.get_nowait()
+                                self.dropped += 1
+                            except queue.Empty:
+                                pass
+        return event['id']
+
+    def subscribe(self, username, last_event_id=None, loop=None):
+        """loop 不为空时返回 AsyncSubscriber,否则返回线程安全的 queue.Queue"""
+        subscriber = AsyncSubscriber(loop, self.queue_size) if loop else queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(str(username), []).append(subscriber)
+            if last_event_id is not None:
+                for event in self._recent.get(str(username), ()):
+                    if event['id'] > last_event_id:
+                        if loop:
+                            subscriber.offer(event)
+                        else:
+                            subscriber.put_nowait(event)
+        return subscriber
+
+    def unsubscribe(self, username, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(str(username), [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(str(username), None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+def format_sse(event):
+    data = json.dumps(event['data'], ensure_ascii=False, default=json_default)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+def sse_stream(bus, username, last_event_id=None, heartbeat=15):
+    """SSE 生成器: 空闲时每 heartbeat 秒发送一行注释保活,连接断开时取消订阅"""
+    subscriber = bus.subscribe(username, last_event_id)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_sse(event)
+    finally:
+        bus.unsubscribe(username, subscriber)
+
+async def sse_stream_async(bus, username, last_event_id=None, heartbeat=15):
+    """sse_stream 的 asyncio 版本,空闲连接只占一个协程"""
+    subscriber = bus.subscribe(username, last_event_id, loop=asyncio.get_running_loop())
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_sse(event)
+    finally:
+        bus.unsubscribe(username, subscriber)
@@ -0,0 +1,243 @@
+# 合成数据集生成器: 按城市聚集分布生成用户、快递员、订单、包裹和配送任务,用于压测和容量测试。
+#
+# 所有记录前后一致: 订单的收发地址取自对应用户的住址,包裹/配送状态与订单所处阶段一致,
+# 各历史记录的时间戳按状态顺序递增且不晚于生成时刻。订单按块向量化生成并逐条流式写出,
+# 内存占用与订单数基本无关(二进制格式只在内存中保留每条记录几十字节的列数据),可生成千万级记录。
+#
+#   python gen_dataset.py -n 1000000 --cities 40 -o data/           # JSON,可直接作为 main.py 的数据文件
+#   python gen_dataset.py -n 10000000 --format binary -o data/      # .snap,配合 SNAPSHOT_FORMAT=binary
+import os
+import json
+import time
+import tempfile
+from datetime import datetime
+import click
+import numpy as np
+from binstore import SnapshotWriter
+from checkpoint import json_default
+
+CHUNK_SIZE = 50000
+EXTENTS = {
+    'planar': ((0, 10000), (0, 10000)),   # 与 main.py 中示例订单的坐标范围一致
+    'latlon': ((22.0, 40.0), (105.0, 122.0)),
+}
+# 订单各阶段之间的平均间隔(秒)
+MEAN_RECEIVE_DELAY = 86400
+MEAN_DISPATCH_DELAY = 6 * 3600
+MEAN_TRANSIT_DELAY = 1800
+MEAN_DELIVERY_DELAY = 4 * 3600
+MEAN_CANCEL_DELAY = 3600
+CANCEL_RATE = 0.03
+PRIORITY_RATE = 0.1
+TIME_WINDOW_RATE = 0.1
+
+class JsonMapWriter:
+    """逐条写出 {"key": record, ...} 形式的 JSON 文件(main.load_json 读取的格式),完成后原子替换"""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.count = 0
+        fd, self._tmp_path = tempfile.mkstemp(prefix=os.path.basename(file_path) + '.', suffix='.tmp',
+                                              dir=os.path.dirname(os.path.abspath(file_path)))
+        self._file = os.fdopen(fd, 'w', encoding='utf-8', buffering=1 << 20)
+        self._file.write('{')
+
+    def add(self, key, value):
+        self._file.write(',\n' if self.count else '\n')
+        self._file.write(json.dumps(str(key)))
+        self._file.write(': ')
+        self._file.write(json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=json_default))
+        self.count += 1
+
+    def close(self):
+        self._file.write('\n}\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.file_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+def open_writer(out_dir, name, fmt):
+    if fmt == 'binary':
+        return SnapshotWriter(os.path.join(out_dir, name + '.snap'))
+    return JsonMapWriter(os.path.join(out_dir, name + '.json'))
+
+class CityModel:
+    """城市中心均匀分布,规模服从 Zipf 分布;点位为围绕城市中心的高斯分布,少量散落在郊外"""
+    def __init__(self, rng, cities, coordinate_system='planar', rural_share=0.05):
+        self.rng = rng
+        (self.x_min, self.x_max), (self.y_min, self.y_max) = EXTENTS[coordinate_system]
+        self.rural_share = rural_share
+        weights = 1.0 / np.arange(1, cities + 1) ** 1.1
+        self.weights = weights / weights.sum()
+        self.centers = np.column_stack([rng.uniform(self.x_min, self.x_max, cities),
+                                        rng.uniform(self.y_min, self.y_max, cities)])
+        # 大城市占地更大,最大城市的半径约为区域边长的 1/(4*sqrt(城市数))
+        span = min(self.x_max - self.x_min, self.y_max - self.y_min)
+        self.radii = span / (4 * np.sqrt(cities)) * np.sqrt(self.weights / self.weights[0])
+
+    def sample(self, count):
+        """返回 (城市编号 [count], 坐标 [count, 2]),郊外的点城市编号为最近的城市"""
+        city = self.rng.choice(len(self.weights), size=count, p=self.weights)
+        points = self.centers[city] + self.rng.normal(size=(count, 2)) * self.radii[city][:, None]
+        rural = self.rng.random(count) < self.rural_share
+        points[rural] = np.column_stack([self.rng.uniform(self.x_min, self.x_max, rural.sum()),
+                                         self.rng.uniform(self.y_min, self.y_max, rural.sum())])
+        if rural.any():
+            distances = ((points[rural][:, None, :] - self.centers[None, :, :]) ** 2).sum(axis=2)
+            city[rural] = distances.argmin(axis=1)
+        points[:, 0] = points[:, 0].clip(self.x_min, self.x_max)
+        points[:, 1] = points[:, 1].clip(self.y_min, self.y_max)
+        return city, points.round(6)
+
+def iso_times(now, seconds):
+    """距 now 的秒偏移数组 -> ISO 时间字符串数组(与 datetime.isoformat() 格式一致)"""
+    stamps = np.datetime64(now, 'us') + (seconds * 1e6).astype('int64').astype('timedelta64[us]')
+    return np.datetime_as_string(stamps, unit='us')
+
+def generate_users(writer, rng, cities, users, couriers):
+    """写出普通用户与快递员,返回 (用户坐标, 快递员所在城市)"""
+    user_city, homes = cities.sample(users)
+    for i in range(users):
+        writer.add(f'user_{i}', {
+            'username': f'user_{i}', 'password': f'pw{i}',
+            'address': f'城市{user_city[i]} {homes[i, 0]:.1f},{homes[i, 1]:.1f}',
+            'contact': f'1{i:010d}'[-11:], 'role': 'user', 'online': False
+        })
+    # 快递员按城市规模分配到各城市
+    courier_city = rng.choice(len(cities.weights), size=couriers, p=cities.weights)
+    for i in range(couriers):
+        writer.add(f'courier_{i}', {
+            'username': f'courier_{i}', 'password': f'pw{i}', 'address': f'城市{courier_city[i]} 配送站',
+            'contact': f'2{i:010d}'[-11:], 'role': 'courier', 'online': False
+        })
+    return user_city, homes, courier_city
+
+def order_chunk(rng, now, start, count, users, senders, user_city, homes, city_couriers, days):
+    """向量化生成一块订单的全部随机量,逐条组装成 (订单, 包裹, 配送任务或 None)"""
+    receiver = rng.integers(senders, users, size=count) if users > senders else rng.integers(0, users, size=count)
+    sender = rng.integers(0, senders, size=count)
+    placed = -rng.uniform(0, days * 86400, size=count)
+    received = placed + rng.exponential(MEAN_RECEIVE_DELAY, size=count)
+    dispatched = received + rng.exponential(MEAN_DISPATCH_DELAY, size=count)
+    in_transit = dispatched + rng.exponential(MEAN_TRANSIT_DELAY, size=count)
+    completed = in_transit + rng.exponential(MEAN_DELIVERY_DELAY, size=count)
+    canceled = np.where(rng.random(count) < CANCEL_RATE, placed + rng.exponential(MEAN_CANCEL_DELAY, size=count), np.inf)
+    priority = (rng.random(count) < PRIORITY_RATE).astype(int)
+    has_window = rng.random(count) < TIME_WINDOW_RATE
+    window_start = rng.uniform(0, 8 * 3600, size=count)
+    courier_pick = rng.random(count)
+
+    times = {name: iso_times(now, np.minimum(values, 0)) for name, values in
+             (('placed', placed), ('received', received), ('dispatched', dispatched), ('in_transit', in_transit),
+              ('completed', completed), ('canceled', np.where(np.isinf(canceled), 0, canceled)))}
+    window_ends = iso_times(now, window_start), iso_times(now, window_start + 2 * 3600)
+
+    for i in range(count):
+        order_id = str(start + i)
+        receiver_i, sender_i = receiver[i], sender[i]
+        order_history = [('placed', times['placed'][i])]
+        package_history = [('uncounted', times['placed'][i])]
+        delivery = None
+        if canceled[i] <= min(received[i], 0):
+            order_history.append(('canceled', times['canceled'][i]))
+        elif received[i] <= 0:
+            order_history.append(('received', times['received'][i]))
+            package_history.append(('counted', times['received'][i]))
+            if dispatched[i] <= 0:
+                package_history.append(('dispatched', times['dispatched'][i]))
+                couriers = city_couriers[user_city[receiver_i]]
+                delivery_history = [('pending', times['dispatched'][i])]
+                if in_transit[i] <= 0:
+                    delivery_history.append(('intransit', times['in_transit'][i]))
+                if completed[i] <= 0:
+                    delivery_history.append(('delivered', times['completed'][i]))
+                    order_history.append(('completed', times['completed'][i]))
+                # 与 commit_assignment 一致: 配送任务ID、包裹ID 都等于订单ID
+                delivery = {
+                    'delivery_id': order_id, 'package_id': order_id,
+                    'courier_name': f'courier_{couriers[int(courier_pick[i] * len(couriers))]}',
+                    'status': delivery_history[-1][0], 'history': delivery_history
+                }
+        status = order_history[-1][0]
+        order = {
+            'order_id': order_id,
+            'sender_name': f'user_{sender_i}', 'receiver_name': f'user_{receiver_i}',
+            'sender_address': homes[sender_i].tolist(), 'receiver_address': homes[receiver_i].tolist(),
+            'package_id': order_id, 'priority': int(priority[i]),
+            # 只有等待配送的订单带时间窗,时间窗位于未来 8 小时内
+            'time_window': [window_ends[0][i], window_ends[1][i]] if has_window[i] and status == 'received' and delivery is None else None,
+            'status': status, 'history': order_history
+        }
+        package = {
+            'package_id': order_id, 'sender': order['sender_name'], 'receiver': order['receiver_name'],
+            'status': package_history[-1][0], 'created_at': times['placed'][i],
+            'completed_at': times['completed'][i] if status == 'completed' else None,
+            'history': package_history
+        }
+        yield order_id, order, package, delivery
+
+@click.command()
+@click.option('-n', '--orders', default=10000, show_default=True, help='订单数(同时生成同样数量的包裹)')
+@click.option('--users', default=None, type=int, help='普通用户数,默认为订单数的 1/10')
+@click.option('--couriers', default=None, type=int, help='快递员数,默认为订单数的 1/2000(至少 5 个)')
+@click.option('--cities', default=20, show_default=True, help='城市(聚集中心)数')
+@click.option('--days', default=30, show_default=True, help='订单创建时间分布在最近多少天内')
+@click.option('--coordinate-system', type=click.Choice(['planar', 'latlon']), default='planar', show_default=True,
+              help='坐标系,与 COORDINATE_SYSTEM 环境变量保持一致')
+@click.option('--format', 'fmt', type=click.Choice(['json', 'binary']), default='json', show_default=True,
+              help='json 输出 <集合>.json,binary 输出 <集合>.snap')
+@click.option('-o', '--out-dir', default='.', show_default=True, help='输出目录')
+@click.option('--seed', default=0, show_default=True, help='随机种子,相同参数和种子生成相同数据')
+def generate(orders, users, couriers, cities, days, coordinate_system, fmt, out_dir, seed):
+    """生成合成数据集: users / orders / packages / deliveries"""
+    users = users or max(10, orders // 10)
+    couriers = couriers or max(5, orders // 2000)
+    senders = max(1, users // 100)  # 约 1% 的用户是发货的商家
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+    start_time = time.perf_counter()
+
+    city_model = CityModel(rng, cities, coordinate_system)
+    with open_writer(out_dir, 'users', fmt) as writer:
+        user_city, homes, courier_city = generate_users(writer, rng, city_model, users, couriers)
+    # 每个城市的快递员列表,没有快递员的城市由全部快递员中随机选择
+    everyone = np.arange(couriers)
+    city_couriers = [np.flatnonzero(courier_city == city) for city in range(cities)]
+    city_couriers = [members if len(members) else everyone for members in city_couriers]
+
+    counts = {'users': users + couriers}
+    with open_writer(out_dir, 'orders', fmt) as order_writer, \
+            open_writer(out_dir, 'packages', fmt) as package_writer, \
+            open_writer(out_dir, 'deliveries', fmt) as delivery_writer, \
+            click.progressbar(length=orders, label='生成订单', file=click.get_text_stream('stderr')) as progress:
+        for start in range(0, orders, CHUNK_SIZE):
+            count = min(CHUNK_SIZE, orders - start)
+            for order_id, order, package, delivery in order_chunk(rng, now, start, count, users, senders,
+                                                                  user_city, homes, city_couriers, days):
+                order_writer.add(order_id, order)
+                package_writer.add(order_id, package)
+                if delivery is not None:
+                    delivery_writer.add(order_id, delivery)
+            progress.update(count)
+        counts.update(orders=order_writer.count, packages=package_writer.count, deliveries=delivery_writer.count)
+
+    elapsed = time.perf_counter() - start_time
+    suffix = '.snap' if fmt == 'binary' else '.json'
+    for name, count in counts.items():
+        size = os.path.getsize(os.path.join(out_dir, name + suffix))
+        click.echo(f"{name + suffix:<18}{count:>12} 条记录 {size / 1e6:>10.1f} MB")
+    total = sum(counts.values())
+    click.echo(f"合计 {total} 条记录, 用时 {elapsed:.1f}s ({total / elapsed:.0f} 条/秒)")
+
+if __name__ == '__main__':
+    generate()
@@ -2,16 +2,30 @@ import re
 import sys
 import threading
 import atexit
+import bisect
+import itertools
+import functools
+import multiprocessing
 from readerwriterlock import rwlock
-from flask import Flask, request, jsonify
-from datetime import datetime
+from flask import Flask, request, jsonify, Response
+from datetime import datetime, timedelta
 from flasgger import Swagger
 import json
 from jsonpath_ng import jsonpath, parse
 from enum import Enum
 import os
-from test2 import GET_task_path
+import time
 import numpy as np
+from checkpoint import Checkpointer
+from binstore import open_snapshot
+from archive import Archive
+from stats import PackageStats, DeliveryStats, NotificationSummaries, to_datetime
+from analytics import AnalyticsEngine
+from events import EventBus, sse_stream
+from profiling import timed_solve, save_profile, profile_path
+from memstats import MemoryMonitor
+from presence import PresenceTracker
+from singleflight import SingleFlight
 import logging
 app = Flask(__name__)
 swagger = Swagger(app)
@@ -26,7 +40,15 @@ def load_json(path):
         return {}
     with open(file_path, 'r') as file:
         return json.load(file)
+# 快照格式: json(默认) 或 binary(.snap,mmap 按需解码,见 binstore.py)
+SNAPSHOT_FORMAT = os.environ.get('SNAPSHOT_FORMAT', 'json')
+def load_collection(path):
+    if SNAPSHOT_FORMAT == 'binary' and os.path.exists(path + '.snap'):
+        logger.info(f"Mapped binary snapshot {path}.snap")
+        return open_snapshot(path + '.snap')
+    return load_json(path)
 # 模拟数据库
+LOCK_TIMEOUT = 5  # 获取读写锁的最长等待时间(秒),超时返回 500
 user_lock = rwlock.RWLockFairD()  #用户读写锁
 users = {}# 用户数据 json
 
@@ -39,26 +61,175 @@ deliveries = {}# 配送任务数据 json
 orders_lock = rwlock.RWLockFairD() #订单读写锁
 orders = {}# 订单数据 json
 
+# 收件人 -> [(序号, 订单ID)] 的索引,按序号递增,用于分页游标;由 orders_lock 保护
+receiver_index = {}
+order_seq = {}# 订单ID -> 序号
+order_seq_counter = itertools.count(1)
+ORDERS_PAGE_SIZE = 100 # 默认每页订单数
+ORDERS_PAGE_MAX = 1000 # 单页订单数上限
+
 # 缓存每个快递员当天的任务路径和相关信息
 cached_tasks = {}
 
-# 在应用程序退出时执行的操作
-def save_json(path, data):
-    file_path = path + '.json'
-    # 将所有 Order 对象转换为字典格式
-    serializable_data = {k: (v.to_dict() if hasattr(v, 'to_dict') else v) for k, v in data.items()}
-    try:
-        with open(file_path, 'w') as file:  # 使用 'w' 模式打开文件，确保覆写文件内容
-            json.dump(serializable_data, file, indent=4)
-        logger.info(f"Saved JSON data to {file_path}")
-    except Exception as e:
-        logger.error(f"An error occurred while saving JSON to {file_path}: {e}")
+# 同一快递员当天的并发分配请求(重复点击、超时重试)合并为一次路线计算
+route_flight = SingleFlight()
+
+# 在线状态(登录/心跳续期,超时视为离线),与 users 分开保存,不占用 user_lock
+presence = PresenceTracker()
+
+# 已完成/已取消订单与已送达配送任务的冷存储,只追加写入,仍可按ID查询
+order_archive = Archive('orders.archive')
+delivery_archive = Archive('deliveries.archive')
+ARCHIVE_MAX_AGE_DAYS = float(os.environ.get('ARCHIVE_MAX_AGE_DAYS', 7))
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 3600))
+
+# 报表计数器,在写路径中增量维护(已归档的记录仍计入)
+package_stats = PackageStats()
+delivery_stats = DeliveryStats()
+# 按小时/天分桶的状态变化分析,随 history 追加增量更新
+analytics = AnalyticsEngine()
+# 登录通知用的按用户/按天计数(与上面的报表计数一样是进程内的,多进程部署下相关接口不可用)
+notification_summaries = NotificationSummaries()
+# 推送给用户/快递员的状态变化事件(SSE)
+event_bus = EventBus()
+
+def record_order_transition(order, old_status, new_status, at):
+    """订单 history 追加一条后调用,更新各增量统计;old_status 为 None 表示新建(调用方持有 orders_lock 写锁)"""
+    analytics.record('order', order, old_status, new_status, at)
+    notification_summaries.on_order_transition(order, old_status, new_status, at)
+    event_bus.publish((order['receiver_name'], order['sender_name']), 'order', {'order_id': order['order_id'], 'status': new_status, 'previous_status': old_status, 'at': at})
+def record_delivery_transition(delivery, old_status, new_status, at):
+    """配送任务 history 追加一条后调用(调用方持有 deliveries_lock 写锁)"""
+    if old_status is None:
+        delivery_stats.on_create(delivery)
+    else:
+        delivery_stats.on_transition(delivery, old_status, new_status, at)
+    analytics.record('delivery', delivery, old_status, new_status, at)
+    notification_summaries.on_delivery_transition(delivery, old_status, new_status, at)
+    event_bus.publish((delivery['courier_name'],), 'delivery', {'delivery_id': delivery['delivery_id'], 'package_id': delivery['package_id'], 'status': new_status, 'previous_status': old_status, 'at': at})
+
+# 路由计算依赖 sklearn / OR-Tools,加载需要数秒,首次分配任务时才导入
+routing_import_lock = threading.Lock()
+task_path_solver = None
+def get_task_path_solver():
+    global task_path_solver
+    if task_path_solver is None:
+        with routing_import_lock:
+            if task_path_solver is None:
+                start_time = time.time()
+                from test2 import GET_task_path, start_leaf_pool
+                from distance import get_distance_provider
+                provider = get_distance_provider()  # 路网模式下同时加载路网文件
+                start_leaf_pool()
+                task_path_solver = GET_task_path
+                logger.info(f"Routing stack loaded in {time.time() - start_time:.2f}s (distance: {provider.name})")
+    return task_path_solver
+def warm_up_routing():
+    """启动后在后台线程预加载路由依赖,不阻塞服务启动"""
+    threading.Thread(target=get_task_path_solver, name='routing-warmup', daemon=True).start()
+
+def index_order(order_id, order):
+    """将订单加入收件人索引(调用方需持有 orders_lock 写锁);共享存储自带索引,无需维护"""
+    if order_id in order_seq or hasattr(orders, 'page_by'):
+        return
+    seq = next(order_seq_counter)
+    order_seq[order_id] = seq
+    receiver_index.setdefault(str(order['receiver_name']), []).append((seq, order_id))
+def unindex_order(order_id, order):
+    """将订单移出收件人索引(调用方需持有 orders_lock 写锁)"""
+    seq = order_seq.pop(order_id, None)
+    if seq is None:
+        return
+    entries = receiver_index.get(str(order['receiver_name']), [])
+    pos = bisect.bisect_left(entries, seq, key=lambda entry: entry[0])
+    if pos < len(entries) and entries[pos][0] == seq:
+        del entries[pos]
+    if not entries:
+        receiver_index.pop(str(order['receiver_name']), None)
+def build_order_indexes():
+    """从 orders 全量重建索引,用于启动加载数据之后"""
+    if hasattr(orders, 'page_by'):
+        return
+    receiver_index.clear()
+    order_seq.clear()
+    # 二进制快照直接读 receiver_name 列,不解码订单
+    receiver_names = orders.iter_field('receiver_name') if hasattr(orders, 'iter_field') else ((k, v['receiver_name']) for k, v in orders.items())
+    for order_id, receiver_name in receiver_names:
+        index_order(order_id, {'receiver_name': receiver_name})
+def ids_with_status(collection, status):
+    """状态为 status 的记录ID;二进制快照用状态列筛选,只解码命中的记录(调用方需持有对应的锁)"""
+    if hasattr(collection, 'keys_with'):
+        return collection.keys_with('status', status)
+    return [record_id for record_id, record in collection.items() if record['status'] == status]
+def page_receiver_orders(receiver_name, cursor, limit):
+    """返回 (订单列表, 下一页游标),游标为上一页最后一个订单的序号(调用方需持有 orders_lock 读锁)"""
+    if hasattr(orders, 'page_by'):
+        return orders.page_by('receiver_name', receiver_name, cursor, limit)
+    entries = receiver_index.get(str(receiver_name), [])
+    start = bisect.bisect_right(entries, cursor, key=lambda entry: entry[0])
+    page = entries[start:start + limit]
+    result = [orders[order_id] for _, order_id in page if order_id in orders]
+    next_cursor = page[-1][0] if start + limit < len(entries) else None
+    return result, next_cursor
+
+# 状态存储: memory(默认,单进程,JSON/二进制快照) 或 sqlite(多进程部署,见 wsgi.py)
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'memory')
+STATE_DB = os.environ.get('STATE_DB', 'state.db')
+LEADER_RETRY_INTERVAL = float(os.environ.get('LEADER_RETRY_INTERVAL', 30))
+
+def single_process_only(view):
+    """报表计数、分析分桶、登录通知计数和 SSE 事件总线是进程内状态,多进程部署下各 worker 互不一致,直接拒绝"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if STATE_BACKEND == 'sqlite':
+            return jsonify({'success': False, 'message': '多进程部署下不可用,请使用单进程模式'}), 503
+        return view(*args, **kwargs)
+    return wrapper
 
+# 后台周期快照,重启时最多丢失一个周期的数据
+CHECKPOINT_INTERVAL = float(os.environ.get('CHECKPOINT_INTERVAL', 30))
+checkpointer = Checkpointer({
+    'orders': (orders_lock, lambda: orders),
+    'deliveries': (deliveries_lock, lambda: deliveries),
+    'packages': (packages_lock, lambda: packages),
+    'users': (user_lock, lambda: users),
+}, interval=CHECKPOINT_INTERVAL, fmt=SNAPSHOT_FORMAT, derived={
+    # 二进制快照随记录保存依赖该集合的计数器,启动时恢复,不必解码全部记录回放 history
+    'orders': lambda: {'analytics': analytics.export_state('order'),
+                       'notifications': notification_summaries.export_state('order')},
+    'deliveries': lambda: {'delivery_stats': delivery_stats.export_state(),
+                           'analytics': analytics.export_state('delivery'),
+                           'notifications': notification_summaries.export_state('delivery')},
+})
+
+# 内存占用统计: 各集合与缓存的近似大小,后台周期采样得到增长趋势
+def loaded_distance_providers():
+    distance = sys.modules.get('distance')  # 路由依赖尚未加载时不导入
+    return distance.loaded_providers() if distance else {}
+memory_monitor = MemoryMonitor({
+    'orders': (lambda: orders_lock, lambda: orders),
+    'deliveries': (lambda: deliveries_lock, lambda: deliveries),
+    'packages': (lambda: packages_lock, lambda: packages),
+    'users': (lambda: user_lock, lambda: users),
+    'cached_tasks': (None, lambda: cached_tasks),
+    'presence': (None, lambda: presence.store),
+    'receiver_index': (lambda: orders_lock, lambda: receiver_index),
+    'order_seq': (lambda: orders_lock, lambda: order_seq),
+    'archive_index': (None, lambda: (order_archive, delivery_archive)),
+    'report_stats': (None, lambda: (package_stats, delivery_stats, notification_summaries)),
+    'analytics': (None, lambda: analytics),
+    'event_bus': (None, lambda: event_bus),
+    'distance_cache': (None, loaded_distance_providers),
+})
+
+# 在应用程序退出时执行的操作
 def save_data():
-    save_json('orders',orders)
-    save_json('deliveries',deliveries)
-    save_json('packages',packages)
-    save_json('users',users)
+    if multiprocessing.parent_process() is not None:
+        return  # spawn 的叶子进程会重新导入本模块,其中的集合是空的,不能覆盖快照
+    if STATE_BACKEND == 'sqlite':
+        return  # 共享存储每次写锁释放时已提交
+    checkpointer.stop()
+    checkpointer.snapshot_all()
     print("数据已保存")
 
 # 注册退出时执行的操作
@@ -132,7 +303,7 @@ class Delivery:
             'history': [(status.value, timestamp.isoformat()) for status, timestamp in self.history]
         }
 class Order:
-    def __init__(self, order_id, sender_name, receiver_name, sender_address, receiver_address,package_id,priority,status=OrderState.PLACED):
+    def __init__(self, order_id, sender_name, receiver_name, sender_address, receiver_address,package_id,priority,status=OrderState.PLACED,time_window=None):
         self.order_id = order_id
         self.sender_name = sender_name
         self.receiver_name = receiver_name
@@ -140,6 +311,7 @@ class Order:
         self.receiver_address = receiver_address
         self.package_id = package_id
         self.priority = priority
+        self.time_window = time_window  # [最早送达, 最晚送达] ISO 时间字符串,两端都可为 None
         self.status = status
         self.history =[[status,datetime.now()]]
     def to_dict(self):
@@ -151,62 +323,175 @@ class Order:
             'receiver_address': self.receiver_address,
             'package_id': self.package_id,
             'priority': self.priority,
+            'time_window': self.time_window,
             'status': self.status.value,
             'history': [(status.value, timestamp.isoformat()) for status, timestamp in self.history]  # 处理为列表
         }
+def invalid_status(states, status):
+    """状态不属于 states 时返回 400 结果,避免写入未知状态导致各统计计数错乱"""
+    if status not in {state.value for state in states}:
+        return {'success': False, 'message': f'无效的状态: {status}'}, 400
+    return None
+def apply_package_status(package_id, status, now):
+    """修改单个包裹状态(调用方需持有 packages_lock 写锁)"""
+    rejected = invalid_status(PackageState, status)
+    if rejected:
+        return rejected
+    package = packages.get(package_id)
+    if package:
+        package_stats.on_transition(package['status'], status)
+        package['status'] = status
+        package['history'].append((status, now))
+        return {'success': True, 'message': '包裹状态更新成功'}, 200
+    else:
+        return {'success': False, 'message': '包裹未找到'}, 404
+def apply_order_status(order_id, status, now):
+    """修改单个订单状态(调用方需持有 orders_lock 写锁)"""
+    rejected = invalid_status(OrderState, status)
+    if rejected:
+        return rejected
+    order = orders.get(order_id)
+    if order:
+        old_status = order['status']
+        order['status'] = status
+        order['history'].append((status, now))
+        record_order_transition(order, old_status, status, now)
+        return {'success': True, 'message': '包裹状态更新成功'}, 200
+    else:
+        return {'success': False, 'message': '包裹未找到'}, 404
+def apply_delivery_status(delivery_id, status, now):
+    """修改单个配送任务状态(调用方需持有 deliveries_lock 写锁);status 为空时沿用当前状态"""
+    rejected = status and invalid_status(DeliveryState, status)
+    if rejected:
+        return rejected
+    delivery = deliveries.get(delivery_id)
+    if delivery:
+        old_status = delivery['status']
+        delivery['status'] = status or delivery['status']
+        delivery['history'].append((delivery['status'], now))
+        record_delivery_transition(delivery, old_status, delivery['status'], now)
+        return {'success': True, 'message': '配送状态更新成功'}, 200
+    return {'success': False, 'message': '配送任务未找到'}, 404
 def update_package_status_logic(package_id, status):
     lock = packages_lock.gen_wlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return {'success': False, 'message': '获取写锁超时'}, 500
 
     try:
-        package = packages.get(package_id)
-        if package:
-            package['status'] = status
-            package['history'].append((status, datetime.now()))
-            return {'success': True, 'message': '包裹状态更新成功'}, 200
-        else:
-            return {'success': False, 'message': '包裹未找到'}, 404
+        return apply_package_status(package_id, status, datetime.now())
     finally:
         lock.release()
 def update_order_status_logic(order_id, status):
     lock = orders_lock.gen_wlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return {'success': False, 'message': '获取写锁超时'}, 500
 
     try:
-        order = orders.get(order_id)
-        if order:
-            order['status'] = status
-            order['history'].append((status, datetime.now()))
-            return {'success': True, 'message': '包裹状态更新成功'}, 200
-        else:
-            return {'success': False, 'message': '包裹未找到'}, 404
+        return apply_order_status(order_id, status, datetime.now())
+    finally:
+        lock.release()
+BULK_MAX_ITEMS = 1000  # 单次批量更新的上限,限制一次持有写锁的时间
+def bulk_update_status(rw_lock, items, apply):
+    """在一次写锁内依次更新多条记录的状态,返回 (响应体, 状态码),每条记录单独给出结果"""
+    if not isinstance(items, list) or not items:
+        return {'success': False, 'message': '请求体应为非空的 [{id, status}] 列表'}, 400
+    if len(items) > BULK_MAX_ITEMS:
+        return {'success': False, 'message': f'单次最多更新 {BULK_MAX_ITEMS} 条'}, 400
+    results = []
+    lock = rw_lock.gen_wlock()
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
+        return {'success': False, 'message': '获取写锁超时'}, 500
+    try:
+        now = datetime.now()
+        for item in items:
+            if not isinstance(item, dict) or not item.get('id') or not item.get('status'):
+                results.append({'id': item.get('id') if isinstance(item, dict) else None, 'success': False,
+                                'status_code': 400, 'message': '缺少ID或状态信息'})
+                continue
+            result, status_code = apply(str(item['id']), item['status'], now)
+            results.append({'id': item['id'], 'success': result['success'], 'status_code': status_code, 'message': result['message']})
     finally:
         lock.release()
+    updated = sum(result['success'] for result in results)
+    return {'success': True, 'updated': updated, 'failed': len(results) - updated, 'results': results}, 200
 def Create_Delivery(delivery_id,package_id,courier_id):
     lock = deliveries_lock.gen_wlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return TimeoutError()
     try:
-        if delivery_id in deliveries:
+        if delivery_id in deliveries or delivery_id in delivery_archive:
             return jsonify({'success': False, 'message': '配送任务已存在'}), 400
         delivery = Delivery(delivery_id, package_id, courier_id)
         deliveries[delivery_id] = delivery.to_dict()
+        record_delivery_transition(deliveries[delivery_id], None, delivery.status, delivery.history[0][1])
     finally:
         lock.release()
-def Create_Order(order_id, sender_name, receiver_name, sender_address, receiver_address, package_id,priority=0):
+def parse_time_window(value):
+    """校验 [最早, 最晚] 时间窗并统一为 ISO 字符串,空值返回 None"""
+    if not value:
+        return None
+    if len(value) != 2:
+        raise ValueError('时间窗应为 [最早, 最晚]')
+    earliest, latest = (datetime.fromisoformat(end) if end else None for end in value)
+    if earliest and latest and earliest > latest:
+        raise ValueError('时间窗起点晚于终点')
+    return [end.isoformat() if end else None for end in (earliest, latest)]
+def Create_Order(order_id, sender_name, receiver_name, sender_address, receiver_address, package_id,priority=0,time_window=None):
     lock = orders_lock.gen_wlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         raise TimeoutError("获取写锁超时")
     try:
-        if order_id in orders:
+        if order_id in orders or order_id in order_archive:
             return {'success': False, 'message': '订单已存在'}, 400
-        order = Order(order_id, sender_name, receiver_name, sender_address, receiver_address, package_id,priority)
+        order = Order(order_id, sender_name, receiver_name, sender_address, receiver_address, package_id,priority,time_window=time_window)
         orders[order_id] = order.to_dict()
+        index_order(order_id, orders[order_id])
+        record_order_transition(orders[order_id], None, order.status, order.history[0][1])
         return {'success': True, 'message': '订单创建成功'}, 201
     finally:
         lock.release()
+def last_transition_time(record):
+    """记录最后一次状态变化的时间,history 中既可能是 datetime 也可能是 ISO 字符串"""
+    return to_datetime(record['history'][-1][1]) if record.get('history') else None
+def archive_collection(collection, lock, archive, terminal_states, cutoff, on_remove=None):
+    """把终态且最后变化早于 cutoff 的记录追加到归档文件,再从内存集合中删除"""
+    wlock = lock.gen_wlock()
+    if not wlock.acquire(timeout=LOCK_TIMEOUT):
+        raise TimeoutError("获取写锁超时")
+    try:
+        candidates = []
+        for state in terminal_states:
+            for record_id in ids_with_status(collection, state.value):
+                record = collection[record_id]
+                changed_at = last_transition_time(record)
+                if changed_at is not None and changed_at < cutoff:
+                    candidates.append((record_id, record))
+        if not candidates:
+            return 0
+        archive.append(candidates)  # 先落盘再删除,崩溃时最多重复归档
+        for record_id, record in candidates:
+            del collection[record_id]
+            if on_remove:
+                on_remove(record_id, record)
+        return len(candidates)
+    finally:
+        wlock.release()
+def archive_terminal_records(max_age_days=None):
+    max_age_days = ARCHIVE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    archived_orders = archive_collection(orders, orders_lock, order_archive, (OrderState.COMPLETED, OrderState.CANCELED), cutoff, on_remove=unindex_order)
+    archived_deliveries = archive_collection(deliveries, deliveries_lock, delivery_archive, (DeliveryState.DELIVERED, DeliveryState.RECEIVED), cutoff)
+    logger.info(f"Archived {archived_orders} orders and {archived_deliveries} deliveries")
+    return {'orders': archived_orders, 'deliveries': archived_deliveries}
+archiver_stop = threading.Event()
+def run_archiver():
+    while not archiver_stop.wait(ARCHIVE_INTERVAL):
+        try:
+            archive_terminal_records()
+        except Exception as e:
+            logger.error(f"An error occurred while archiving: {e}")
+def start_archiver():
+    threading.Thread(target=run_archiver, name='archiver', daemon=True).start()
 # 用户管理
 @app.route('/user/register', methods=['POST'])
 def register_user():
@@ -241,7 +526,7 @@ def register_user():
         return jsonify({'success': False, 'message': '无效的密码。只允许字母、数字和下划线。'}), 400
 
     lock = user_lock.gen_wlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({'success': False, 'mes sage': '获取写锁超时'}), 500
 
     try:
@@ -279,27 +564,93 @@ def login_user():
     password = data.get('password')
 
     lock = user_lock.gen_rlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({'success': False, 'message': '获取读锁超时'}), 500
 
     try:
         user = users.get(username)
-        print(f'{username} has logged in')
-        if user and user['password'] == password:
-            lock.release()
-            lock = user_lock.gen_wlock()
-            if not lock.acquire(timeout=5):
-                return jsonify({'success': False, 'message': '获取写锁超时'}), 500
-            try:
-                user['online'] = True
-            finally:
-                lock.release()
-                return jsonify({'success': True, 'message': '登录成功'}), 200
-        else:
-            lock.release()
-            return jsonify({'success': False, 'message': '无效的凭证(密码错误)'}), 401
-    except:
-        return jsonify({'success': False, 'message': '用户未找到'}), 404
+        valid = bool(user) and user['password'] == password
+        role = user['role'] if valid else None
+    finally:
+        lock.release()
+    if not valid:
+        return jsonify({'success': False, 'message': '无效的凭证(密码错误)'}), 401
+    print(f'{username} has logged in')
+    # 在线状态单独记录,不获取 users 写锁;客户端应在 TTL 内发送心跳
+    presence.touch(username, role)
+    return jsonify({'success': True, 'message': '登录成功', 'heartbeat_interval': presence.ttl / 3}), 200
+@app.route('/user/<username>/heartbeat', methods=['POST'])
+def user_heartbeat(username):
+    """
+    在线心跳,续期在线状态
+    ---
+    tags: [用户管理]
+    parameters:
+      - in: path
+        name: username
+        required: true
+        type: string
+    responses:
+      200: {description: 续期成功,返回本次到期时间}
+      404: {description: 未登录或已登出,需要重新登录}
+    """
+    entry = presence.touch(username)
+    if entry is None:
+        return jsonify({'success': False, 'message': '未登录或已登出'}), 404
+    return jsonify({'success': True, 'expires_at': entry['expires_at']}), 200
+@app.route('/user/<username>/logout', methods=['POST'])
+def logout_user(username):
+    """
+    登出,立即清除在线状态
+    ---
+    tags: [用户管理]
+    parameters:
+      - in: path
+        name: username
+        required: true
+        type: string
+    responses:
+      200: {description: 登出成功}
+    """
+    presence.remove(username)
+    return jsonify({'success': True, 'message': '登出成功'}), 200
+@app.route('/presence', methods=['GET'])
+def get_presence():
+    """
+    批量查询在线用户
+    ---
+    tags: [用户管理]
+    parameters:
+      - in: query
+        name: role
+        type: string
+        enum: [user, courier]
+      - in: query
+        name: usernames
+        type: string
+        description: 逗号分隔的用户名,只返回其中在线的用户;缺省时返回全部在线用户
+    responses:
+      200: {description: 在线用户及最近心跳时间}
+    """
+    usernames = request.args.get('usernames')
+    online = presence.online(request.args.get('role'), usernames.split(',') if usernames else None)
+    return jsonify({'success': True, 'online': online, 'count': len(online)}), 200
+@app.route('/couriers/available', methods=['GET'])
+def available_couriers():
+    """
+    可派单的快递员: 在线的快递员,并标出当天是否已分配路线
+    ---
+    tags: [配送管理]
+    responses:
+      200: {description: 在线快递员列表,未分配路线的排在前面}
+    """
+    today = datetime.now().date().isoformat()
+    couriers = presence.online(UserRole.COURIER.value)
+    for courier in couriers:
+        task = cached_tasks.get(courier['username'])
+        courier['assigned_today'] = bool(task) and task['date'] == today
+    couriers.sort(key=lambda courier: (courier['assigned_today'], -courier['last_seen']))
+    return jsonify({'success': True, 'couriers': couriers, 'count': len(couriers)}), 200
 @app.route('/user/<username>', methods=['GET'])
 def get_user_info(username):
     """
@@ -316,14 +667,14 @@ def get_user_info(username):
       404: {description: 用户未找到}
     """
     lock = user_lock.gen_rlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({'success': False, 'message': '获取读锁超时'}), 500
 
     try:
         user_data = users.get(username)
         if user_data:
-            # 确保 user_data 是一个字典
-            return jsonify({'success': True, 'user': user_data}), 200
+            # 在线状态以心跳记录为准
+            return jsonify({'success': True, 'user': {**user_data, 'online': presence.is_online(username)}}), 200
     finally:
         lock.release()
 
@@ -398,7 +749,7 @@ def update_user_info(username):
     data = request.get_json()
 
     lock = user_lock.gen_wlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({'success': False, 'message': '获取写锁超时'}), 500
     try:
         user_data = users.get(username)
@@ -414,6 +765,7 @@ def update_user_info(username):
 
             # 更新用户字典
             users[username] = user.to_dict()
+            presence.set_role(username, user.role)
 
             return jsonify({'success': True, 'message': '用户信息更新成功'}), 200
     finally:
@@ -446,14 +798,15 @@ def create_package():
     package_id = data.get('package_id')
 
     lock = packages_lock.gen_wlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({'success': False, 'message': '获取写锁超时'}), 500
 
     try:
         if package_id in packages:
             return jsonify({'success': False, 'message': '包裹已存在'}), 400
-        package = Package(package_id, data.get('sender'), data.get('receiver')).to_dict()
+        package = Package(package_id, data.get('sender'), data.get('receiver'))
         packages[package_id] = package.to_dict()
+        package_stats.on_create(packages[package_id])
     finally:
         lock.release()
 
@@ -474,7 +827,7 @@ def get_package_status(package_id):
       404: {description: 包裹未找到}
     """
     lock = packages_lock.gen_rlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({'success': False, 'message': '获取读锁超时'}), 500
 
     try:
@@ -506,6 +859,7 @@ def update_package_status(package_id):
     responses:
       200: {description: 包裹状态更新成功}
       404: {description: 包裹未找到}
+      400: {description: 无效的状态(应为 uncounted / counted / dispatched)}
     """
     data = request.get_json()
     status = data.get('status')
@@ -515,11 +869,36 @@ def update_package_status(package_id):
 
     result, status_code = update_package_status_logic(package_id, status)
     return jsonify(result), status_code
+@app.route('/packages/status', methods=['PUT'])
+def bulk_update_package_status():
+    """
+    批量更新包裹状态(一次写锁内完成)
+    ---
+    tags: [包裹管理]
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: array
+          items:
+            type: object
+            required: [id, status]
+            properties:
+              id: {type: string}
+              status: {type: string}
+    responses:
+      200: {description: 已处理,results 中给出每条包裹的结果}
+      400: {description: 请求体无效或超过单次上限}
+      500: {description: 获取写锁超时}
+    """
+    result, status_code = bulk_update_status(packages_lock, request.get_json(silent=True), apply_package_status)
+    return jsonify(result), status_code
 #订单管理
 @app.route('/orders/receiver/<receiver_name>', methods=['GET'])
 def get_orders_by_receiver(receiver_name):
     """
-    获取某收件人的所有订单
+    获取某收件人的订单(游标分页,或 NDJSON 流式返回)
     ---
     tags: [订单管理]
     parameters:
@@ -527,25 +906,63 @@ def get_orders_by_receiver(receiver_name):
         name: receiver_name
         required: true
         type: string
+      - in: query
+        name: cursor
+        type: integer
+        description: 上一页返回的 next_cursor,缺省从头开始
+      - in: query
+        name: limit
+        type: integer
+        description: 每页订单数,默认100,最大1000
+      - in: query
+        name: stream
+        type: boolean
+        description: 为 true 时以 application/x-ndjson 逐行返回全部订单,每批之间释放读锁
     responses:
       200: {description: 成功获取订单列表}
+      400: {description: 分页参数无效}
       404: {description: 未找到订单}
     """
-    
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = int(request.args.get('limit', ORDERS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'success': False, 'message': '无效的分页参数'}), 400
+    if limit <= 0:
+        return jsonify({'success': False, 'message': '无效的分页参数'}), 400
+    limit = min(limit, ORDERS_PAGE_MAX)
+
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return Response(stream_receiver_orders(receiver_name, cursor, limit), mimetype='application/x-ndjson')
+
     lock = orders_lock.gen_rlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({'success': False, 'message': '获取读锁超时'}), 500
     try:
-        receiver_orders = [
-            order for order in orders.values()
-            if order['receiver_name'] == receiver_name
-        ]
-        if receiver_orders:
-            return jsonify({'success': True, 'orders': receiver_orders}), 200
+        receiver_orders, next_cursor = page_receiver_orders(receiver_name, cursor, limit)
     finally:
         lock.release()
 
+    if receiver_orders or cursor:
+        return jsonify({'success': True, 'orders': receiver_orders, 'next_cursor': next_cursor}), 200
     return jsonify({'success': False, 'message': '未找到订单'}), 404
+def stream_receiver_orders(receiver_name, cursor, chunk_size):
+    """按批生成 NDJSON 行,每批只在拷贝时持有读锁,序列化和发送在锁外进行"""
+    while True:
+        lock = orders_lock.gen_rlock()
+        if not lock.acquire(timeout=LOCK_TIMEOUT):
+            yield json.dumps({'success': False, 'message': '获取读锁超时', 'next_cursor': cursor}, ensure_ascii=False) + '\n'
+            return
+        try:
+            chunk, next_cursor = page_receiver_orders(receiver_name, cursor, chunk_size)
+            chunk = [{**order, 'history': list(order['history'])} for order in chunk]
+        finally:
+            lock.release()
+        for order in chunk:
+            yield json.dumps(order, ensure_ascii=False, default=str) + '\n'
+        if next_cursor is None:
+            return
+        cursor = next_cursor
 @app.route('/order', methods=['POST'])
 def create_order():
     """
@@ -566,10 +983,14 @@ def create_order():
             sender_address: {type: string}
             receiver_address: {type: string}
             package_id: {type: string}
-            priority: {type: integer}
+            priority: {type: integer, description: 优先级,越大越先配送,默认0}
+            time_window:
+              type: array
+              items: {type: string}
+              description: "[最早送达, 最晚送达] ISO 时间,任一端可为 null"
     responses:
       201: {description: 订单创建成功}
-      400: {description: 订单已存在}
+      400: {description: 订单已存在或参数无效}
     """
     data = request.get_json()
     order_id = data.get('order_id')
@@ -578,11 +999,16 @@ def create_order():
     sender_address = data.get('sender_address')
     receiver_address = data.get('receiver_address')
     package_id = data.get('package_id')
-    priority = data.get('priority')
+    priority = data.get('priority', 0)
 
     if not order_id or not sender_name or not receiver_name or not sender_address or not receiver_address or not package_id:
         return jsonify({'success': False, 'message': '缺少必要的订单信息'}), 400
-    Create_Order(order_id, sender_name, receiver_name, sender_address, receiver_address, package_id,priority)
+    try:
+        priority = int(priority or 0)
+        time_window = parse_time_window(data.get('time_window'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '无效的优先级或时间窗'}), 400
+    Create_Order(order_id, sender_name, receiver_name, sender_address, receiver_address, package_id,priority,time_window)
     
     return jsonify({'success': True, 'message': '订单创建成功'}), 201
 @app.route('/order/<order_id>', methods=['PUT'])
@@ -606,6 +1032,7 @@ def update_order_status(order_id):
     responses:
       200: {description: 订单状态更新成功}
       404: {description: 订单未找到}
+      400: {description: 缺少或无效的状态(应为 placed / received / completed / canceled)}
     """
     data = request.get_json()
     status = data.get('status')
@@ -615,6 +1042,31 @@ def update_order_status(order_id):
 
     result, status_code = update_order_status_logic(order_id, status)
     return jsonify(result), status_code
+@app.route('/orders/status', methods=['PUT'])
+def bulk_update_order_status():
+    """
+    批量更新订单状态(一次写锁内完成)
+    ---
+    tags: [订单管理]
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: array
+          items:
+            type: object
+            required: [id, status]
+            properties:
+              id: {type: string}
+              status: {type: string}
+    responses:
+      200: {description: 已处理,results 中给出每条订单的结果}
+      400: {description: 请求体无效或超过单次上限}
+      500: {description: 获取写锁超时}
+    """
+    result, status_code = bulk_update_status(orders_lock, request.get_json(silent=True), apply_order_status)
+    return jsonify(result), status_code
 @app.route('/order/<order_id>', methods=['GET'])
 def get_order_info(order_id):
     """
@@ -651,18 +1103,21 @@ def get_order_info(order_id):
         description: 订单未找到
     """
     lock = orders_lock.gen_rlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({"error": "获取读锁超时"}), 500
 
     try:
         order = orders.get(order_id)
         if order:
             return jsonify(order), 200
-        else:
-            return jsonify({"error": "订单未找到"}), 404
     finally:
         lock.release()
 
+    order = order_archive.get(order_id)
+    if order:
+        return jsonify(order), 200
+    return jsonify({"error": "订单未找到"}), 404
+
 # 配送管理
 @app.route('/delivery/assign/<username>', methods=['POST'])
 def assign_delivery(username):
@@ -675,64 +1130,149 @@ def assign_delivery(username):
         name: username
         required: true
         type: string
+      - in: query
+        name: profile
+        type: boolean
+        description: 为 true 时在采样分析器下计算路线,响应中返回分析结果的下载地址(命中当天缓存时不重新计算)
     responses:
-      201: {description: 配送任务分配成功} 
+      201: {description: 配送任务分配成功,timings 为路线计算各阶段耗时;coalesced 为 true 表示共享了同时进行的计算} 
       400: {description: 配送任务已存在}
     """
     today = datetime.now().date()
+    profile = request.args.get('profile', '').lower() in ('1', 'true', 'yes')
 
     if not username:
         return jsonify({'success': False, 'message': '缺少快递员信息'}), 400
 
     # 检查是否已经生成过该快递员当天的任务
-    if username in cached_tasks and cached_tasks[username]['date'] == today:
-        return jsonify({
-            'success': True,
-            'message': '配送任务分配成功',
-            'path': cached_tasks[username]['total_path'],
-            'length': cached_tasks[username]['total_length'],
-            'clusters_path': cached_tasks[username]['clusters_path'],
-            'clusters_length': cached_tasks[username]['clusters_length']
-        }), 201
+    cached = cached_assignment(username, today)
+    if cached:
+        return jsonify(cached), 201
+    (body, code), shared = route_flight.do((username, today.isoformat()), plan_route, username, today, profile)
+    return jsonify({**body, 'coalesced': True} if shared else body), code
+def plan_route(username, today, profile=False):
+    """计算并落实快递员当天的路线,返回 (响应体, 状态码);由 route_flight 保证同一快递员同时只有一次计算"""
+    # 前一次合并的计算可能刚刚完成,先查缓存
+    cached = cached_assignment(username, today)
+    if cached:
+        return cached, 201
     lock = orders_lock.gen_rlock()
-    if not lock.acquire(timeout=5):
-        return jsonify({'success': False, 'message': '获取读锁超时'}), 500
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
+        return {'success': False, 'message': '获取读锁超时'}, 500
         
     try:
-        today_orders = [
-            {'order_id': order['order_id'], 'receiver_address': order['receiver_address'], 'status': order['status']}
-            for order in orders.values()
-            if order['status'] == OrderState.RECEIVED.value
-        ]
-        
+        today_orders = assignable_orders()
         coordinates = [order['receiver_address'] for order in today_orders]
-        print(coordinates)
-        total_path, total_length, clusters_path, clusters_length = GET_task_path(coordinates)
-        total_path = list(map(lambda x: today_orders[x]['order_id'], total_path))  # 从下标转换成订单ID
-        for x in total_path:
-            update_package_status_logic(x, PackageState.DISPATCHED)   
-            Create_Delivery(x,x,username) 
-        # 缓存该快递员当天的任务路径和相关信息
-        cached_tasks[username] = {
-            'date': today,
-            'total_path': total_path,
-            'total_length': total_length,
-            'clusters_path': clusters_path,
-            'clusters_length': clusters_length
-        }
+        result, timings, folded = timed_solve(get_task_path_solver(), coordinates,
+                                              route_options(today_orders, datetime.now()), profile)
+        body = commit_assignment(username, today, today_orders, result)
     finally:
         lock.release()
-    #for order in total_path:
-    #    Create_Delivery(order,order,username)
-    #    pass
-    return jsonify({
+    return {**body, **route_report(username, len(coordinates), timings, folded)}, 201
+def route_report(username, stops, timings, folded=None):
+    """记录一次路线计算的分阶段耗时;带有采样结果时保存下来,返回要并入响应的字段"""
+    stages = ', '.join(f"{name}={ms:.1f}ms" for name, ms in timings['stages_ms'].items())
+    logger.info(f"Route for {username}: {stops} stops in {timings['total_ms']:.1f}ms ({stages})")
+    report = {'timings': timings}
+    if folded is not None:
+        profile_id = save_profile(folded, username)
+        report.update(profile_id=profile_id, profile_url=f'/delivery/profiles/{profile_id}')
+    return report
+@app.route('/delivery/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """
+    下载路线计算的采样分析结果
+    ---
+    tags: [配送管理]
+    parameters:
+      - in: path
+        name: profile_id
+        required: true
+        type: string
+    responses:
+      200: {description: 折叠栈格式(flamegraph.pl / speedscope 可直接打开)}
+      404: {description: 分析结果不存在}
+    """
+    file_path = profile_path(profile_id)
+    if file_path is None or not os.path.exists(file_path):
+        return jsonify({'success': False, 'message': '分析结果不存在'}), 404
+    with open(file_path, 'r') as file:
+        folded = file.read()
+    return Response(folded, mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename={profile_id}.folded'})
+def assignment_response(task):
+    return {
         'success': True,
         'message': '配送任务分配成功',
-        'path': total_path,
-        'length': total_length,
+        'path': task['total_path'],
+        'length': task['total_length'],
+        'clusters_path': task['clusters_path'],
+        'clusters_length': task['clusters_length']
+    }
+def cached_assignment(username, today):
+    """当天已生成过路线时返回缓存的响应体,否则返回 None"""
+    task = cached_tasks.get(username)
+    if task and task['date'] == today.isoformat():
+        return assignment_response(task)
+    return None
+def assignable_orders():
+    """已接入本配送中心、等待分配的订单(调用方需持有 orders_lock 读锁)"""
+    return [
+        {'order_id': order['order_id'], 'receiver_address': order['receiver_address'], 'status': order['status'],
+         'priority': order.get('priority') or 0, 'time_window': order.get('time_window')}
+        for order in (orders[order_id] for order_id in ids_with_status(orders, OrderState.RECEIVED.value))
+    ]
+def route_options(today_orders, now):
+    """GET_task_path 的关键字参数: 订单ID、优先级,以及换算为距出发秒数的时间窗"""
+    def seconds(end):
+        return None if end is None else (to_datetime(end) - now).total_seconds()
+    return {
+        'order_ids': [order['order_id'] for order in today_orders],
+        'priorities': [order['priority'] for order in today_orders],
+        'time_windows': [tuple(seconds(end) for end in order['time_window']) if order['time_window'] else None
+                         for order in today_orders]
+    }
+def still_assignable(order_id):
+    """订单仍为已接入状态且尚未生成配送任务(调用方需持有 orders_lock)"""
+    order = orders.get(order_id)
+    return (order is not None and order['status'] == OrderState.RECEIVED.value
+            and order_id not in deliveries and order_id not in delivery_archive)
+def commit_revalidated_assignment(username, today, today_orders, result):
+    """求解期间没有持有 orders_lock 时使用(asgi.py): 在写锁下重新校验每个订单再落实,返回 (响应体, 状态码)"""
+    lock = orders_lock.gen_wlock()
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
+        return {'success': False, 'message': '获取写锁超时'}, 500
+    try:
+        return commit_assignment(username, today, today_orders, result, revalidate=True), 201
+    finally:
+        lock.release()
+def commit_assignment(username, today, today_orders, result, revalidate=False):
+    """把 GET_task_path 的结果落实为配送任务并缓存,返回响应体;revalidate 时跳过求解期间被取消或已分配的订单"""
+    total_path, total_length, clusters_path, clusters_length = result
+    total_path = list(map(lambda x: today_orders[x]['order_id'], total_path))  # 从下标转换成订单ID
+    skipped = []
+    if revalidate:
+        skipped = [x for x in total_path if not still_assignable(x)]
+        total_path = [x for x in total_path if x not in skipped]
+        if skipped:
+            logger.info(f"Route for {username}: skipped {len(skipped)} orders changed during solve")
+    for x in total_path:
+        update_package_status_logic(x, PackageState.DISPATCHED)   
+        Create_Delivery(x,x,username) 
+    # 缓存该快递员当天的任务路径和相关信息
+    task = {
+        'date': today.isoformat(),  # 共享存储中以字符串保存
+        'total_path': total_path,
+        'total_length': total_length,
         'clusters_path': clusters_path,
         'clusters_length': clusters_length
-    }), 201
+    }
+    cached_tasks[username] = task
+    event_bus.publish((username,), 'route', {'path': total_path, 'length': total_length})
+    body = assignment_response(task)
+    if skipped:
+        body['skipped'] = skipped
+    return body
 @app.route('/delivery/create/', methods=['POST'])
 def create_delivery():
     """
@@ -782,7 +1322,7 @@ def get_delivery_status(delivery_id):
       404: {description: 配送任务未找到}
     """
     lock = deliveries_lock.gen_rlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({'success': False, 'message': '获取读锁超时'}), 500
 
     try:
@@ -792,6 +1332,10 @@ def get_delivery_status(delivery_id):
     finally:
         lock.release()
 
+    delivery = delivery_archive.get(delivery_id)
+    if delivery:
+        return jsonify({'success': True, 'delivery': delivery}), 200
+
     return jsonify({'success': False, 'message': '配送任务未找到'}), 404
 @app.route('/delivery/<delivery_id>', methods=['PUT'])
 def update_delivery_status(delivery_id):
@@ -814,26 +1358,71 @@ def update_delivery_status(delivery_id):
     responses:
       200: {description: 配送状态更新成功}
       404: {description: 配送任务未找到}
+      400: {description: 无效的状态(应为 pending / intransit / delivered / received)}
     """
     data = request.get_json()
 
     lock = deliveries_lock.gen_wlock()
-    if not lock.acquire(timeout=5):
+    if not lock.acquire(timeout=LOCK_TIMEOUT):
         return jsonify({'success': False, 'message': '获取写锁超时'}), 500
 
     try:
-        delivery = deliveries.get(delivery_id)
-        if delivery:
-            delivery['status'] = data.get('status', delivery['status'])
-            delivery['history'].append((delivery['status'], datetime.now()))
-            return jsonify({'success': True, 'message': '配送状态更新成功'}), 200
+        result, status_code = apply_delivery_status(delivery_id, data.get('status'), datetime.now())
     finally:
         lock.release()
-
-    return jsonify({'success': False, 'message': '配送任务未找到'}), 404
+    return jsonify(result), status_code
+@app.route('/deliveries/status', methods=['PUT'])
+def bulk_update_delivery_status():
+    """
+    批量更新配送状态(一次写锁内完成)
+    ---
+    tags: [配送管理]
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: array
+          items:
+            type: object
+            required: [id, status]
+            properties:
+              id: {type: string}
+              status: {type: string}
+    responses:
+      200: {description: 已处理,results 中给出每条配送任务的结果}
+      400: {description: 请求体无效或超过单次上限}
+      500: {description: 获取写锁超时}
+    """
+    result, status_code = bulk_update_status(deliveries_lock, request.get_json(silent=True), apply_delivery_status)
+    return jsonify(result), status_code
 # 通知系统（示例）
+@app.route('/events/<username>', methods=['GET'])
+@single_process_only
+def stream_events(username):
+    """
+    订阅状态变化推送(Server-Sent Events)
+    ---
+    tags: [通知系统]
+    parameters:
+      - in: path
+        name: username
+        required: true
+        type: string
+      - in: header
+        name: Last-Event-ID
+        type: integer
+        description: 断线重连时携带,补发之后的最近事件
+    responses:
+      200: {description: "text/event-stream,事件类型为 order / delivery / route"}
+      503: {description: 多进程部署下不可用}
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    return Response(sse_stream(event_bus, username, last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/notify/<username>', methods=['POST'])
+@single_process_only
 def notify_after_login(username):
     """
     登录通知
@@ -846,6 +1435,7 @@ def notify_after_login(username):
         type: string
     responses:
       200: {description: 通知发送成功}
+      503: {description: 多进程部署下不可用}
     """
     if not username:
         return jsonify({'success': False, 'message': '缺少用户名'}), 400
@@ -873,47 +1463,261 @@ def notify_after_login(username):
     else:
         return jsonify({'success': False, 'message': '未知的用户角色'}), 400
 def get_user_order_status(username):
-    today = datetime.now().date()
-    placed = sum(1 for order in orders.values() if order['status'] == 'placed' and order['receiver_name'] == username)
-    received_today = sum(1 for order in orders.values() if order['status'] == 'received' and order['receiver_name'] == username and datetime.strptime(order['date_received'], '%Y-%m-%d').date() == today)
-    completed_today = sum(1 for order in orders.values() if order['status'] == 'completed' and order['receiver_name'] == username and datetime.strptime(order['date_completed'], '%Y-%m-%d').date() == today)
+    placed, received_today, completed_today = notification_summaries.user_summary(username, datetime.now().date())
     return f'仍处于已下单状态订单{placed}个,今天已有{received_today}个订单接入本配送中心,今天已完成{completed_today}个订单'
 def get_courier_task_status(username):
     today = datetime.now().date()
-    if username in cached_tasks and cached_tasks[username]['date'] == today:
-        pending_tasks = len([task for task in cached_tasks[username]['total_path'] if deliveries[task]['status'] != 'delivered'])
+    if username in cached_tasks and cached_tasks[username]['date'] == today.isoformat():
+        pending_tasks = notification_summaries.courier_pending(username, today)
         return  f'今日还有{pending_tasks}个配送任务待完成'
     else:
         return  f'今日还未签到,请获取配送任务'
 
-# 统计和报告（示例）
+# 统计和报告
 @app.route('/report/packages', methods=['GET'])
+@single_process_only
 def report_packages():
     """
     包裹数量统计
     ---
     tags: [统计和报告]
     responses:
-      200: {description: 包裹数量统计生成成功}
+      200:
+        description: 包裹数量统计生成成功
+        schema:
+          type: object
+          properties:
+            success: {type: boolean}
+            report:
+              type: object
+              properties:
+                total: {type: integer}
+                by_status: {type: object, description: 各状态包裹数}
+      503: {description: 多进程部署下不可用}
     """
-    # 这里可以实现包裹数量统计逻辑
-    return jsonify({'success': True, 'message': '包裹数量统计生成成功'}), 200
+    return jsonify({'success': True, 'message': '包裹数量统计生成成功', 'report': package_stats.report()}), 200
 @app.route('/report/deliveries', methods=['GET'])
+@single_process_only
 def report_deliveries():
     """
     配送效率统计
     ---
     tags: [统计和报告]
     responses:
-      200: {description: 配送效率统计生成成功}
+      200:
+        description: 配送效率统计生成成功
+        schema:
+          type: object
+          properties:
+            success: {type: boolean}
+            report:
+              type: object
+              properties:
+                total: {type: integer}
+                by_status: {type: object, description: 各状态配送任务数}
+                delivered_by_courier: {type: object, description: 各快递员已送达数}
+                average_delivery_seconds: {type: number, description: pending 到 delivered 的平均耗时(秒)}
+      503: {description: 多进程部署下不可用}
+    """
+    return jsonify({'success': True, 'message': '配送效率统计生成成功', 'report': delivery_stats.report()}), 200
+@app.route('/report/analytics', methods=['GET'])
+@single_process_only
+def report_analytics():
+    """
+    配送效率时间分桶分析
+    ---
+    tags: [统计和报告]
+    parameters:
+      - in: query
+        name: granularity
+        type: string
+        enum: [hour, day]
+        description: 分桶粒度,默认 hour(保留48小时),day 保留90天
+      - in: query
+        name: since
+        type: string
+        description: 起始时间(ISO 格式)
+      - in: query
+        name: until
+        type: string
+        description: 结束时间(ISO 格式)
+    responses:
+      200: {description: 各时间桶的状态变化次数、送达延迟百分位、快递员吞吐量与积压量}
+      400: {description: 参数无效}
+      503: {description: 多进程部署下不可用}
+    """
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+        buckets = analytics.query(request.args.get('granularity', 'hour'), since, until)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'backlog': analytics.backlog, 'buckets': buckets}), 200
+# 系统管理
+@app.route('/admin/checkpoint', methods=['GET'])
+def get_checkpoint_status():
+    """
+    查看后台快照状态
+    ---
+    tags: [系统管理]
+    responses:
+      200: {description: 快照间隔、上次快照时间与耗时}
+    """
+    return jsonify({'success': True, 'checkpoint': checkpointer.status()}), 200
+@app.route('/admin/checkpoint', methods=['POST'])
+def trigger_checkpoint():
+    """
+    立即执行一次快照
+    ---
+    tags: [系统管理]
+    responses:
+      200: {description: 快照成功}
+      500: {description: 部分集合快照失败}
+    """
+    if checkpointer.snapshot_all():
+        return jsonify({'success': True, 'checkpoint': checkpointer.status()}), 200
+    return jsonify({'success': False, 'checkpoint': checkpointer.status()}), 500
+@app.route('/admin/archive', methods=['POST'])
+def trigger_archive():
+    """
+    立即归档终态订单和配送任务
+    ---
+    tags: [系统管理]
+    parameters:
+      - in: query
+        name: max_age_days
+        type: number
+        description: 最后一次状态变化距今超过该天数才归档,默认取 ARCHIVE_MAX_AGE_DAYS
+    responses:
+      200: {description: 归档完成,返回归档条数}
+      500: {description: 获取写锁超时}
     """
-    # 这里可以实现配送效率统计逻辑
-    return jsonify({'success': True, 'message': '配送效率统计生成成功'}), 200
+    try:
+        max_age_days = request.args.get('max_age_days', type=float)
+        archived = archive_terminal_records(max_age_days)
+    except TimeoutError:
+        return jsonify({'success': False, 'message': '获取写锁超时'}), 500
+    return jsonify({'success': True, 'archived': archived, 'archive_size': {'orders': len(order_archive), 'deliveries': len(delivery_archive)}}), 200
+@app.route('/admin/routing', methods=['GET'])
+def get_routing_status():
+    """
+    查看路线计算的请求合并统计
+    ---
+    tags: [系统管理]
+    responses:
+      200: {description: executed 为实际计算次数,coalesced 为合并到进行中计算而省下的次数}
+    """
+    return jsonify({'success': True, 'single_flight': route_flight.stats()}), 200
+@app.route('/admin/memory', methods=['GET'])
+def get_memory_usage():
+    """
+    查看内存占用
+    ---
+    tags: [系统管理]
+    parameters:
+      - in: query
+        name: top
+        type: integer
+        description: 已开启 tracemalloc 时返回分配最多的代码位置数,默认 20
+    responses:
+      200: {description: 进程 RSS、各集合与缓存的近似大小和对象数、增长趋势(每小时),以及 tracemalloc 分配点}
+    """
+    report = memory_monitor.report()
+    report['allocations'] = memory_monitor.top_allocations(request.args.get('top', 20, type=int))
+    return jsonify({'success': True, 'memory': report}), 200
+@app.route('/admin/memory/tracemalloc', methods=['POST'])
+def toggle_tracemalloc():
+    """
+    开启或关闭 tracemalloc(开启后每次内存分配都有额外开销,定位完成后应关闭)
+    ---
+    tags: [系统管理]
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required: [action]
+          properties:
+            action: {type: string, enum: [start, stop]}
+            frames: {type: integer, description: 每个分配点记录的调用栈深度,默认 1}
+    responses:
+      200: {description: 操作成功}
+      400: {description: 无效的操作}
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action == 'start':
+        frames = data.get('frames', 1)
+        if not isinstance(frames, int) or not 1 <= frames <= 64:
+            return jsonify({'success': False, 'message': 'frames 应为 1-64 的整数'}), 400
+        memory_monitor.start_tracing(frames)
+    elif action == 'stop':
+        memory_monitor.stop_tracing()
+    else:
+        return jsonify({'success': False, 'message': 'action 应为 start 或 stop'}), 400
+    return jsonify({'success': True, 'tracemalloc': action == 'start'}), 200
+def load_state():
+    """加载各集合;sqlite 模式下集合、锁、路线缓存与在线状态都换成跨进程共享的实现"""
+    global users, packages, deliveries, orders, cached_tasks
+    global user_lock, packages_lock, deliveries_lock, orders_lock
+    if STATE_BACKEND == 'sqlite':
+        from shared_store import SharedCollection  # 依赖 fcntl,只在多进程模式(POSIX)下导入
+        collections = {}
+        for name in ('users', 'packages', 'deliveries', 'orders'):
+            collections[name] = SharedCollection(STATE_DB, name)
+            if os.path.exists(name + '.json'):
+                collections[name].bulk_load(load_json(name))
+        users, packages, deliveries, orders = (collections[name] for name in ('users', 'packages', 'deliveries', 'orders'))
+        user_lock, packages_lock, deliveries_lock, orders_lock = (collection.lock for collection in (users, packages, deliveries, orders))
+        cached_tasks = SharedCollection(STATE_DB, 'cached_tasks')
+        presence.store = SharedCollection(STATE_DB, 'presence')
+    else:
+        users=load_collection('users')
+        packages=load_collection('packages')
+        deliveries=load_collection('deliveries')
+        orders=load_collection('orders')
+def saved_state(collection, name):
+    """二进制快照中随记录保存的派生状态,没有时返回 None"""
+    return getattr(collection, 'derived', {}).get(name)
+def archived_records(archive, collection, id_field):
+    """归档中的记录;归档后删除前崩溃的记录同时留在集合里,以集合中的为准"""
+    return (record for record in archive.values() if record[id_field] not in collection)
+def rebuild_derived_state():
+    """从已加载的数据重建索引和各增量统计;二进制快照中保存了计数器时直接恢复"""
+    build_order_indexes()
+    if STATE_BACKEND == 'sqlite':
+        return  # 多进程部署下统计接口不可用,不必在每个 worker 中扫描全部记录
+    package_stats.rebuild(packages)
+    delivery_stats.rebuild(deliveries, archived_records(delivery_archive, deliveries, 'delivery_id'), saved_state(deliveries, 'delivery_stats'))
+    analytics.rebuild(orders, deliveries, {'order': saved_state(orders, 'analytics'), 'delivery': saved_state(deliveries, 'analytics')},
+                      {'order': archived_records(order_archive, orders, 'order_id'),
+                       'delivery': archived_records(delivery_archive, deliveries, 'delivery_id')})
+    notification_summaries.rebuild(orders, deliveries, {'order': saved_state(orders, 'notifications'), 'delivery': saved_state(deliveries, 'notifications')})
+def init_state():
+    load_state()
+    rebuild_derived_state()
+def run_leader_election():
+    """多进程部署下只有取得 leader 文件锁的 worker 运行归档和内存采样,其余进程周期重试,leader 退出后接替"""
+    from shared_store import LeaderLock
+    leader = LeaderLock(STATE_DB + '.leader.lock')
+    while not leader.try_acquire():
+        if archiver_stop.wait(LEADER_RETRY_INTERVAL):
+            return
+    logger.info(f"Process {os.getpid()} elected to run background tasks")
+    start_archiver()
+    memory_monitor.start()
+def start_background_tasks():
+    if STATE_BACKEND == 'sqlite':
+        threading.Thread(target=run_leader_election, name='leader-election', daemon=True).start()
+    else:
+        checkpointer.start()
+        start_archiver()
+        memory_monitor.start()
+    if os.environ.get('ROUTING_WARMUP', '1') != '0':
+        warm_up_routing()
 if __name__ == '__main__':
-    users=load_json('users')
-    packages=load_json('packages')
-    deliveries=load_json('deliveries')
-    orders=load_json('orders')
+    load_state()
     for i in range(20,40):  # 生成10个订单
         order = Order(
             order_id=i,
@@ -926,4 +1730,6 @@ if __name__ == '__main__':
             status=OrderState.RECEIVED
         )
         orders[str(i)]=order.to_dict()
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    rebuild_derived_state()
+    start_background_tasks()
+    app.run(host='0.0.0.0', port=5000)
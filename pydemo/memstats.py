@@ -0,0 +1,214 @@
+# 内存占用统计: 各集合与缓存的近似深度大小和对象数、按需的 tracemalloc 分配点,以及周期采样得到的增长趋势
+#
+# 大集合按步长抽样 SAMPLE_SIZE 条记录计算深度大小再按记录数外推,只在持有读锁时遍历,不会长时间阻塞写入。
+# tracemalloc 默认关闭(开启后每次分配都有额外开销),通过接口或 PYTHONTRACEMALLOC 环境变量按需开启。
+import os
+import sys
+import time
+import types
+import logging
+import threading
+import itertools
+import tracemalloc
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_SIZE = 1000  # 大集合抽样估算的记录数
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get('MEMORY_SAMPLE_INTERVAL', 60))  # 趋势采样间隔(秒)
+MEMORY_HISTORY = int(os.environ.get('MEMORY_HISTORY', 120))  # 保留的采样点数
+LOCK_TIMEOUT = 5
+# 不计入深度大小的类型: 代码、模块、类型本身以及线程同步对象
+OPAQUE_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                type(threading.Lock()), threading.Thread)
+
+def deep_size(obj, seen=None):
+    """递归累加 sys.getsizeof,返回 (字节数, 对象数);seen 中已计数的对象(共享的字符串等)不重复计算"""
+    seen = set() if seen is None else seen
+    size = objects = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, OPAQUE_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        objects += 1
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif isinstance(obj, (str, bytes, int, float)):
+            continue
+        else:
+            if hasattr(obj, '__dict__') and not callable(obj):
+                stack.append(vars(obj))
+            for slot in getattr(type(obj), '__slots__', ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return size, objects
+
+def collection_size(collection, sample_size=SAMPLE_SIZE):
+    """集合的近似深度大小: 小集合精确计算,大集合按步长抽样记录后外推(调用方需持有读锁)"""
+    if hasattr(collection, 'memory_usage'):
+        # mmap 快照: 记录留在映射的文件里,只统计内存中的覆盖层
+        mapped, resident = collection.memory_usage()
+        parts = [collection_size(part, sample_size) if isinstance(part, dict) else dict(zip(('bytes', 'objects'), deep_size(part)))
+                 for part in resident]
+        return {'records': len(collection), 'bytes': sum(part['bytes'] for part in parts),
+                'objects': sum(part['objects'] for part in parts), 'mapped_bytes': mapped}
+    if not isinstance(collection, dict):
+        # 共享存储: 数据在 SQLite 中,不占本进程内存
+        return {'records': len(collection), 'bytes': 0, 'objects': 0, 'external': True}
+    count = len(collection)
+    if count <= sample_size:
+        size, objects = deep_size(collection)
+        return {'records': count, 'bytes': size, 'objects': objects}
+    seen = set()
+    size = objects = sampled = 0
+    for key in itertools.islice(collection, 0, None, count // sample_size):
+        for part in (key, collection[key]):
+            part_size, part_objects = deep_size(part, seen)
+            size += part_size
+            objects += part_objects
+        sampled += 1
+    return {'records': count, 'bytes': sys.getsizeof(collection) + int(size / sampled * count),
+            'objects': 1 + int(objects / sampled * count), 'sampled': sampled}
+
+def process_rss():
+    """进程常驻内存(字节);没有 /proc 时退回峰值 RSS"""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def slope_per_hour(points):
+    """[(时间戳, 值)] 的最小二乘斜率,换算为每小时的变化量"""
+    if len(points) < 2:
+        return None
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if variance == 0:
+        return None
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / variance * 3600
+
+class MemoryMonitor:
+    def __init__(self, sources, interval=MEMORY_SAMPLE_INTERVAL, history=MEMORY_HISTORY):
+        # sources: {名称: (返回读写锁的 getter 或 None, getter)},getter 返回当前的集合/缓存对象;
+        # 集合和锁在启动时都可能被重新赋值(sqlite 模式换成共享存储的锁),因此每次采样时再取
+        self.sources = sources
+        self.interval = interval
+        self.samples = deque(maxlen=history)  # (时间戳, RSS, {名称: 字节数})
+        self._previous_snapshot = None
+        self._snapshot_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def measure(self):
+        usage = {}
+        for name, (lock_getter, getter) in self.sources.items():
+            lock = lock_getter().gen_rlock() if lock_getter is not None else None
+            if lock is not None and not lock.acquire(timeout=LOCK_TIMEOUT):
+                usage[name] = {'error': '获取读锁超时'}
+                continue
+            try:
+                target = getter()
+                if hasattr(target, 'keys'):
+                    usage[name] = collection_size(target)
+                else:
+                    size, objects = deep_size(target)
+                    usage[name] = {'bytes': size, 'objects': objects}
+            except RuntimeError as e:
+                # 没有读写锁保护的缓存在遍历时可能被其他线程修改,本次跳过
+                usage[name] = {'error': str(e)}
+            finally:
+                if lock is not None:
+                    lock.release()
+        return {'at': time.time(), 'rss_bytes': process_rss(), 'usage': usage}
+
+    def sample(self):
+        current = self.measure()
+        self.samples.append((current['at'], current['rss_bytes'],
+                             {name: entry['bytes'] for name, entry in current['usage'].items() if 'bytes' in entry}))
+        return current
+
+    def trend(self):
+        """按采样窗口内的线性拟合给出每小时增长量"""
+        samples = list(self.samples)
+        if not samples:
+            return {'samples': 0}
+        names = set().union(*(usage for _, _, usage in samples))
+        return {
+            'samples': len(samples),
+            'window_seconds': samples[-1][0] - samples[0][0],
+            'rss_bytes_per_hour': slope_per_hour([(at, rss) for at, rss, _ in samples]),
+            'bytes_per_hour': {name: slope_per_hour([(at, usage[name]) for at, _, usage in samples if name in usage])
+                               for name in sorted(names)},
+        }
+
+    def report(self):
+        current = self.sample()
+        return {**current, 'total_bytes': sum(entry.get('bytes', 0) for entry in current['usage'].values()),
+                'trend': self.trend(), 'tracemalloc': tracemalloc.is_tracing()}
+
+    # tracemalloc
+    def start_tracing(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        with self._snapshot_lock:
+            self._previous_snapshot = None
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        with self._snapshot_lock:
+            self._previous_snapshot = None
+
+    def top_allocations(self, limit=20):
+        """当前分配最多的代码位置,以及与上一次查询相比的增量;未开启 tracemalloc 时返回 None"""
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        with self._snapshot_lock:
+            previous, self._previous_snapshot = self._previous_snapshot, snapshot
+        # 有上一次的快照时按增量统计(StatisticDiff 同时带有当前大小和增量)
+        stats = snapshot.statistics('traceback') if previous is None else snapshot.compare_to(previous, 'traceback')
+        stats.sort(key=lambda stat: stat.size, reverse=True)
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            'traced_bytes': traced,
+            'peak_bytes': peak,
+            'since_previous': previous is not None,
+            'top': [{
+                'site': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                'bytes': stat.size,
+                'count': stat.count,
+                'bytes_diff': getattr(stat, 'size_diff', None),
+                'count_diff': getattr(stat, 'count_diff', None),
+            } for stat in stats[:limit]]
+        }
+
+    # 后台采样
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='memory-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"An error occurred while sampling memory usage: {e}")
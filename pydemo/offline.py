@@ -0,0 +1,117 @@
+# 命令行客户端的离线支持: 本地缓存快递员的路线和订单详情,状态修改先写入持久化的待发送队列,
+# 联网后按批通过 /orders/status、/deliveries/status 提交
+import os
+import json
+import time
+import sqlite3
+import threading
+import requests
+
+CACHE_FILE = os.environ.get('CLIENT_CACHE', 'client_cache.db')
+FLUSH_BATCH = 200
+BULK_ENDPOINTS = {'order': '/orders/status', 'delivery': '/deliveries/status'}
+
+class OfflineStore:
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS records (kind TEXT, key TEXT, value TEXT, updated_at REAL, PRIMARY KEY (kind, key))')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS outbox (seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, id TEXT, status TEXT, queued_at REAL)')
+
+    # 本地缓存
+    def get(self, kind, key):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM records WHERE kind = ? AND key = ?', (kind, str(key))).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, kind, key, value):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)',
+                               (kind, str(key), json.dumps(value, ensure_ascii=False), time.time()))
+
+    # 待发送队列
+    def enqueue(self, kind, record_id, status):
+        """记录一次状态修改,写入即落盘;同时更新本地缓存中的状态"""
+        with self._lock:
+            self._conn.execute('INSERT INTO outbox (kind, id, status, queued_at) VALUES (?, ?, ?, ?)',
+                               (kind, str(record_id), status, time.time()))
+        cached = self.get(kind, record_id)
+        if cached is not None:
+            cached['status'] = status
+            self.put(kind, record_id, cached)
+
+    def pending_status(self, kind, record_id):
+        """尚未提交的最新状态,用于覆盖从服务器取到的旧状态"""
+        with self._lock:
+            row = self._conn.execute('SELECT status FROM outbox WHERE kind = ? AND id = ? ORDER BY seq DESC LIMIT 1',
+                                     (kind, str(record_id))).fetchone()
+        return None if row is None else row[0]
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def flush(self, api_url, session=None, batch_size=FLUSH_BATCH):
+        """按批提交队列中的状态修改,返回 (已提交, 被服务器拒绝的 [(类型, ID, 原因)]);
+        网络不可用或服务器出错时保留剩余条目,下次继续"""
+        session = session or requests.Session()
+        sent, rejected = 0, []
+        for kind, endpoint in BULK_ENDPOINTS.items():
+            while True:
+                with self._lock:
+                    rows = self._conn.execute('SELECT seq, id, status FROM outbox WHERE kind = ? ORDER BY seq LIMIT ?',
+                                              (kind, batch_size)).fetchall()
+                if not rows:
+                    break
+                try:
+                    response = session.put(f"{api_url}{endpoint}", json=[{'id': record_id, 'status': status} for _, record_id, status in rows],
+                                           timeout=10)
+                except requests.RequestException:
+                    return sent, rejected
+                if response.status_code != 200:
+                    return sent, rejected
+                for (seq, record_id, _), result in zip(rows, response.json()['results']):
+                    if result['success']:
+                        sent += 1
+                    else:
+                        rejected.append((kind, record_id, result['message']))
+                with self._lock:
+                    self._conn.execute(f"DELETE FROM outbox WHERE seq IN ({','.join('?' * len(rows))})", [row[0] for row in rows])
+        return sent, rejected
+
+class OutboxFlusher:
+    """后台定期提交待发送队列,界面线程只负责入队"""
+    def __init__(self, store, api_url, interval=5):
+        self.store = store
+        self.api_url = api_url
+        self.interval = interval
+        self.online = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='outbox-flusher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def poke(self):
+        """有新的状态修改时立即尝试提交"""
+        self._wake.set()
+
+    def stop(self):
+        """停止前再提交一次"""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=15)
+
+    def _run(self):
+        session = requests.Session()
+        while True:
+            self.store.flush(self.api_url, session)
+            self.online = self.store.pending() == 0
+            if self._stop.is_set():
+                return
+            self._wake.wait(self.interval)
+            self._wake.clear()
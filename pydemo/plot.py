@@ -0,0 +1,66 @@
+# 路径可视化,单独成模块,保证服务端进程永远不会加载 matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.widgets import Button
+
+def plot_paths(coordinates, path1, path2):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    plt.subplots_adjust(bottom=0.2)
+
+    # 提取路径1的坐标
+    path1_coords = [coordinates[node] for node in path1]
+    path1_x, path1_y = zip(*path1_coords)
+
+    # 提取路径2的坐标
+    path2_coords = [coordinates[node] for node in path2]
+    path2_x, path2_y = zip(*path2_coords)
+
+    # 绘制路径1
+    line1, = ax.plot(path1_x, path1_y, 'o-', label='Path 1 (NetworkX)', color='blue')
+    start1, = ax.plot(path1_x[0], path1_y[0], 'go', label='Start (Path 1)')
+    end1, = ax.plot(path1_x[-1], path1_y[-1], 'ro', label='End (Path 1)')
+
+    # 绘制路径2
+    line2, = ax.plot(path2_x, path2_y, 's-', label='Path 2 (OR-Tools)', color='red')
+    start2, = ax.plot(path2_x[0], path2_y[0], 'go', label='Start (Path 2)')
+    end2, = ax.plot(path2_x[-1], path2_y[-1], 'ro', label='End (Path 2)')
+
+    # 初始状态下隐藏路径2
+    line2.set_visible(False)
+    start2.set_visible(False)
+    end2.set_visible(False)
+
+    plt.title('Paths Comparison')
+    plt.xlabel('Longitude')
+    plt.ylabel('Latitude')
+    plt.legend()
+    plt.grid(True)
+
+    # 按钮回调函数
+    def show_path1(event):
+        line1.set_visible(True)
+        start1.set_visible(True)
+        end1.set_visible(True)
+        line2.set_visible(False)
+        start2.set_visible(False)
+        end2.set_visible(False)
+        plt.draw()
+
+    def show_path2(event):
+        line1.set_visible(False)
+        start1.set_visible(False)
+        end1.set_visible(False)
+        line2.set_visible(True)
+        start2.set_visible(True)
+        end2.set_visible(True)
+        plt.draw()
+
+    # 创建按钮
+    ax_button1 = plt.axes([0.1, 0.05, 0.35, 0.075])
+    btn1 = Button(ax_button1, 'Show Path 1')
+    btn1.on_clicked(show_path1)
+
+    ax_button2 = plt.axes([0.55, 0.05, 0.35, 0.075])
+    btn2 = Button(ax_button2, 'Show Path 2')
+    btn2.on_clicked(show_path2)
+
+    plt.show()
@@ -0,0 +1,57 @@
+# 在线状态: 与 users 集合分开保存,登录/心跳只写一条到期时间,不获取 users 写锁
+#
+# 每个用户一条 {'role', 'last_seen', 'expires_at'}(墙钟时间,多进程部署时各进程看到的一致)。
+# 写入都是单键赋值: 内存模式下 dict 的单键赋值在 GIL 下是原子的,共享存储模式下是一条 UPSERT;
+# 读取时按 expires_at 判断是否在线,超过 TTL 未续期即视为离线,不需要清理线程。条目数不超过用户数。
+import os
+import time
+
+PRESENCE_TTL = float(os.environ.get('PRESENCE_TTL', 120))  # 超过该秒数没有心跳视为离线
+
+def role_value(role):
+    """身份既可能是枚举也可能是字符串"""
+    return getattr(role, 'value', role)
+
+class PresenceTracker:
+    def __init__(self, store=None, ttl=PRESENCE_TTL):
+        self.store = {} if store is None else store  # 用户名 -> 条目,sqlite 模式下为 SharedCollection
+        self.ttl = ttl
+
+    def touch(self, username, role=None, now=None):
+        """登录(传入身份)或心跳(沿用已有身份)时续期;心跳时没有条目(未登录或已登出)返回 None"""
+        now = time.time() if now is None else now
+        if role is None:
+            entry = self.store.get(username)
+            if entry is None:
+                return None
+            role = entry['role']
+        entry = {'role': role_value(role), 'last_seen': now, 'expires_at': now + self.ttl}
+        self.store[username] = entry
+        return entry
+
+    def set_role(self, username, role):
+        """用户身份变更后同步到在线条目(不续期)"""
+        entry = self.store.get(username)
+        if entry is not None:
+            self.store[username] = {**entry, 'role': role_value(role)}
+
+    def remove(self, username):
+        self.store.pop(username, None)
+
+    def is_online(self, username, now=None):
+        entry = self.store.get(username)
+        return entry is not None and entry['expires_at'] > (time.time() if now is None else now)
+
+    def online(self, role=None, usernames=None, now=None):
+        """在线用户列表,可按身份和用户名批量过滤"""
+        now = time.time() if now is None else now
+        if usernames is None:
+            entries = list(self.store.items())  # 内存模式下一次性拷贝,不会与并发写入冲突
+        else:
+            entries = [(username, self.store.get(username)) for username in usernames]
+        return [
+            {'username': username, 'role': entry['role'], 'last_seen': entry['last_seen'],
+             'expires_in': round(entry['expires_at'] - now, 3)}
+            for username, entry in entries
+            if entry is not None and entry['expires_at'] > now and (role is None or entry['role'] == role)
+        ]
@@ -0,0 +1,103 @@
+# 路线计算的分阶段计时与按需采样分析
+#
+# StageTimer 记录 GET_task_path 各阶段(距离矩阵、聚类、聚类 DP、各聚类求解、拼接)的耗时;
+# SamplingProfiler 在后台线程按固定间隔采样求解线程的调用栈,输出折叠栈格式
+# (每行 "帧;帧;帧 次数",可直接用 flamegraph.pl 或 speedscope 打开),只依赖标准库。
+import os
+import re
+import sys
+import time
+import uuid
+import threading
+import contextlib
+from collections import Counter
+from checkpoint import atomic_write
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))  # 采样间隔(秒)
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))  # 最多保留的分析结果数,超出时删除最旧的
+
+class StageTimer:
+    """按阶段累计耗时,同一阶段多次进入时累加;各聚类的求解另外逐个记录"""
+    def __init__(self):
+        self.stages = {}
+        self.clusters = []
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def cluster(self, size, seconds, constrained):
+        self.clusters.append({'size': size, 'ms': round(seconds * 1000, 3), 'constrained': constrained})
+
+    def as_dict(self):
+        return {
+            'total_ms': round((time.perf_counter() - self._start) * 1000, 3),
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            'clusters': self.clusters
+        }
+
+class SamplingProfiler:
+    """在 with 块内采样进入该块的线程的调用栈"""
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+
+    def __enter__(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+def timed_solve(solve, coordinates, options, profile=False):
+    """执行一次路线计算,返回 (结果, 分阶段耗时, 折叠栈文本或 None)"""
+    timer = StageTimer()
+    profiler = SamplingProfiler() if profile else None
+    with profiler or contextlib.nullcontext():
+        result = solve(coordinates, timer=timer, **options)
+    return result, timer.as_dict(), profiler.folded() if profiler else None
+
+def profile_path(profile_id):
+    """分析结果的文件路径;ID 不合法时返回 None"""
+    if not re.fullmatch(r'[0-9a-zA-Z_-]+', profile_id):
+        return None
+    return os.path.join(PROFILE_DIR, profile_id + '.folded')
+
+def save_profile(folded, label):
+    """保存折叠栈并返回 ID,只保留最近 PROFILE_KEEP 个"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    label = re.sub(r'[^0-9a-zA-Z_-]', '_', str(label))
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}"
+    atomic_write(profile_path(profile_id), lambda file: file.write(folded))
+    saved = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith('.folded')),
+                   key=lambda entry: entry.stat().st_mtime)
+    for entry in saved[:-PROFILE_KEEP]:
+        with contextlib.suppress(OSError):
+            os.remove(entry.path)
+    return profile_id
@@ -0,0 +1,267 @@
+# 多进程部署用的共享状态: 每个集合是 SQLite(WAL) 中的一张表,配合 flock 实现跨进程读写锁
+#
+# 业务代码的写法是"持有写锁 -> get 到字典 -> 原地修改",因此写锁期间取出的记录会缓存在
+# 当前线程的会话中,释放写锁时在一个事务里统一写回。锁对象的接口与 readerwriterlock 一致。
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from checkpoint import json_default
+
+INDEXED_FIELDS = ('status', 'receiver_name', 'courier_name')
+
+def encode_field(value):
+    """索引列统一保存为字符串(路径参数中的收件人名总是字符串)"""
+    return None if value is None else str(getattr(value, 'value', value))
+
+class FileLockHandle:
+    def __init__(self, owner, mode):
+        self.owner = owner
+        self.mode = mode
+        self.fd = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        fd = os.open(self.owner.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if timeout is None or timeout < 0 else time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, self.mode | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                    os.close(fd)
+                    return False
+                time.sleep(0.002)
+        self.fd = fd
+        if self.mode == fcntl.LOCK_EX and self.owner.collection is not None:
+            self.owner.collection.begin_write()
+        return True
+
+    def release(self):
+        try:
+            if self.mode == fcntl.LOCK_EX and self.owner.collection is not None:
+                self.owner.collection.end_write()
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+class FileRWLock:
+    """跨进程读写锁,每次加锁打开独立的文件描述符,同进程内的线程之间同样互斥"""
+    def __init__(self, path, collection=None):
+        self.path = path
+        self.collection = collection
+
+    def gen_rlock(self):
+        return FileLockHandle(self, fcntl.LOCK_SH)
+
+    def gen_wlock(self):
+        return FileLockHandle(self, fcntl.LOCK_EX)
+
+class LeaderLock:
+    """多个 worker 进程中选出一个执行后台任务: 非阻塞地持有文件排他锁,进程退出时由内核释放"""
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def try_acquire(self):
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+class SharedCollection(MutableMapping):
+    def __init__(self, db_path, name):
+        self.db_path = db_path
+        self.name = name
+        self.lock = FileRWLock(f'{db_path}.{name}.lock', self)
+        self._local = threading.local()
+        self._execute(f'''CREATE TABLE IF NOT EXISTS "{name}" (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT UNIQUE NOT NULL,
+            value TEXT NOT NULL,
+            status TEXT, receiver_name TEXT, courier_name TEXT)''')
+        for field in ('status', 'receiver_name'):
+            self._execute(f'CREATE INDEX IF NOT EXISTS "{name}_{field}" ON "{name}" ({field}, seq)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql, params=()):
+        return self._conn().execute(sql, params)
+
+    # 写锁会话
+    def _session(self):
+        return getattr(self._local, 'session', None)
+
+    def begin_write(self):
+        self._local.session = {'records': {}, 'deleted': set()}
+
+    def end_write(self):
+        session, self._local.session = self._session(), None
+        if not session or (not session['records'] and not session['deleted']):
+            return
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for key in session['deleted']:
+                conn.execute(f'DELETE FROM "{self.name}" WHERE key = ?', (key,))
+            for key, value in session['records'].items():
+                self._upsert(conn, key, value)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _upsert(self, conn, key, value):
+        fields = [encode_field(value.get(field)) if isinstance(value, dict) else None for field in INDEXED_FIELDS]
+        conn.execute(f'''INSERT INTO "{self.name}" (key, value, status, receiver_name, courier_name) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value, status = excluded.status,
+            receiver_name = excluded.receiver_name, courier_name = excluded.courier_name''',
+                     (key, json.dumps(value, ensure_ascii=False, default=json_default), *fields))
+
+    def _fetch(self, key):
+        row = self._execute(f'SELECT value FROM "{self.name}" WHERE key = ?', (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    # MutableMapping
+    def __getitem__(self, key):
+        key = str(key)
+        session = self._session()
+        if session is not None:
+            if key in session['records']:
+                return session['records'][key]
+            if key in session['deleted']:
+                raise KeyError(key)
+        value = self._fetch(key)
+        if value is None:
+            raise KeyError(key)
+        if session is not None:
+            session['records'][key] = value  # 写锁期间原地修改的记录在释放锁时写回
+        return value
+
+    def __contains__(self, key):
+        key = str(key)
+        session = self._session()
+        if session is not None:
+            if key in session['records']:
+                return True
+            if key in session['deleted']:
+                return False
+        return self._execute(f'SELECT 1 FROM "{self.name}" WHERE key = ?', (key,)).fetchone() is not None
+
+    def __setitem__(self, key, value):
+        key = str(key)
+        session = self._session()
+        if session is not None:
+            session['records'][key] = value
+            session['deleted'].discard(key)
+        else:
+            self._upsert(self._conn(), key, value)
+
+    def __delitem__(self, key):
+        key = str(key)
+        if key not in self:
+            raise KeyError(key)
+        session = self._session()
+        if session is not None:
+            session['records'].pop(key, None)
+            session['deleted'].add(key)
+        else:
+            self._execute(f'DELETE FROM "{self.name}" WHERE key = ?', (key,))
+
+    def __iter__(self):
+        session = self._session()
+        keys = [row[0] for row in self._execute(f'SELECT key FROM "{self.name}" ORDER BY seq')]
+        if session is None:
+            yield from keys
+            return
+        stored = set(keys)
+        yield from (key for key in keys if key not in session['deleted'])
+        yield from (key for key in list(session['records']) if key not in stored)
+
+    def __len__(self):
+        if self._session() is None:
+            return self._execute(f'SELECT COUNT(*) FROM "{self.name}"').fetchone()[0]
+        return sum(1 for _ in self)
+
+    def items(self):
+        """整表扫描时一次查询取出全部记录,避免逐键查询"""
+        session = self._session()
+        seen = set()
+        for key, value in self._execute(f'SELECT key, value FROM "{self.name}" ORDER BY seq').fetchall():
+            seen.add(key)
+            if session is not None:
+                if key in session['deleted']:
+                    continue
+                if key in session['records']:
+                    yield key, session['records'][key]
+                    continue
+                session['records'][key] = json.loads(value)
+                yield key, session['records'][key]
+            else:
+                yield key, json.loads(value)
+        if session is not None:
+            for key in list(session['records']):
+                if key not in seen:
+                    yield key, session['records'][key]
+
+    def values(self):
+        return (value for _, value in self.items())
+
+    # 与 binstore.SnapshotMap 相同的列查询接口
+    def keys_with(self, field, value):
+        rows = self._execute(f'SELECT key FROM "{self.name}" WHERE {field} = ? ORDER BY seq', (encode_field(value),))
+        keys = [row[0] for row in rows]
+        session = self._session()
+        if session is None:
+            return keys
+        keys = [key for key in keys if key not in session['deleted'] and
+                (key not in session['records'] or encode_field(session['records'][key].get(field)) == encode_field(value))]
+        keys.extend(key for key, record in session['records'].items() if encode_field(record.get(field)) == encode_field(value) and key not in keys)
+        return keys
+
+    def iter_field(self, field):
+        yield from self._execute(f'SELECT key, {field} FROM "{self.name}" ORDER BY seq').fetchall()
+
+    def page_by(self, field, value, cursor, limit):
+        """按 seq 游标分页,返回 (记录列表, 下一页游标)"""
+        rows = self._execute(f'SELECT seq, value FROM "{self.name}" WHERE {field} = ? AND seq > ? ORDER BY seq LIMIT ?',
+                             (encode_field(value), cursor, limit + 1)).fetchall()
+        records = [json.loads(row[1]) for row in rows[:limit]]
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return records, next_cursor
+
+    def bulk_load(self, data):
+        """表为空时导入已有的 JSON 数据,多个进程同时启动时只有第一个会导入"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute(f'SELECT COUNT(*) FROM "{self.name}"').fetchone()[0] == 0:
+                for key, value in data.items():
+                    self._upsert(conn, str(key), value)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
@@ -0,0 +1,67 @@
+# 请求合并(single-flight): 同一个键的并发调用只执行一次,其余调用方等待并共享结果(或异常)
+#
+# 线程(Flask)和协程(asgi)调用方共用同一个 SingleFlight,等待的都是同一个 concurrent.futures.Future。
+# 只在单个进程内合并;多进程部署时各进程各自合并。
+import asyncio
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # 键 -> 进行中的 Future
+        self.executed = 0   # 实际执行的次数
+        self.coalesced = 0  # 合并到进行中调用、省下的次数
+
+    def _join(self, key):
+        """返回 (Future, 是否由本调用方执行)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.executed += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, exception=None):
+        # 先移除再通知等待方,之后到达的请求会重新执行(调用方应在执行函数里先查缓存)
+        with self._lock:
+            del self._calls[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, **kwargs):
+        """执行 fn 或等待同键的进行中调用,返回 (结果, 是否为共享的结果)"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, result=result)
+        return result, False
+
+    async def do_async(self, key, make_coroutine):
+        """do 的协程版本,make_coroutine() 返回要执行的协程"""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+        try:
+            result = await make_coroutine()
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, result=result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        requests = self.executed + self.coalesced
+        return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': in_flight,
+                'coalesced_ratio': self.coalesced / requests if requests else 0.0}
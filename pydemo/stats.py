@@ -0,0 +1,204 @@
+# 统计报表的增量计数器: 在各写路径(已持有集合写锁)中更新,报表直接读取,无需扫描全部记录
+import threading
+import itertools
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+def status_value(status):
+    """状态既可能是枚举也可能是字符串"""
+    return getattr(status, 'value', status)
+
+def to_datetime(timestamp):
+    """history 中既可能是 datetime 也可能是 ISO 字符串"""
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp)
+    return timestamp
+
+class PackageStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_status = Counter()
+
+    def on_create(self, package):
+        with self._lock:
+            self.by_status[status_value(package['status'])] += 1
+
+    def on_transition(self, old_status, new_status):
+        with self._lock:
+            self.by_status[status_value(old_status)] -= 1
+            self.by_status[status_value(new_status)] += 1
+
+    def rebuild(self, packages):
+        # 二进制快照直接读 status 列,不解码包裹
+        statuses = (status for _, status in packages.iter_field('status')) if hasattr(packages, 'iter_field') \
+            else (package['status'] for package in packages.values())
+        with self._lock:
+            self.by_status = Counter(status_value(status) for status in statuses)
+
+    def report(self):
+        with self._lock:
+            by_status = {status: count for status, count in self.by_status.items() if count}
+        return {'total': sum(by_status.values()), 'by_status': by_status}
+
+class DeliveryStats:
+    DELIVERED = 'delivered'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_status = Counter()
+        self.delivered_by_courier = Counter()
+        self.delivered_count = 0          # 进入 delivered 状态的次数(含已归档)
+        self.delivered_seconds_total = 0.0  # 对应的 pending -> delivered 耗时总和
+
+    def on_create(self, delivery):
+        with self._lock:
+            self.by_status[status_value(delivery['status'])] += 1
+
+    def on_transition(self, delivery, old_status, new_status, at):
+        old_status, new_status = status_value(old_status), status_value(new_status)
+        with self._lock:
+            self.by_status[old_status] -= 1
+            self.by_status[new_status] += 1
+            if new_status == self.DELIVERED and old_status != self.DELIVERED:
+                self._count_delivered(delivery, at)
+            elif old_status == self.DELIVERED and new_status != self.DELIVERED:
+                self.delivered_by_courier[delivery['courier_name']] -= 1
+
+    def _count_delivered(self, delivery, at):
+        self.delivered_by_courier[delivery['courier_name']] += 1
+        created_at = to_datetime(delivery['history'][0][1]) if delivery.get('history') else None
+        if created_at is not None and at is not None:
+            self.delivered_count += 1
+            self.delivered_seconds_total += (to_datetime(at) - created_at).total_seconds()
+
+    def export_state(self):
+        """随 deliveries 快照保存的计数器(调用方持有 deliveries 读锁);计数按 [键, 次数] 保存以保留键的类型"""
+        with self._lock:
+            return {
+                'by_status': [[status, count] for status, count in self.by_status.items() if count],
+                'delivered_by_courier': [[courier, count] for courier, count in self.delivered_by_courier.items() if count],
+                'delivered_count': self.delivered_count,
+                'delivered_seconds_total': self.delivered_seconds_total
+            }
+
+    def rebuild(self, deliveries, archived=(), saved=None):
+        """启动时重建一次,之后只做增量更新:有快照中保存的计数器(saved)时直接恢复,
+        否则回放已加载的数据和归档记录"""
+        with self._lock:
+            self.by_status = Counter()
+            self.delivered_by_courier = Counter()
+            self.delivered_count = 0
+            self.delivered_seconds_total = 0.0
+            if saved is not None:
+                self.by_status.update(dict(map(tuple, saved['by_status'])))
+                self.delivered_by_courier.update(dict(map(tuple, saved['delivered_by_courier'])))
+                self.delivered_count = saved['delivered_count']
+                self.delivered_seconds_total = saved['delivered_seconds_total']
+                return
+            for delivery in itertools.chain(deliveries.values(), archived):
+                status = status_value(delivery['status'])
+                self.by_status[status] += 1
+                if status == self.DELIVERED:
+                    delivered_at = next((at for s, at in reversed(delivery['history']) if status_value(s) == self.DELIVERED), None)
+                    self._count_delivered(delivery, delivered_at)
+
+    def report(self):
+        with self._lock:
+            by_status = {status: count for status, count in self.by_status.items() if count}
+            by_courier = {courier: count for courier, count in self.delivered_by_courier.items() if count}
+            average = self.delivered_seconds_total / self.delivered_count if self.delivered_count else None
+        return {
+            'total': sum(by_status.values()),
+            'by_status': by_status,
+            'delivered_by_courier': by_courier,
+            'average_delivery_seconds': average
+        }
+
+class NotificationSummaries:
+    """登录通知所需的按用户/快递员、按天计数,通知时直接查表"""
+    KEEP_DAYS = 2  # 只需要今天的数据,多保留一天以跨过零点
+    EVENTS = {'order': ('received', 'completed'), 'delivery': ('assigned', 'delivered')}  # 各类记录产生的按天事件
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.placed_by_receiver = Counter()  # 当前处于已下单状态的订单数
+        self.daily = {}                      # 日期 -> Counter((事件, 用户名))
+
+    def _day(self, day):
+        oldest = date.today() - timedelta(days=self.KEEP_DAYS)
+        if day <= oldest:
+            return Counter()  # 过期的数据不再保留
+        counter = self.daily.get(day)
+        if counter is None:
+            counter = self.daily[day] = Counter()
+            for stale in [d for d in self.daily if d <= oldest]:
+                del self.daily[stale]
+        return counter
+
+    def on_order_transition(self, order, old_status, new_status, at):
+        old_status, new_status = status_value(old_status), status_value(new_status)
+        receiver = str(order['receiver_name'])
+        with self._lock:
+            if old_status == 'placed':
+                self.placed_by_receiver[receiver] -= 1
+            if new_status == 'placed':
+                self.placed_by_receiver[receiver] += 1
+            if new_status in ('received', 'completed') and new_status != old_status:
+                self._day(to_datetime(at).date())[(new_status, receiver)] += 1
+
+    def on_delivery_transition(self, delivery, old_status, new_status, at):
+        """配送任务按创建日期归属当天的任务,送达时扣减"""
+        old_status, new_status = status_value(old_status), status_value(new_status)
+        courier = str(delivery['courier_name'])
+        created_day = to_datetime(delivery['history'][0][1]).date() if delivery.get('history') else to_datetime(at).date()
+        with self._lock:
+            counter = self._day(created_day)
+            if old_status is None:
+                counter[('assigned', courier)] += 1
+            if new_status == 'delivered' and old_status != 'delivered':
+                counter[('delivered', courier)] += 1
+            elif old_status == 'delivered' and new_status != 'delivered':
+                counter[('delivered', courier)] -= 1
+
+    def user_summary(self, username, day):
+        username = str(username)
+        with self._lock:
+            counter = self.daily.get(day, Counter())
+            return self.placed_by_receiver[username], counter[('received', username)], counter[('completed', username)]
+
+    def courier_pending(self, username, day):
+        username = str(username)
+        with self._lock:
+            counter = self.daily.get(day, Counter())
+            return counter[('assigned', username)] - counter[('delivered', username)]
+
+    def export_state(self, kind):
+        """随 kind('order' / 'delivery')对应集合的快照保存的计数(调用方持有该集合读锁)"""
+        with self._lock:
+            state = {'daily': {day.isoformat(): [[event, username, count] for (event, username), count in counter.items()
+                                                 if event in self.EVENTS[kind] and count]
+                               for day, counter in self.daily.items()}}
+            if kind == 'order':
+                state['placed_by_receiver'] = {username: count for username, count in self.placed_by_receiver.items() if count}
+            return state
+
+    def rebuild(self, orders, deliveries, saved=None):
+        """启动时重建一次:saved 中有某类记录快照保存的计数({'order'/'delivery': 状态})时直接恢复,其余回放已有 history"""
+        saved = saved or {}
+        with self._lock:
+            self.placed_by_receiver = Counter()
+            self.daily = {}
+            for kind, state in saved.items():
+                if state is None:
+                    continue
+                self.placed_by_receiver.update(state.get('placed_by_receiver', {}))
+                for day, entries in state['daily'].items():
+                    self._day(date.fromisoformat(day)).update({(event, username): count for event, username, count in entries})
+        for kind, handler, collection in (('order', self.on_order_transition, orders), ('delivery', self.on_delivery_transition, deliveries)):
+            if saved.get(kind) is not None:
+                continue
+            for record in collection.values():
+                previous = None
+                for status, at in record.get('history', []):
+                    handler(record, previous, status, at)
+                    previous = status
@@ -1,13 +1,30 @@
 
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Button
-from sklearn.cluster import KMeans, AgglomerativeClustering,DBSCAN
-import networkx as nx
+from sklearn.cluster import KMeans, AgglomerativeClustering,DBSCAN, MiniBatchKMeans
 import time
+import atexit
 import itertools
+import threading
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
+from distance import get_distance_provider, pairwise_distances
+from profiling import StageTimer
+
+COURIER_SPEED = float(os.environ.get('COURIER_SPEED', 10))    # 距离单位/秒,用于把距离换算为到达时间
+PRIORITY_WEIGHT = float(os.environ.get('PRIORITY_WEIGHT', 50))  # 每级优先级每推后一个站点的代价(距离单位)
+LATE_PENALTY = float(os.environ.get('LATE_PENALTY', 10))       # 晚于时间窗每秒的代价(距离单位)
+ROUTE_HORIZON = 7 * 24 * 3600
+# 多级分解: 站点数很多时递归聚类(聚类的聚类),只为叶子计算距离矩阵并并行求解
+ROUTING_MODE = os.environ.get('ROUTING_MODE', 'auto')  # flat / hierarchical / auto(超过阈值时多级分解)
+HIERARCHICAL_THRESHOLD = int(os.environ.get('HIERARCHICAL_THRESHOLD', 2000))
+LEAF_SIZE = int(os.environ.get('LEAF_SIZE', 80))   # 叶子站点数上限,决定单次 OR-Tools 求解的规模
+BRANCHING = int(os.environ.get('BRANCHING', 8))    # 每级子聚类数,子聚类顺序用 Held-Karp DP 求解,不宜超过 12
+LEAF_WORKERS = int(os.environ.get('LEAF_WORKERS', os.cpu_count() or 1))  # 并行求解叶子的进程数,1 为在本进程内求解
+leaf_pool = None
+leaf_pool_lock = threading.Lock()
 
 # # 生成随机经纬度坐标点
 # def generate_random_coordinates(n, lat_range=(0, 10000), lon_range=(0, 10000)):
@@ -33,6 +50,7 @@ def hierarchical_clustering(coordinates, n_clusters):
 
 def create_graph(distance_matrix):
     """Creates a graph from the distance matrix."""
+    import networkx as nx  # 仅对比实验使用,避免服务启动时加载
     G = nx.Graph()
     for u in distance_matrix:
         for v in distance_matrix[u]:
@@ -47,6 +65,7 @@ def create_graph(distance_matrix):
 #     tsp_length = sum(distance_matrix[u][v] for u, v in zip(tsp_path, tsp_path[1:] + [tsp_path[0]]))
 #     return tsp_length, tsp_path
 def solve_tsp_networkx(distance_matrix):
+    import networkx as nx
     G = create_graph(distance_matrix)
     tsp_path = nx.approximation.traveling_salesman_problem(G, cycle=False)
     return tsp_path
@@ -96,14 +115,7 @@ def solve_tsp_dynamic_programming(distance_matrix):
 
 def calculate_distance_matrix_list(coordinates):
     """Calculates the distance matrix for the given coordinates."""
-    n = len(coordinates)
-    distance_matrix = np.zeros((n, n))
-    for i in range(n):
-        for j in range(i + 1, n):
-            distance = np.linalg.norm(coordinates[i] - coordinates[j])
-            distance_matrix[i][j] = distance
-            distance_matrix[j][i] = distance
-    return distance_matrix
+    return pairwise_distances(coordinates, 'planar')
 
 def calculate_distance_matrix_map(coordinates_dict):
     """Calculates the distance matrix for the given coordinates."""
@@ -124,6 +136,10 @@ def calculate_distance_matrix_map(coordinates_dict):
     
     return distance_matrix
 
+def submatrix_map(distance_matrix, indices):
+    """从整体距离矩阵中取出若干站点之间的距离,格式与 calculate_distance_matrix_map 相同"""
+    return {i: {j: distance_matrix[i][j] for j in indices if j != i} for i in indices}
+
 def find_min_distance_between_clusters(cluster1_points, cluster2_points):
     """Finds the minimum distance between two clusters."""
     min_distance = float('inf')
@@ -134,26 +150,62 @@ def find_min_distance_between_clusters(cluster1_points, cluster2_points):
                 min_distance = distance
     return min_distance
 
-def create_distance_callback(distance_matrix, manager,ratio,original_nodes):
-    """Creates a callback to return the distance between nodes."""
-    def distance_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return int(ratio)*int(distance_matrix[original_nodes[from_node]][original_nodes[to_node]])
-    return distance_callback
-
-def solve_tsp_or_tools(distance_matrix):
+def arc_cost_matrix(distance_matrix, ratio, original_nodes):
+    """按求解器节点顺序排列的整数弧代价矩阵(与原先逐弧回调的取值相同)"""
+    return [[int(ratio) * int(distance_matrix[a][b]) if a != b else 0 for b in original_nodes] for a in original_nodes]
+
+def add_route_constraints(routing, manager, original_nodes, distance_matrix, priorities, time_windows, start_offset, speed, ratio):
+    """优先级: 访问序号维度上按优先级加权的软上界(越靠后代价越高);
+    时间窗: 行驶时间维度,允许提前到达等待,晚于窗口结束按秒计罚"""
+    if any(priorities.get(node, 0) for node in original_nodes):
+        def position_callback(from_index, to_index):
+            return 1
+        position_index = routing.RegisterTransitCallback(position_callback)
+        routing.AddDimension(position_index, 0, len(original_nodes), True, 'Position')
+        position = routing.GetDimensionOrDie('Position')
+        for node_index, node in enumerate(original_nodes):
+            if priorities.get(node, 0) > 0 and node_index != 0:
+                position.SetCumulVarSoftUpperBound(manager.NodeToIndex(node_index), 0,
+                                                   int(PRIORITY_WEIGHT * ratio * priorities[node]))
+    if any(time_windows.get(node) for node in original_nodes):
+        def time_callback(from_index, to_index):
+            from_node = original_nodes[manager.IndexToNode(from_index)]
+            to_node = original_nodes[manager.IndexToNode(to_index)]
+            return int(distance_matrix[from_node].get(to_node, 0) / speed)
+        time_index = routing.RegisterTransitCallback(time_callback)
+        routing.AddDimension(time_index, ROUTE_HORIZON, ROUTE_HORIZON, False, 'Time')
+        time_dimension = routing.GetDimensionOrDie('Time')
+        time_dimension.CumulVar(routing.Start(0)).SetRange(int(start_offset), int(start_offset))
+        for node_index, node in enumerate(original_nodes):
+            window = time_windows.get(node)
+            if not window or node_index == 0:
+                continue
+            earliest, latest = window
+            cumul = time_dimension.CumulVar(manager.NodeToIndex(node_index))
+            if earliest is not None:
+                cumul.SetMin(int(min(max(earliest, start_offset), ROUTE_HORIZON)))
+            if latest is not None:
+                time_dimension.SetCumulVarSoftUpperBound(manager.NodeToIndex(node_index), int(max(latest, 0)),
+                                                         int(LATE_PENALTY * ratio))
+
+def solve_tsp_or_tools(distance_matrix, priorities=None, time_windows=None, start_offset=0, start_node=None, speed=None):
     """Solves the TSP problem using Google OR-Tools."""
     # 获取原始节点标号
     original_nodes = list(distance_matrix.keys())
+    if start_node is not None:
+        original_nodes.remove(start_node)
+        original_nodes.insert(0, start_node)  # 指定起点作为路径首个站点
     num_nodes = len(original_nodes)
     ratio = 1000000#放大系数 ,因为or-tools只支持整数
 
     manager = pywrapcp.RoutingIndexManager(num_nodes, 1, 0)
     routing = pywrapcp.RoutingModel(manager)
-    distance_callback = create_distance_callback(distance_matrix, manager,ratio,original_nodes)
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+    # 弧代价以矩阵形式注册到求解器内部,搜索时不再逐弧回调 Python
+    transit_callback_index = routing.RegisterTransitMatrix(arc_cost_matrix(distance_matrix, ratio, original_nodes))
     routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+    if priorities or time_windows:
+        add_route_constraints(routing, manager, original_nodes, distance_matrix, priorities or {}, time_windows or {},
+                              start_offset, speed or COURIER_SPEED, ratio)
     search_parameters = pywrapcp.DefaultRoutingSearchParameters()
     search_parameters.first_solution_strategy = (
         routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
@@ -171,188 +223,234 @@ def solve_tsp_or_tools(distance_matrix):
         return None, None
     tsp_path=list(map(lambda x:original_nodes[x],tsp_path))
     return tsp_path
-def plot_paths(coordinates, path1, path2):
-    fig, ax = plt.subplots(figsize=(12, 6))
-    plt.subplots_adjust(bottom=0.2)
-
-    # 提取路径1的坐标
-    path1_coords = [coordinates[node] for node in path1]
-    path1_x, path1_y = zip(*path1_coords)
-
-    # 提取路径2的坐标
-    path2_coords = [coordinates[node] for node in path2]
-    path2_x, path2_y = zip(*path2_coords)
-
-    # 绘制路径1
-    line1, = ax.plot(path1_x, path1_y, 'o-', label='Path 1 (NetworkX)', color='blue')
-    start1, = ax.plot(path1_x[0], path1_y[0], 'go', label='Start (Path 1)')
-    end1, = ax.plot(path1_x[-1], path1_y[-1], 'ro', label='End (Path 1)')
-
-    # 绘制路径2
-    line2, = ax.plot(path2_x, path2_y, 's-', label='Path 2 (OR-Tools)', color='red')
-    start2, = ax.plot(path2_x[0], path2_y[0], 'go', label='Start (Path 2)')
-    end2, = ax.plot(path2_x[-1], path2_y[-1], 'ro', label='End (Path 2)')
-
-    # 初始状态下隐藏路径2
-    line2.set_visible(False)
-    start2.set_visible(False)
-    end2.set_visible(False)
-
-    plt.title('Paths Comparison')
-    plt.xlabel('Longitude')
-    plt.ylabel('Latitude')
-    plt.legend()
-    plt.grid(True)
-
-    # 按钮回调函数
-    def show_path1(event):
-        line1.set_visible(True)
-        start1.set_visible(True)
-        end1.set_visible(True)
-        line2.set_visible(False)
-        start2.set_visible(False)
-        end2.set_visible(False)
-        plt.draw()
-
-    def show_path2(event):
-        line1.set_visible(False)
-        start1.set_visible(False)
-        end1.set_visible(False)
-        line2.set_visible(True)
-        start2.set_visible(True)
-        end2.set_visible(True)
-        plt.draw()
-
-    # 创建按钮
-    ax_button1 = plt.axes([0.1, 0.05, 0.35, 0.075])
-    btn1 = Button(ax_button1, 'Show Path 1')
-    btn1.on_clicked(show_path1)
-
-    ax_button2 = plt.axes([0.55, 0.05, 0.35, 0.075])
-    btn2 = Button(ax_button2, 'Show Path 2')
-    btn2.on_clicked(show_path2)
-
-    plt.show()
+
+def priority_tiers(priorities):
+    """按优先级从高到低分层,每层是该优先级的站点下标列表"""
+    tiers = {}
+    for index, priority in enumerate(priorities):
+        tiers.setdefault(priority, []).append(index)
+    return [tiers[priority] for priority in sorted(tiers, reverse=True)]
+
+def order_clusters(coordinates, indices, time_windows, last_point, coordinate_system, timer=None):
+    """对一层站点聚类,并用动态规划确定聚类访问顺序,返回按访问顺序排列的聚类(站点下标列表)"""
+    timer = timer or StageTimer()
+    n_clusters = min(10, len(indices))
+    if n_clusters == 1:
+        return [list(indices)]
+    with timer.stage('clustering'):
+        labels, cluster_centers = hierarchical_clustering(coordinates[indices], n_clusters)
+        clusters = [[index for index, label in zip(indices, labels) if label == cluster_id] for cluster_id in range(n_clusters)]
+    with timer.stage('cluster_dp'):
+        entry = coordinates[last_point] if last_point is not None else None
+        return order_cluster_sequence(clusters, cluster_centers, time_windows, entry, coordinate_system)
+
+def order_cluster_sequence(clusters, cluster_centers, time_windows, entry, coordinate_system):
+    """确定起始聚类,再用动态规划求聚类中心的访问顺序;entry 为上一段终点的坐标"""
+    n_clusters = len(clusters)
+    # 起始聚类: 有时间窗时取截止最早的聚类,否则取离上一段终点最近的聚类(第一段沿用原来的 0 号聚类)
+    deadlines = [min((time_windows[i][1] for i in cluster if time_windows[i] and time_windows[i][1] is not None), default=None)
+                 for cluster in clusters]
+    if any(deadline is not None for deadline in deadlines):
+        first = min(range(n_clusters), key=lambda c: (deadlines[c] is None, deadlines[c] or 0))
+    elif entry is not None:
+        first = int(np.argmin(pairwise_distances([entry], coordinate_system, targets=cluster_centers)[0]))
+    else:
+        first = 0
+    order = [first] + [c for c in range(n_clusters) if c != first]
+    # 计算聚类中心之间的距离矩阵,使用动态规划解决聚类中心的 TSP 问题
+    cluster_distance_matrix = pairwise_distances(cluster_centers[order], coordinate_system)
+    tsp_length_dp, tsp_path_dp = solve_tsp_dynamic_programming(cluster_distance_matrix)
+    return [clusters[order[c]] for c in tsp_path_dp]
+
+# 多级分解
+def partition(points, k, seed=0):
+    """把点集划分为最多 k 组,返回各组在 points 中的下标数组;点数多时用 MiniBatchKMeans 保持线性耗时"""
+    if len(points) > 20000:
+        model = MiniBatchKMeans(n_clusters=k, n_init=1, random_state=seed, batch_size=4096)
+    else:
+        model = KMeans(n_clusters=k, n_init=1, random_state=seed)
+    labels = model.fit_predict(points)
+    groups = [group for group in (np.flatnonzero(labels == c) for c in range(k)) if len(group)]
+    if len(groups) == 1:
+        # 坐标重合无法按位置划分时按顺序切分,保证递归结束
+        groups = np.array_split(np.arange(len(points)), k)
+    return groups
+
+def decompose(coordinates, indices, entry, time_windows, coordinate_system, timer, leaf_size=None, branching=None):
+    """递归划分为聚类的聚类,每一级用 DP 排定子聚类的访问顺序,返回按访问顺序排列的叶子(站点下标数组),
+    每个叶子不超过 leaf_size 个站点;entry 为进入本聚类前所在位置的坐标"""
+    leaf_size, branching = leaf_size or LEAF_SIZE, branching or BRANCHING
+    if len(indices) <= leaf_size:
+        return [indices]
+    k = min(branching, -(-len(indices) // leaf_size))
+    with timer.stage('clustering'):
+        groups = [indices[group] for group in partition(coordinates[indices], k)]
+        centers = np.array([coordinates[group].mean(axis=0) for group in groups])
+    with timer.stage('cluster_dp'):
+        if len(groups) > 1:
+            groups = order_cluster_sequence(groups, centers, time_windows, entry, coordinate_system)
+    leaves = []
+    for group in groups:
+        leaves += decompose(coordinates, group, entry, time_windows, coordinate_system, timer, leaf_size, branching)
+        entry = coordinates[leaves[-1]].mean(axis=0)
+    return leaves
+
+def solve_leaves(leaf_points, coordinate_system, distance_provider=None):
+    """求解一批叶子(可在子进程中执行),返回 [(叶内环路, 环上各边长度, 耗时)]"""
+    distance_provider = distance_provider or get_distance_provider(coordinate_system)
+    results = []
+    for points in leaf_points:
+        start = time.perf_counter()
+        if len(points) == 1:
+            tour, matrix = [0], [[0.0]]
+        else:
+            matrix = distance_provider.matrix(points)
+            tour = solve_tsp_or_tools(submatrix_map(matrix, range(len(points))))
+            if not isinstance(tour, list):
+                tour = list(range(len(points)))  # 求解失败时保持聚类内原顺序
+        edges = [float(matrix[a][b]) for a, b in zip(tour, tour[1:] + tour[:1])]
+        results.append((tour, edges, time.perf_counter() - start))
+    return results
+
+def warm_up_leaf_worker():
+    """在叶子进程中执行: 导入本模块时一并加载 sklearn / OR-Tools"""
+    return os.getpid()
+
+def start_leaf_pool():
+    """服务启动时创建叶子进程池并预先导入依赖;使用 spawn,子进程不继承父进程中 Flask 线程持有的锁"""
+    global leaf_pool
+    if LEAF_WORKERS <= 1:
+        return None
+    with leaf_pool_lock:
+        if leaf_pool is None:
+            leaf_pool = ProcessPoolExecutor(max_workers=LEAF_WORKERS, mp_context=get_context('spawn'))
+            atexit.register(shutdown_leaf_pool)
+            for _ in range(LEAF_WORKERS):
+                leaf_pool.submit(warm_up_leaf_worker)
+    return leaf_pool
+
+def shutdown_leaf_pool():
+    global leaf_pool
+    with leaf_pool_lock:
+        if leaf_pool is not None:
+            leaf_pool.shutdown(wait=False, cancel_futures=True)
+            leaf_pool = None
+
+def get_leaf_pool():
+    return leaf_pool or start_leaf_pool()
+
+def solve_leaves_parallel(leaf_points, coordinate_system, distance_provider=None):
+    """按批分发到进程池;传入了自定义距离提供者(无法传给子进程)或只配置了一个进程时在本进程内求解"""
+    if distance_provider is not None or LEAF_WORKERS <= 1 or len(leaf_points) < 2:
+        return solve_leaves(leaf_points, coordinate_system, distance_provider)
+    batch_size = -(-len(leaf_points) // (LEAF_WORKERS * 4))  # 每个进程约 4 批,兼顾负载均衡与传输开销
+    futures = [get_leaf_pool().submit(solve_leaves, leaf_points[start:start + batch_size], coordinate_system)
+               for start in range(0, len(leaf_points), batch_size)]
+    return [result for future in futures for result in future.result()]
+
+def hierarchical_task_path(coordinates, priorities, time_windows, coordinate_system, distance_provider, timer):
+    """多级分解版本的 GET_task_path: 不构造整体距离矩阵,耗时随站点数近似线性增长。
+    优先级分层与 flat 模式相同;时间窗只用于各级聚类的排序(截止最早的聚类先送),叶内不再按时间窗求解"""
+    leaves = []
+    entry = None
+    for tier in priority_tiers(priorities):
+        leaves += decompose(coordinates, np.array(tier), entry, time_windows, coordinate_system, timer)
+        entry = coordinates[leaves[-1]].mean(axis=0)
+    with timer.stage('solve'):
+        results = solve_leaves_parallel([coordinates[leaf] for leaf in leaves], coordinate_system, distance_provider)
+    for leaf, (_, _, seconds) in zip(leaves, results):
+        timer.cluster(len(leaf), seconds, False)
+
+    with timer.stage('stitching'):
+        distance_provider = distance_provider or get_distance_provider(coordinate_system)
+        total_path, clusters_path, clusters_length = [], [], []
+        for leaf, (tour, edges, _) in zip(leaves, results):
+            if total_path and len(tour) > 1:
+                # 与 flat 模式相同: 把环路旋转到离上一站最近的站点出发
+                nearest = pairwise_distances([coordinates[total_path[-1]]], coordinate_system, targets=coordinates[leaf[tour]])[0]
+                rotate = int(np.argmin(nearest))
+                tour, edges = tour[rotate:] + tour[:rotate], edges[rotate:] + edges[:rotate]
+            path = [int(leaf[node]) for node in tour]
+            clusters_path.append(path)
+            clusters_length.append(float(sum(edges[:-1])))  # 去掉回到起点的那条边
+            total_path += path
+        # 叶子之间的连接只需逐对计算距离
+        boundaries = [len(path) for path in clusters_path]
+        joins = np.cumsum(boundaries)[:-1]
+        total_length = sum(clusters_length) + sum(
+            float(distance_provider.block(coordinates[[total_path[j - 1]]], coordinates[[total_path[j]]])[0][0]) for j in joins)
+    return total_path, total_length, clusters_path, clusters_length
 
 # 主函数
-def GET_task_path(coordinates):
-    # 生成包含 100 个节点的随机经纬度坐标点
-    #n = len(orders)
+def GET_task_path(coordinates, distance_provider=None, coordinate_system=None, order_ids=None,
+                  priorities=None, time_windows=None, speed=None, timer=None, mode=None):
+    """coordinate_system 为 'planar' 或 'latlon'([纬度, 经度]),缺省取部署配置 COORDINATE_SYSTEM;
+    传入 order_ids 时按订单ID复用上次分配计算过的距离。
+    priorities 为各站点优先级(越大越先送),高优先级站点整体排在前面并在聚类内尽量靠前;
+    time_windows 为各站点 (最早, 最晚) 到达时间(距出发的秒数,可为 None),按 speed 换算行驶时间。
+    传入 timer(profiling.StageTimer)时记录各阶段耗时: matrix / clustering / cluster_dp / solve / stitching。
+    mode 缺省取 ROUTING_MODE: 'auto' 在站点数超过 HIERARCHICAL_THRESHOLD 时使用多级分解(hierarchical_task_path)"""
+    timer = timer or StageTimer()
     coordinates = np.array(coordinates)
-    #print(coordinates)
-    # 计算距离矩阵
-    distance_matrix = calculate_distance_matrix_list(coordinates)    
-    # 对每个聚类内部使用 networkx 的 TSP 算法
-    # def get_result_dpnx(tsp_path_dp):
-    #     start_time = time.time()
-    #     total_path_dpnx = []
-    #     for index, cluster in enumerate(tsp_path_dp):
-    #         cluster_points = clusters[cluster]
-    #         cluster_distance_matrix = calculate_distance_matrix_map(cluster_points)
-    #         tsp_path = solve_tsp_networkx(cluster_distance_matrix)
-
-    #         if total_path_dpnx:
-    #             last_point = total_path_dpnx[-1]
-    #             min_distance = float('inf')
-    #             min_index = 0
-    #             for i, point in enumerate(tsp_path):
-    #                 distance = distance_matrix[last_point][point]
-    #                 if distance < min_distance:
-    #                     min_distance = distance
-    #                     min_index = i
-    #             tsp_path = tsp_path[min_index:] + tsp_path[:min_index]
-    #         print(tsp_path)
-    #         total_path_dpnx += tsp_path
-    #     end_time = time.time()
-    #     return total_path_dpnx,end_time-start_time
-    def get_result_dpot(tsp_path_dp):
-        start_time = time.time()
-        total_path_dpot = []
-        clusters_path = []
-        for index, cluster in enumerate(tsp_path_dp):
-            cluster_points = clusters[cluster]
-            print(cluster_points)
-            # 检查聚类中的点数
-            if len(cluster_points) == 0:
-                continue  # 跳过没有点的聚类
-            elif len(cluster_points) == 1:
-                tsp_path = [list(cluster_points.keys())[0]]  # 只有一个点，路径就是该点本身
+    n = len(coordinates)
+    mode = mode or ROUTING_MODE
+    if mode == 'hierarchical' or (mode == 'auto' and n > HIERARCHICAL_THRESHOLD):
+        priorities = [int(priority or 0) for priority in priorities] if priorities is not None else [0] * n
+        time_windows = list(time_windows) if time_windows is not None else [None] * n
+        coordinate_system = distance_provider.coordinate_system if distance_provider else coordinate_system
+        return hierarchical_task_path(coordinates, priorities, time_windows,
+                                      coordinate_system or os.environ.get('COORDINATE_SYSTEM', 'planar'), distance_provider, timer)
+    # 计算距离矩阵(直线距离或路网距离,由部署配置决定)
+    with timer.stage('matrix'):
+        distance_provider = distance_provider or get_distance_provider(coordinate_system)
+        if order_ids is not None:
+            distance_matrix = distance_provider.cached_matrix(order_ids, coordinates)
+        else:
+            distance_matrix = distance_provider.matrix(coordinates)
+    priorities = [int(priority or 0) for priority in priorities] if priorities is not None else [0] * n
+    time_windows = list(time_windows) if time_windows is not None else [None] * n
+    speed = speed or COURIER_SPEED
+
+    total_path_dpot = []
+    clusters_path = []
+    for tier in priority_tiers(priorities):
+        last_point = total_path_dpot[-1] if total_path_dpot else None
+        for cluster in order_clusters(coordinates, tier, time_windows, last_point, distance_provider.coordinate_system, timer):
+            constraints = {index: priorities[index] for index in cluster if priorities[index] > 0}
+            windows = {index: time_windows[index] for index in cluster if time_windows[index]}
+            if len(cluster) == 1:
+                tsp_path = list(cluster)  # 只有一个点，路径就是该点本身
+            elif constraints or windows:
+                # 有优先级/时间窗约束时从离上一站最近的点出发,不再旋转路径,以免打乱约束下的顺序
+                start_node, elapsed = None, 0
+                with timer.stage('stitching'):
+                    if total_path_dpot:
+                        start_node = min(cluster, key=lambda point: distance_matrix[total_path_dpot[-1]][point])
+                        route = total_path_dpot + [start_node]
+                        elapsed = sum(distance_matrix[a][b] for a, b in zip(route, route[1:])) / speed
+                start = time.perf_counter()
+                with timer.stage('solve'):
+                    tsp_path = solve_tsp_or_tools(submatrix_map(distance_matrix, cluster), constraints, windows,
+                                                  elapsed, start_node, speed)
+                timer.cluster(len(cluster), time.perf_counter() - start, True)
             else:
-                cluster_distance_matrix = calculate_distance_matrix_map(cluster_points)
-                tsp_path = solve_tsp_or_tools(cluster_distance_matrix)
-            
-            if total_path_dpot and len(tsp_path) > 1:
-                last_point = total_path_dpot[-1]
-                min_distance = float('inf')
-                min_index = 0
-                for i, point in enumerate(tsp_path):
-                    distance = distance_matrix[last_point][point]
-                    if distance < min_distance:
-                        min_distance = distance
-                        min_index = i
-                tsp_path = tsp_path[min_index:] + tsp_path[:min_index]
-            
+                start = time.perf_counter()
+                with timer.stage('solve'):
+                    tsp_path = solve_tsp_or_tools(submatrix_map(distance_matrix, cluster))
+                timer.cluster(len(cluster), time.perf_counter() - start, False)
+                with timer.stage('stitching'):
+                    if total_path_dpot:
+                        last_point = total_path_dpot[-1]
+                        min_index = min(range(len(tsp_path)), key=lambda i: distance_matrix[last_point][tsp_path[i]])
+                        tsp_path = tsp_path[min_index:] + tsp_path[:min_index]
             clusters_path.append(tsp_path)
             total_path_dpot += tsp_path
-        
-        end_time = time.time()
-        clusters_length = [float(sum(distance_matrix[path[i]][path[i + 1]] for i in range(len(path) - 1))) for path in clusters_path]
-        return total_path_dpot, end_time - start_time, clusters_path, clusters_length
-    
-    
-    n_clusters_list = []
-    kmeans_times = []
-    dpot_times = []
-    dpot_lengths = []
-    
-    n_clusters=min(10,len(coordinates))
-    print(n_clusters)
-    start_time = time.time()
-    labels, cluster_centers = hierarchical_clustering(coordinates, n_clusters)
-    
-    # 获取每个聚类的点集
-    clusters = {}
-    for cluster_id in range(n_clusters):
-        clusters[cluster_id] = {index: coordinates[index] for index in range(len(coordinates)) if labels[index] == cluster_id}
 
-    # 计算聚类中心之间的距离矩阵
-    cluster_distance_matrix = calculate_distance_matrix_list(cluster_centers)
-
-    # 使用动态规划解决聚类中心的 TSP 问题
-    
-    tsp_length_dp, tsp_path_dp = solve_tsp_dynamic_programming(cluster_distance_matrix)
-    end_time = time.time()
-    
-    hierarchical_time=end_time-start_time
-    #print(f"聚类方式: hierarchical")
-    #print(f"聚类数量: {n_clusters}")
-    #print(f"聚类时间与动态规划耗时: {hierarchical_time}")
-    total_path_dpot,dpot_time,clusters_path,clusters_length=get_result_dpot(tsp_path_dp)
-    #total_path_dpnx,dpnx_time=get_result_dpnx(tsp_path_dp)
-    
-    #print(total_path_dpnx)
-    #print(clusters_path)
-    #print(clusters_length)
-
-    #根据total_path来计算total_length
-    #total_length_dpnx=sum(distance_matrix[total_path_dpnx[i]][total_path_dpnx[i + 1]] for i in range(0,n-1))
-    total_length_dpot=sum(distance_matrix[total_path_dpot[i]][total_path_dpot[i + 1]] for i in range(0,len(total_path_dpot)-1))
-    ##print(f"聚类和动态规划+NetworkX 最短路径长度: {total_length_dpnx}")
-    ##print(f"聚类和动态规划+NetworkX 最优路径: {total_path_dpnx}")
-    ##print(f"聚类和动态规划+NetworkX 运行时间: {dpnx_time+kmeans_time:.5f} 秒")
-    
-    #print(f"聚类和动态规划+OR-tools 最短路径长度: {total_length_dpot}")
-    #print(f"聚类和动态规划+OR-tools 最优路径: {total_path_dpot}")
-    #print(f"聚类和动态规划+OR-tools 运行时间: {dpot_time+hierarchical_time:.5f} 秒")
-    
-    n_clusters_list.append(n_clusters)
-    kmeans_times.append(hierarchical_time)
-    #dpnx_times.append(dpnx_time + kmeans_time)
-    dpot_times.append(dpot_time + hierarchical_time)
-    #dpnx_lengths.append(total_length_dpnx)  # 保存NetworkX的最短路径长度
-    dpot_lengths.append(total_length_dpot)   # 保存OR-tools的最短路径长度
-    
-    #plot_paths(coordinates, total_path_dpot, total_path_dpot)
+    with timer.stage('stitching'):
+        clusters_length = [float(sum(distance_matrix[path[i]][path[i + 1]] for i in range(len(path) - 1))) for path in clusters_path]
+        #根据total_path来计算total_length
+        total_length_dpot=sum(distance_matrix[total_path_dpot[i]][total_path_dpot[i + 1]] for i in range(0,len(total_path_dpot)-1))
+    #from plot import plot_paths; plot_paths(coordinates, total_path_dpot, total_path_dpot)
     return total_path_dpot,total_length_dpot,clusters_path,clusters_length
     # # 绘制运行时间的折线
     # plt.subplot(2, 1, 1)
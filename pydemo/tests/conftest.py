@@ -0,0 +1,41 @@
+import os
+import sys
+import atexit
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from archive import Archive
+from stats import PackageStats, DeliveryStats, NotificationSummaries
+from analytics import AnalyticsEngine
+from presence import PresenceTracker
+from singleflight import SingleFlight
+
+# 测试不应在退出时把内存数据写到当前目录
+atexit.unregister(main.save_data)
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """每个测试使用空的集合、索引和统计,归档文件写在临时目录"""
+    monkeypatch.chdir(tmp_path)
+    for name in ('users', 'packages', 'deliveries', 'orders', 'receiver_index', 'order_seq', 'cached_tasks'):
+        monkeypatch.setattr(main, name, {})
+    monkeypatch.setattr(main, 'order_archive', Archive('orders.archive'))
+    monkeypatch.setattr(main, 'delivery_archive', Archive('deliveries.archive'))
+    monkeypatch.setattr(main, 'package_stats', PackageStats())
+    monkeypatch.setattr(main, 'delivery_stats', DeliveryStats())
+    monkeypatch.setattr(main, 'analytics', AnalyticsEngine())
+    monkeypatch.setattr(main, 'notification_summaries', NotificationSummaries())
+    monkeypatch.setattr(main, 'presence', PresenceTracker())
+    monkeypatch.setattr(main, 'route_flight', SingleFlight())
+    main.app.config['TESTING'] = True
+    with main.app.test_client() as client:
+        yield client
+
+def create_order(client, order_id, receiver_name='alice', **fields):
+    body = {'order_id': order_id, 'sender_name': 'bob', 'receiver_name': receiver_name,
+            'sender_address': [0, 0], 'receiver_address': [1, 1], 'package_id': 'p' + order_id, **fields}
+    response = client.post('/order', json=body)
+    assert response.status_code == 201, response.get_json()
+    return body
@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta, timezone
+
+def create_delivered(client, delivery_id):
+    client.post('/delivery/create/', json={'delivery_id': delivery_id, 'package_id': 'p', 'courier_name': 'c1'})
+    client.put(f'/delivery/{delivery_id}', json={'status': 'delivered'})
+
+def test_since_with_utc_offset(client):
+    create_delivered(client, 'd1')
+    hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+    for since in (hour_ago.isoformat(), hour_ago.strftime('%Y-%m-%dT%H:%M:%SZ')):
+        response = client.get('/report/analytics', query_string={'since': since})
+        assert response.status_code == 200
+        assert sum(bucket['delivered'] for bucket in response.get_json()['buckets']) == 1
+    future = (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat()
+    response = client.get('/report/analytics', query_string={'since': future})
+    assert response.status_code == 200 and response.get_json()['buckets'] == []
+
+def test_invalid_parameters(client):
+    assert client.get('/report/analytics?granularity=week').status_code == 400
+    assert client.get('/report/analytics?since=yesterday').status_code == 400
@@ -0,0 +1,46 @@
+import main
+from archive import Archive
+from conftest import create_order
+
+def test_archived_order_is_still_found_by_id(client):
+    create_order(client, 'done')
+    create_order(client, 'open')
+    assert client.put('/order/done', json={'status': 'completed'}).status_code == 200
+
+    body = client.post('/admin/archive?max_age_days=0').get_json()
+    assert body['archived']['orders'] == 1
+    assert 'done' not in main.orders and 'open' in main.orders
+
+    response = client.get('/order/done')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'completed'
+    assert client.get('/order/missing').status_code == 404
+    # 归档的订单也不再出现在收件人分页列表里
+    listed = client.get('/orders/receiver/alice').get_json()['orders']
+    assert [order['order_id'] for order in listed] == ['open']
+
+def test_archived_id_cannot_be_reused(client):
+    create_order(client, 'done')
+    client.put('/order/done', json={'status': 'completed'})
+    client.post('/admin/archive?max_age_days=0')
+    response, status_code = main.Create_Order('done', 'bob', 'alice', [0, 0], [1, 1], 'p')
+    assert status_code == 400
+
+def test_archive_index_survives_reopen(client):
+    archive = Archive('records.archive')
+    archive.append([('a', {'v': 1}), ('b', {'v': 2})])
+    archive.append([('a', {'v': 3})])
+
+    reopened = Archive('records.archive')
+    assert len(reopened) == 2
+    assert reopened.get('a') == {'v': 3}
+    assert 'b' in reopened and 'c' not in reopened
+    assert sorted(record['v'] for record in reopened.values()) == [2, 3]
+
+def test_append_without_fcntl(client, monkeypatch):
+    # Windows 上没有 fcntl,只依赖进程内的锁
+    import archive
+    monkeypatch.setattr(archive, 'fcntl', None)
+    records = Archive('records.archive')
+    records.append([('a', {'v': 1})])
+    assert records.get('a') == {'v': 1}
@@ -0,0 +1,20 @@
+import main
+from bench_load import InProcessTarget, Results
+from conftest import create_order
+
+def test_lock_timeouts_are_counted(client, monkeypatch):
+    create_order(client, 'o1')
+    monkeypatch.setattr(main, 'LOCK_TIMEOUT', 0.01)
+    target, results = InProcessTarget(main.app), Results()
+    lock = main.orders_lock.gen_wlock()
+    assert lock.acquire()
+    try:
+        status_code, body = target.request('GET', '/order/o1')
+    finally:
+        lock.release()
+    assert status_code == 500
+    assert '\\u' in body  # jsonify 转义了中文
+    results.add('GET /order/<id>', 0.01, status_code, body)
+    results.add('GET /order/<id>', 0.01, *target.request('GET', '/order/o1'))
+    report = results.report(1.0)['endpoints']['GET /order/<id>']
+    assert (report['count'], report['errors'], report['lock_timeouts']) == (2, 1, 1)
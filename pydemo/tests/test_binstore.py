@@ -0,0 +1,53 @@
+import os
+from binstore import write_snapshot, open_snapshot
+from checkpoint import Checkpointer
+from readerwriterlock import rwlock
+
+def make_snapshot(path, count=5):
+    write_snapshot(path, [(f'k{i}', {'status': 'placed', 'receiver_name': f'r{i % 2}', 'n': i}) for i in range(count)])
+    return open_snapshot(path)
+
+def test_clean_snapshot_is_not_exported(tmp_path):
+    snapshot = make_snapshot(str(tmp_path / 'orders.snap'))
+    snapshot['k1']  # 只读取、解码后没有修改
+    assert snapshot.export_entries() is None
+
+def test_changes_round_trip(tmp_path):
+    snapshot = make_snapshot(str(tmp_path / 'orders.snap'))
+    snapshot['k1']['status'] = 'received'
+    del snapshot['k2']
+    snapshot['new'] = {'status': 'placed', 'n': 99}
+    entries, token = snapshot.export_entries()
+    write_snapshot(str(tmp_path / 'copy.snap'), entries)
+
+    copy = open_snapshot(str(tmp_path / 'copy.snap'))
+    assert sorted(copy) == ['k0', 'k1', 'k3', 'k4', 'new']
+    assert copy['k1']['status'] == 'received'
+    assert copy['new']['n'] == 99
+    assert sorted(copy.keys_with('status', 'placed')) == ['k0', 'k3', 'k4', 'new']
+
+    # 写出后没有新的修改就不再导出,再次修改后重新导出
+    snapshot.mark_exported(token)
+    assert snapshot.export_entries() is None
+    snapshot['k3']['status'] = 'completed'
+    assert snapshot.export_entries() is not None
+
+def test_checkpointer_skips_unchanged_snapshot(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    snapshot = make_snapshot('orders.snap')
+    lock = rwlock.RWLockFairD()
+    checkpointer = Checkpointer({'orders': (lock, lambda: snapshot)}, fmt='binary')
+    mtime = os.stat('orders.snap').st_mtime_ns
+
+    snapshot['k0']
+    assert checkpointer.snapshot_all()
+    assert os.stat('orders.snap').st_mtime_ns == mtime
+
+    snapshot['k0']['status'] = 'received'
+    assert checkpointer.snapshot_all()
+    assert open_snapshot('orders.snap')['k0']['status'] == 'received'
+    # 旧映射仍然可读,且不再重复写出
+    mtime = os.stat('orders.snap').st_mtime_ns
+    assert snapshot['k4']['n'] == 4
+    assert checkpointer.snapshot_all()
+    assert os.stat('orders.snap').st_mtime_ns == mtime
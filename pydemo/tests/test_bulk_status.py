@@ -0,0 +1,66 @@
+import main
+from conftest import create_order
+
+def create_deliveries(client, count, courier='c1'):
+    for i in range(count):
+        response = client.post('/delivery/create/', json={'delivery_id': f'd{i}', 'package_id': f'p{i}', 'courier_name': courier})
+        assert response.status_code == 201
+
+def test_bulk_delivery_update_reports_each_item(client):
+    create_deliveries(client, 3)
+    response = client.put('/deliveries/status', json=[{'id': 'd0', 'status': 'delivered'},
+                                                      {'id': 'd1', 'status': 'intransit'}])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['updated'], body['failed']) == (2, 0)
+    assert [(result['id'], result['status_code']) for result in body['results']] == [('d0', 200), ('d1', 200)]
+    assert main.deliveries['d0']['status'] == 'delivered'
+    assert main.deliveries['d2']['status'] == 'pending'
+    report = client.get('/report/deliveries').get_json()['report']
+    assert report['by_status'] == {'delivered': 1, 'intransit': 1, 'pending': 1}
+    assert report['delivered_by_courier'] == {'c1': 1}
+
+def test_mixed_valid_and_invalid_ids(client):
+    create_order(client, 'o1')
+    create_order(client, 'o2')
+    body = client.put('/orders/status', json=[{'id': 'o1', 'status': 'received'},
+                                              {'id': 'missing', 'status': 'received'},
+                                              {'status': 'received'},
+                                              'not-an-object',
+                                              {'id': 'o2', 'status': 'completed'}]).get_json()
+    assert (body['updated'], body['failed']) == (2, 3)
+    assert [result['status_code'] for result in body['results']] == [200, 404, 400, 400, 200]
+    assert main.orders['o1']['status'] == 'received'
+    assert main.orders['o2']['status'] == 'completed'
+
+def test_unknown_status_is_rejected_per_item(client):
+    create_deliveries(client, 2)
+    body = client.put('/deliveries/status', json=[{'id': 'd0', 'status': 'completed'},
+                                                  {'id': 'd1', 'status': 'delivered'}]).get_json()
+    assert [result['status_code'] for result in body['results']] == [400, 200]
+    assert main.deliveries['d0']['status'] == 'pending'
+    assert len(main.deliveries['d0']['history']) == 1
+    assert client.get('/report/deliveries').get_json()['report']['by_status'] == {'pending': 1, 'delivered': 1}
+
+def test_unknown_status_on_single_endpoints(client):
+    create_order(client, 'o1')
+    create_deliveries(client, 1)
+    client.post('/package/create', json={'package_id': 'p1', 'sender': 'bob', 'receiver': 'alice'})
+    assert client.put('/order/o1', json={'status': 'shipped'}).status_code == 400
+    assert client.put('/delivery/d0', json={'status': 'completed'}).status_code == 400
+    assert client.put('/package/p1', json={'status': 'lost'}).status_code == 400
+    assert client.get('/report/packages').get_json()['report']['by_status'] == {'uncounted': 1}
+    assert client.put('/delivery/d0', json={'status': 'delivered'}).status_code == 200
+
+def test_bulk_item_cap(client, monkeypatch):
+    monkeypatch.setattr(main, 'BULK_MAX_ITEMS', 3)
+    create_deliveries(client, 4)
+    items = [{'id': f'd{i}', 'status': 'delivered'} for i in range(4)]
+    assert client.put('/deliveries/status', json=items).status_code == 400
+    assert all(delivery['status'] == 'pending' for delivery in main.deliveries.values())
+    assert client.put('/deliveries/status', json=items[:3]).get_json()['updated'] == 3
+
+def test_invalid_bulk_body(client):
+    assert client.put('/deliveries/status', json=[]).status_code == 400
+    assert client.put('/deliveries/status', json={'id': 'd0', 'status': 'delivered'}).status_code == 400
+    assert client.put('/packages/status', data='not json', content_type='application/json').status_code == 400
@@ -0,0 +1,72 @@
+import pytest
+from datetime import date
+import main
+from stats import PackageStats, DeliveryStats, NotificationSummaries
+from analytics import AnalyticsEngine
+from conftest import create_order
+
+REPORTS = ('/report/packages', '/report/deliveries', '/report/analytics?granularity=hour', '/report/analytics?granularity=day')
+
+@pytest.fixture
+def populated(client):
+    for i in range(6):
+        client.post('/package/create', json={'package_id': f'p{i}', 'sender': 'bob', 'receiver': 'alice'})
+        create_order(client, f'o{i}')
+        client.post('/delivery/create/', json={'delivery_id': f'd{i}', 'package_id': f'p{i}', 'courier_name': f'c{i % 2}'})
+    client.put('/packages/status', json=[{'id': 'p0', 'status': 'counted'}, {'id': 'p1', 'status': 'dispatched'}])
+    client.put('/orders/status', json=[{'id': 'o0', 'status': 'received'}, {'id': 'o1', 'status': 'completed'}])
+    client.put('/deliveries/status', json=[{'id': 'd0', 'status': 'intransit'}, {'id': 'd1', 'status': 'delivered'},
+                                           {'id': 'd2', 'status': 'delivered'}])
+    return client
+
+def restart(monkeypatch, fmt):
+    """按 fmt 写快照,换上空的统计对象后重新加载,模拟进程重启"""
+    monkeypatch.setattr(main.checkpointer, 'fmt', fmt)
+    monkeypatch.setattr(main, 'SNAPSHOT_FORMAT', fmt)
+    assert main.checkpointer.snapshot_all()
+    monkeypatch.setattr(main, 'package_stats', PackageStats())
+    monkeypatch.setattr(main, 'delivery_stats', DeliveryStats())
+    monkeypatch.setattr(main, 'analytics', AnalyticsEngine())
+    monkeypatch.setattr(main, 'notification_summaries', NotificationSummaries())
+    main.load_state()
+    main.rebuild_derived_state()
+
+@pytest.mark.parametrize('fmt', ['json', 'binary'])
+def test_reports_survive_restart(populated, monkeypatch, fmt):
+    before = {path: populated.get(path).get_json() for path in REPORTS}
+    restart(monkeypatch, fmt)
+    assert {path: populated.get(path).get_json() for path in REPORTS} == before
+
+@pytest.mark.parametrize('fmt', ['json', 'binary'])
+def test_archived_records_stay_in_reports_after_restart(populated, monkeypatch, fmt):
+    archived = populated.post('/admin/archive?max_age_days=0').get_json()['archived']
+    assert archived == {'orders': 1, 'deliveries': 2}
+    before = {path: populated.get(path).get_json() for path in REPORTS}
+    restart(monkeypatch, fmt)
+    assert {path: populated.get(path).get_json() for path in REPORTS} == before
+
+def test_binary_restart_does_not_decode_records(populated, monkeypatch):
+    restart(monkeypatch, 'binary')
+    assert main.saved_state(main.deliveries, 'delivery_stats') is not None
+    assert main.saved_state(main.orders, 'analytics') is not None
+    assert main.saved_state(main.orders, 'notifications') is not None
+    for collection in (main.users, main.packages, main.deliveries, main.orders):
+        assert collection._overlay == {}
+
+@pytest.mark.parametrize('fmt', ['json', 'binary'])
+def test_notification_summaries_survive_restart(populated, monkeypatch, fmt):
+    today = date.today()
+    def summaries():
+        return (main.notification_summaries.user_summary('alice', today),
+                [main.notification_summaries.courier_pending(courier, today) for courier in ('c0', 'c1')])
+    before = summaries()
+    assert before == ((4, 1, 1), [2, 2])
+    restart(monkeypatch, fmt)
+    assert summaries() == before
+
+def test_counters_follow_updates_after_restart(populated, monkeypatch):
+    restart(monkeypatch, 'binary')
+    populated.put('/delivery/d0', json={'status': 'delivered'})
+    report = populated.get('/report/deliveries').get_json()['report']
+    assert report['by_status']['delivered'] == 3
+    assert report['delivered_by_courier'] == {'c0': 2, 'c1': 1}
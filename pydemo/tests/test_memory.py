@@ -0,0 +1,22 @@
+import main
+import memstats
+from readerwriterlock import rwlock
+
+def test_memory_report_lists_collections(client):
+    client.post('/package/create', json={'package_id': 'p1', 'sender': 'bob', 'receiver': 'alice'})
+    body = client.get('/admin/memory').get_json()['memory']
+    assert body['usage']['packages']['records'] == 1
+    assert body['usage']['packages']['bytes'] > 0
+
+def test_sampler_uses_current_locks(client, monkeypatch):
+    # sqlite 模式下 load_state 会换上新的锁对象,采样时应使用新锁
+    monkeypatch.setattr(memstats, 'LOCK_TIMEOUT', 0.05)
+    monkeypatch.setattr(main, 'orders_lock', rwlock.RWLockFairD())
+    writer = main.orders_lock.gen_wlock()
+    writer.acquire()
+    try:
+        usage = main.memory_monitor.measure()['usage']
+    finally:
+        writer.release()
+    assert 'error' in usage['orders'] and 'error' in usage['order_seq']
+    assert 'error' not in usage['packages']
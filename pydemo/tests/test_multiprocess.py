@@ -0,0 +1,23 @@
+import pytest
+import main
+from shared_store import LeaderLock
+
+@pytest.mark.parametrize('method, path', [('get', '/report/packages'), ('get', '/report/deliveries'),
+                                          ('get', '/report/analytics'), ('post', '/notify/alice'),
+                                          ('get', '/events/alice')])
+def test_per_process_endpoints_are_refused(client, monkeypatch, method, path):
+    monkeypatch.setattr(main, 'STATE_BACKEND', 'sqlite')
+    response = getattr(client, method)(path)
+    assert response.status_code == 503
+    assert response.get_json()['success'] is False
+
+def test_only_one_leader(tmp_path):
+    path = str(tmp_path / 'state.db.leader.lock')
+    first, second = LeaderLock(path), LeaderLock(path)
+    assert first.try_acquire()
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    # leader 退出后其他进程接替
+    first.release()
+    assert second.try_acquire()
+    second.release()
@@ -0,0 +1,40 @@
+import json
+from conftest import create_order
+
+def test_cursor_pages_cover_all_orders_once(client):
+    for i in range(7):
+        create_order(client, f'o{i}')
+    create_order(client, 'other', receiver_name='carol')
+
+    seen, cursor = [], 0
+    while True:
+        response = client.get(f'/orders/receiver/alice?limit=3&cursor={cursor}')
+        assert response.status_code == 200
+        body = response.get_json()
+        assert len(body['orders']) <= 3
+        seen += [order['order_id'] for order in body['orders']]
+        if body['next_cursor'] is None:
+            break
+        cursor = body['next_cursor']
+    assert seen == [f'o{i}' for i in range(7)]
+
+def test_last_page_has_no_cursor(client):
+    create_order(client, 'o1')
+    body = client.get('/orders/receiver/alice?limit=5').get_json()
+    assert [order['order_id'] for order in body['orders']] == ['o1']
+    assert body['next_cursor'] is None
+
+def test_invalid_paging_parameters(client):
+    assert client.get('/orders/receiver/alice?limit=0').status_code == 400
+    assert client.get('/orders/receiver/alice?cursor=abc').status_code == 400
+
+def test_unknown_receiver(client):
+    assert client.get('/orders/receiver/nobody').status_code == 404
+
+def test_stream_returns_every_order_as_ndjson(client):
+    for i in range(5):
+        create_order(client, f'o{i}')
+    response = client.get('/orders/receiver/alice?stream=1&limit=2')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)['order_id'] for line in lines] == [f'o{i}' for i in range(5)]
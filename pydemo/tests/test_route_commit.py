@@ -0,0 +1,29 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import asgi
+import main
+from conftest import create_order
+
+def test_orders_changed_during_solve_are_not_committed(client, monkeypatch):
+    for order_id in ('o1', 'o2', 'o3'):
+        create_order(client, order_id)
+        client.put(f'/order/{order_id}', json={'status': 'received'})
+
+    def solve_route(coordinates, options, profile):
+        # 求解期间(未持有 orders_lock)o2 被取消,o3 被另一次请求分配
+        assert main.update_order_status_logic('o2', 'canceled')[1] == 200
+        main.Create_Delivery('o3', 'o3', 'c2')
+        return ([0, 1, 2], 3.0, [[0, 1, 2]], [3.0]), {'total_ms': 1.0, 'stages_ms': {}}, None
+    monkeypatch.setattr(asgi, 'solve_route', solve_route)
+    pool = ThreadPoolExecutor(1)
+    monkeypatch.setattr(asgi, 'get_process_pool', lambda: pool)
+
+    body, code = asyncio.run(asgi.plan_route('c1', date.today(), False))
+    pool.shutdown()
+    assert code == 201
+    assert body['path'] == ['o1']
+    assert body['skipped'] == ['o2', 'o3']
+    assert main.deliveries['o1']['courier_name'] == 'c1'
+    assert main.deliveries['o3']['courier_name'] == 'c2'
+    assert 'o2' not in main.deliveries
@@ -0,0 +1,96 @@
+import time
+import asyncio
+import threading
+import main
+from singleflight import SingleFlight
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.005)
+
+def run_concurrently(count, target):
+    results = [None] * count
+    def run(i):
+        results[i] = target()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+def test_concurrent_calls_share_one_execution():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return 'route'
+    threads, results = run_concurrently(5, lambda: flight.do('c1', work))
+    wait_until(lambda: flight.coalesced == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result == 'route' for result, _ in results)
+    assert flight.stats()['in_flight'] == 0
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == (1, False)
+    assert flight.do('b', lambda: 2) == (2, False)
+    # 调用结束后同一个键会重新执行
+    assert flight.do('a', lambda: 3) == (3, False)
+    assert flight.stats()['executed'] == 3
+
+def test_exception_reaches_every_waiter():
+    flight, release = SingleFlight(), threading.Event()
+    def fail():
+        release.wait(5)
+        raise ValueError('boom')
+    def call():
+        try:
+            flight.do('c1', fail)
+        except ValueError as e:
+            return str(e)
+    threads, results = run_concurrently(3, call)
+    wait_until(lambda: flight.coalesced == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ['boom'] * 3
+    assert flight.do('c1', lambda: 'ok') == ('ok', False)
+
+def test_async_callers_share_one_execution():
+    flight, calls = SingleFlight(), []
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'route'
+    async def main_coroutine():
+        return await asyncio.gather(*(flight.do_async('c1', work) for _ in range(4)))
+    results = asyncio.run(main_coroutine())
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+
+def test_assign_requests_are_coalesced(client, monkeypatch):
+    requests = 4
+    release, calls = threading.Event(), []
+    def plan_route(username, today, profile=False):
+        calls.append(username)
+        release.wait(5)
+        return {'success': True, 'message': '配送任务分配成功'}, 201
+    monkeypatch.setattr(main, 'plan_route', plan_route)
+
+    def assign():
+        with main.app.test_client() as own_client:
+            response = own_client.post('/delivery/assign/c1')
+            return response.status_code, response.get_json()
+    threads, results = run_concurrently(requests, assign)
+    wait_until(lambda: main.route_flight.coalesced == requests - 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == ['c1']
+    assert all(code == 201 for code, _ in results)
+    assert sorted(body.get('coalesced', False) for _, body in results) == [False] + [True] * (requests - 1)
@@ -0,0 +1,15 @@
+# 多进程部署入口: 状态保存在共享的 SQLite 中,可以启动多个 WSGI worker 进程
+#   STATE_BACKEND=sqlite STATE_DB=state.db gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app
+# 首个启动的进程会把已有的 orders.json 等导入数据库(表为空时)。
+# 报表计数、时间分桶分析、登录通知的计数和 SSE 推送是进程内状态,各 worker 互不一致,
+# 因此 /report/*、/notify/<username> 和 /events/<username> 在此模式下返回 503。
+# 归档和内存采样只在持有 <STATE_DB>.leader.lock 文件锁的一个 worker 中运行,该进程退出后由其他 worker 接替。
+# gunicorn 只支持 POSIX 系统,Windows 上请使用默认的单进程模式。
+import os
+os.environ.setdefault('STATE_BACKEND', 'sqlite')
+
+import main
+from main import app
+
+main.init_state()
+main.start_background_tasks()